@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the peak memory and time of the darwin preprocessing and distance
+functions in float64 and float32.
+
+Usage:
+    python benchmarks/float32_mode.py [--samples N] [--features P]
+"""
+from __future__ import print_function
+
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from darwin.pipeline import impute_nan_mean
+from darwin.distance import bhattacharyya_dist, welch_ttest
+from darwin.threshold import robust_range_threshold
+
+
+def make_data(n_samples, n_feats, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    x = rng.normal(size=(n_samples, n_feats)).astype(dtype)
+    x[rng.uniform(size=x.shape) < 0.001] = np.nan
+    y = rng.randint(0, 2, n_samples)
+    return x, y
+
+
+def run(x, y):
+    n_train = int(len(x) * 0.9)
+    x_train, x_test = impute_nan_mean(x[:n_train].copy(), x[n_train:].copy())
+
+    mean = x_train.mean(axis=0, dtype=np.float64).astype(x.dtype)
+    std = x_train.std(axis=0, dtype=np.float64).astype(x.dtype)
+    std[std == 0] = 1
+    x_train -= mean
+    x_train /= std
+
+    dists = bhattacharyya_dist(x_train, y[:n_train])
+    welch_ttest(x_train, y[:n_train])
+    robust_range_threshold(dists, 95)
+
+
+def measure(n_samples, n_feats, dtype):
+    x, y = make_data(n_samples, n_feats, dtype)
+
+    tracemalloc.start()
+    start = time.time()
+    run(x, y)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--features', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    for dtype in (np.float64, np.float32):
+        elapsed, peak = measure(args.samples, args.features, dtype)
+        print('{:<8} {:8.3f} s   peak {:8.1f} MB'.format(np.dtype(dtype).name,
+                                                         elapsed, peak / 2.**20))
+
+
+if __name__ == '__main__':
+    main()
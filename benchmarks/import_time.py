@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the import time of the darwin modules and check which heavy
+dependencies each of them loads.
+
+Each module is imported in a fresh Python interpreter, the best time of
+a few repetitions is reported.
+
+Usage:
+    python benchmarks/import_time.py [--repeat N] [module ...]
+"""
+from __future__ import print_function
+
+import os.path as op
+import sys
+import json
+import argparse
+import subprocess
+
+REPO_DIR = op.join(op.dirname(op.abspath(__file__)), '..')
+
+MODULES = ['darwin', 'darwin.instance', 'darwin.sklearn_utils',
+           'darwin.results', 'darwin.pipeline', 'darwin.gini',
+           'darwin.features', 'darwin.data_io', 'darwin.plot',
+           'darwin.learner']
+
+#Dependencies that should only be imported on first use
+HEAVY_MODULES = ['matplotlib', 'nibabel', 'sklearn.grid_search',
+                 'sklearn.ensemble', 'sklearn.svm', 'scipy.stats']
+
+TIMER_CODE = '''
+import sys, time, json
+t = time.time()
+import {module}
+elapsed = time.time() - t
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'time': elapsed, 'heavy': heavy}}))
+'''
+
+
+def time_import(module, repeat=3):
+    """Return the best import time in seconds of module in a new interpreter
+    and the list of HEAVY_MODULES it loaded.
+    """
+    code = TIMER_CODE.format(module=module, heavy=HEAVY_MODULES)
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=REPO_DIR)
+        res = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        times.append(res['time'])
+        heavy = res['heavy']
+
+    return min(times), heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        elapsed, heavy = time_import(module, args.repeat)
+        print('{:<24} {:8.3f} s   {}'.format(module, elapsed, ', '.join(heavy)))
+
+
+if __name__ == '__main__':
+    main()
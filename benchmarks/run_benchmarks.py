@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the darwin hot paths on synthetic data.
+
+Each benchmark runs at several n_samples x n_features scales and reports the
+best time of a few repetitions. The results are appended as one JSON line
+per run to benchmarks/results/history.jsonl, with the git commit, so
+regressions can be found comparing with the previous runs.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scales small medium]
+                                        [--bench welch_ttest ...]
+                                        [--repeat 3] [--no-save]
+                                        [--fail-on-regression 1.25]
+"""
+from __future__ import print_function
+
+import os
+import os.path as op
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+import numpy as np
+
+BENCH_DIR = op.dirname(op.abspath(__file__))
+REPO_DIR = op.join(BENCH_DIR, '..')
+HISTORY_FILE = op.join(BENCH_DIR, 'results', 'history.jsonl')
+
+sys.path.insert(0, REPO_DIR)
+
+#name -> (n_samples, n_features)
+SCALES = OrderedDict([('small', (100, 1000)),
+                      ('medium', (500, 20000)),
+                      ('large', (2000, 500000))])
+
+DEFAULT_SCALES = ['small', 'medium']
+
+
+def make_classification_data(n_samples, n_feats, seed=0, dtype=np.float64):
+    rng = np.random.RandomState(seed)
+    y = np.arange(n_samples) % 2
+    x = rng.normal(size=(n_samples, n_feats)).astype(dtype)
+    x[y == 1, :n_feats // 20 + 1] += 0.5
+    return x, y
+
+
+def make_cv_results(n_samples, n_folds=10, seed=0):
+    rng = np.random.RandomState(seed)
+    folds = np.array_split(rng.permutation(n_samples), n_folds)
+    truth = OrderedDict()
+    preds = OrderedDict()
+    probs = OrderedDict()
+    for i, fold in enumerate(folds):
+        truth[i] = fold % 2
+        flips = rng.uniform(size=len(fold)) < 0.2
+        preds[i] = np.where(flips, 1 - truth[i], truth[i])
+        p1 = rng.uniform(size=len(fold))
+        probs[i] = np.column_stack([1 - p1, p1])
+    return truth, preds, probs
+
+
+#Benchmarks: each setup function receives (n_samples, n_features) and a
+#temporary directory and returns the function to be timed.
+#max_features limits the features of the slowest ones.
+
+def bench_distance_computation(n_samples, n_feats, tmpdir):
+    import scipy.stats as stats
+    from darwin.distance import distance_computation
+    x, y = make_classification_data(n_samples, n_feats)
+    return lambda: distance_computation(x, y, stats.pearsonr)
+
+
+def bench_bhattacharyya_dist(n_samples, n_feats, tmpdir):
+    from darwin.distance import bhattacharyya_dist
+    x, y = make_classification_data(n_samples, n_feats)
+    return lambda: bhattacharyya_dist(x, y)
+
+
+def bench_welch_ttest(n_samples, n_feats, tmpdir):
+    from darwin.distance import welch_ttest
+    x, y = make_classification_data(n_samples, n_feats)
+    return lambda: welch_ttest(x, y)
+
+
+def bench_find_thresholds(n_samples, n_feats, tmpdir):
+    from darwin.threshold import find_thresholds
+    vol = np.abs(np.random.RandomState(0).normal(size=n_feats))
+    return lambda: find_thresholds(vol)
+
+
+def bench_get_mcnemar_abcd(n_samples, n_feats, tmpdir):
+    from darwin.mcnemar import get_mcnemar_abcd
+    rng = np.random.RandomState(0)
+    y = rng.randint(0, 2, n_samples)
+    c1 = rng.randint(0, 2, n_samples)
+    c2 = rng.randint(0, 2, n_samples)
+    return lambda: get_mcnemar_abcd(y, c1, c2)
+
+
+def bench_get_cv_classification_metrics(n_samples, n_feats, tmpdir):
+    from darwin.results import get_cv_classification_metrics
+    truth, preds, probs = make_cv_results(n_samples)
+    return lambda: get_cv_classification_metrics(truth, preds, probs)
+
+
+def bench_enlist_loo_results(n_samples, n_feats, tmpdir):
+    from darwin.results import enlist_cv_results_from_dict
+    truth, preds, probs = make_cv_results(n_samples, n_folds=n_samples)
+    return lambda: enlist_cv_results_from_dict(truth, preds, probs)
+
+
+def bench_load_data(n_samples, n_feats, tmpdir):
+    import nibabel as nib
+    from darwin.data_io import load_data
+    from darwin.utils.filenames import create_subjects_file
+
+    side = int(np.ceil(n_feats ** (1 / 3.)))
+    shape = (side, side, side)
+    mask = np.zeros(shape, dtype=np.int8)
+    mask.flat[:n_feats] = 1
+    affine = np.eye(4)
+
+    maskf = op.join(tmpdir, 'mask.nii.gz')
+    nib.save(nib.Nifti1Image(mask, affine), maskf)
+
+    rng = np.random.RandomState(0)
+    subjs = []
+    for s in range(n_samples):
+        subjf = op.join(tmpdir, 'subj_{}.nii.gz'.format(s))
+        nib.save(nib.Nifti1Image(rng.normal(size=shape).astype(np.float32),
+                                 affine), subjf)
+        subjs.append(subjf)
+
+    subjsf = op.join(tmpdir, 'subjects.txt')
+    create_subjects_file(subjs, [s % 2 for s in range(n_samples)], subjsf)
+
+    return lambda: load_data(subjsf, '', maskf)
+
+
+def bench_cross_validation(n_samples, n_feats, tmpdir):
+    from darwin.pipeline import ClassificationPipeline
+    x, y = make_classification_data(n_samples, n_feats)
+
+    def run():
+        pipe = ClassificationPipeline(clfmethod='LinearSVC', n_feats=n_feats,
+                                      cvmethod='5')
+        return pipe.cross_validation(x, y)
+
+    return run
+
+
+#name -> (setup function, max_samples, max_features)
+BENCHMARKS = OrderedDict([
+    ('distance_computation', (bench_distance_computation, None, 20000)),
+    ('bhattacharyya_dist', (bench_bhattacharyya_dist, None, None)),
+    ('welch_ttest', (bench_welch_ttest, None, None)),
+    ('find_thresholds', (bench_find_thresholds, None, 100000)),
+    ('get_mcnemar_abcd', (bench_get_mcnemar_abcd, None, None)),
+    ('get_cv_classification_metrics', (bench_get_cv_classification_metrics, None, None)),
+    ('enlist_loo_results', (bench_enlist_loo_results, None, None)),
+    ('load_data', (bench_load_data, 200, 100000)),
+    ('cross_validation', (bench_cross_validation, 500, 20000)),
+])
+
+
+def run_benchmark(name, scale, repeat=3):
+    """Return a dict with the best time of repeat runs of the benchmark
+    name at the given scale name."""
+    setup, max_samples, max_feats = BENCHMARKS[name]
+    n_samples, n_feats = SCALES[scale]
+    if max_samples is not None:
+        n_samples = min(n_samples, max_samples)
+    if max_feats is not None:
+        n_feats = min(n_feats, max_feats)
+
+    tmpdir = tempfile.mkdtemp(prefix='darwin_bench_')
+    try:
+        func = setup(n_samples, n_feats, tmpdir)
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return OrderedDict([('benchmark', name), ('scale', scale),
+                        ('n_samples', n_samples), ('n_features', n_feats),
+                        ('best', min(times)), ('mean', float(np.mean(times))),
+                        ('repeat', repeat)])
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR)
+        return out.decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def environment():
+    import scipy
+    import sklearn
+    return OrderedDict([('python', platform.python_version()),
+                        ('numpy', np.__version__),
+                        ('scipy', scipy.__version__),
+                        ('sklearn', sklearn.__version__),
+                        ('machine', platform.node()),
+                        ('platform', platform.platform())])
+
+
+def load_history(history_file=HISTORY_FILE):
+    """Return the list of benchmark runs stored in history_file."""
+    if not op.exists(history_file):
+        return []
+    with open(history_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_run(run, history_file=HISTORY_FILE):
+    results_dir = op.dirname(history_file)
+    if not op.exists(results_dir):
+        os.makedirs(results_dir)
+    with open(history_file, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+
+
+def previous_times(history, machine):
+    """Return a dict (benchmark, scale) -> best time of the last run of
+    each benchmark on machine."""
+    times = {}
+    for run in history:
+        if run['environment'].get('machine') != machine:
+            continue
+        for res in run['results']:
+            times[(res['benchmark'], res['scale'])] = res['best']
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scales', nargs='+', default=DEFAULT_SCALES,
+                        choices=list(SCALES.keys()))
+    parser.add_argument('--bench', nargs='+', default=list(BENCHMARKS.keys()),
+                        choices=list(BENCHMARKS.keys()))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--fail-on-regression', type=float, default=None,
+                        metavar='RATIO',
+                        help='Exit with an error if any benchmark is RATIO '
+                             'times slower than its previous run.')
+    args = parser.parse_args(argv)
+
+    env = environment()
+    previous = previous_times(load_history(args.history), env['machine'])
+
+    results = []
+    regressions = []
+    for scale in args.scales:
+        for name in args.bench:
+            try:
+                res = run_benchmark(name, scale, args.repeat)
+            except ImportError as exc:
+                print('{:<32} {:<7} skipped: {}'.format(name, scale, exc))
+                continue
+
+            results.append(res)
+            prev = previous.get((name, scale))
+            ratio = res['best'] / prev if prev else None
+            if ratio is not None and args.fail_on_regression and \
+               ratio > args.fail_on_regression:
+                regressions.append(res)
+
+            print('{:<32} {:<7} {:>6}x{:<7} {:10.4f} s {}'.format(
+                name, scale, res['n_samples'], res['n_features'], res['best'],
+                '' if ratio is None else '({:.2f}x previous)'.format(ratio)))
+
+    run = OrderedDict([('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                       ('commit', git_commit()),
+                       ('environment', env),
+                       ('results', results)])
+    if not args.no_save:
+        save_run(run, args.history)
+
+    if regressions:
+        print('Regressions: {}'.format(', '.join('{}[{}]'.format(r['benchmark'], r['scale'])
+                                                 for r in regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
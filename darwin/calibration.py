@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Probability calibration of the decision values of classifiers without
+probability estimates, e.g., SVC without probability=True, which would run
+an internal 5-fold cross-validation in every fit.
+
+The calibrators are fitted on held-out decision values of the training set
+(Platt's sigmoid or isotonic regression) and applied to the decision values
+of the test set.
+"""
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+CALIBRATION_METHODS = ['sigmoid', 'isotonic']
+
+
+def final_estimator(estimator):
+    """Return the last step of a sklearn Pipeline, or estimator."""
+    if hasattr(estimator, 'steps'):
+        return estimator.steps[-1][1]
+    return estimator
+
+
+def has_native_proba(estimator):
+    """Return True if estimator gives its own probability estimates, i.e.,
+    it has predict_proba and, for SVMs, probability=True."""
+    est = final_estimator(estimator)
+    return hasattr(est, 'predict_proba') and getattr(est, 'probability', True)
+
+
+def _ovo_to_ovr(decision, n_classes):
+    """Turn one-vs-one decision values, pairs (i, j) with i < j and
+    positive values for i as in libsvm, into one score per class."""
+    scores = np.zeros((len(decision), n_classes))
+    k = 0
+    for i in range(n_classes):
+        for j in range(i + 1, n_classes):
+            scores[:, i] += decision[:, k]
+            scores[:, j] -= decision[:, k]
+            k += 1
+    return scores
+
+
+def class_scores(decision, n_classes):
+    """Return the decision values as an n_samples x n_scores array: one
+    column for binary problems, one per class otherwise."""
+    decision = np.asarray(decision, dtype=np.float64)
+    if decision.ndim == 1:
+        decision = decision[:, np.newaxis]
+
+    if n_classes == 2 or decision.shape[1] == n_classes:
+        return decision
+    if decision.shape[1] == n_classes * (n_classes - 1) // 2:
+        return _ovo_to_ovr(decision, n_classes)
+    raise ValueError('Can not map {} decision values to {} '
+                     'classes.'.format(decision.shape[1], n_classes))
+
+
+def _sigmoid(scores, a, b):
+    """Return 1 / (1 + exp(a * scores + b)) without overflows."""
+    return np.exp(-np.logaddexp(0, scores * a + b))
+
+
+def fit_sigmoid(scores, positives, max_iter=100, min_step=1e-10, sigma=1e-12):
+    """Fit Platt's sigmoid P(positive | s) = 1 / (1 + exp(a * s + b)) with
+    the Newton method of Lin, Lin and Weng (2007), with Platt's smoothed
+    targets.
+
+    Returns
+    -------
+    a, b: floats
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    positives = np.asarray(positives, dtype=bool)
+
+    n_pos = positives.sum()
+    n_neg = len(positives) - n_pos
+    hi = (n_pos + 1.) / (n_pos + 2.)
+    lo = 1. / (n_neg + 2.)
+    t = np.where(positives, hi, lo)
+
+    a = 0.
+    b = np.log((n_neg + 1.) / (n_pos + 1.))
+
+    def objective(a, b):
+        f = scores * a + b
+        #negative log-likelihood, log(1 + exp(f)) computed stably
+        return np.sum(np.logaddexp(0, f) - (1 - t) * f)
+
+    fval = objective(a, b)
+    for _ in range(max_iter):
+        p = _sigmoid(scores, a, b)
+        q = 1. - p
+        d2 = p * q
+        h11 = sigma + np.dot(scores * scores, d2)
+        h22 = sigma + d2.sum()
+        h21 = np.dot(scores, d2)
+        d1 = t - p
+        g1 = np.dot(scores, d1)
+        g2 = d1.sum()
+
+        if abs(g1) < 1e-5 and abs(g2) < 1e-5:
+            break
+
+        det = h11 * h22 - h21 * h21
+        da = -(h22 * g1 - h21 * g2) / det
+        db = -(-h21 * g1 + h11 * g2) / det
+        gd = g1 * da + g2 * db
+
+        step = 1.
+        while step >= min_step:
+            new_a, new_b = a + step * da, b + step * db
+            new_f = objective(new_a, new_b)
+            if new_f < fval + 1e-4 * step * gd:
+                a, b, fval = new_a, new_b, new_f
+                break
+            step /= 2.
+        else:
+            log.debug('Sigmoid calibration line search failed.')
+            break
+
+    return a, b
+
+
+class DecisionCalibrator(object):
+    """Maps the decision values of a classifier to class probabilities.
+
+    Parameters
+    ----------
+    method: str
+        'sigmoid' for Platt scaling or 'isotonic'.
+    """
+
+    def __init__(self, method='sigmoid'):
+        if method not in CALIBRATION_METHODS:
+            raise ValueError('Unknown calibration method {}, use one of '
+                             '{}.'.format(method, CALIBRATION_METHODS))
+        self.method = method
+        self.classes_ = None
+        self.calibrators_ = None
+
+    def _fit_one(self, scores, positives):
+        if self.method == 'sigmoid':
+            return fit_sigmoid(scores, positives)
+
+        from sklearn.isotonic import isotonic_regression
+
+        if positives.all() or not positives.any():
+            #a single class in the held-out targets: constant probability
+            return 1., np.zeros(1), np.array([float(positives.any())])
+
+        #isotonic regression is increasing, flip the scores if the positives
+        #have lower decision values
+        sign = 1. if scores[positives].mean() >= scores[~positives].mean() else -1.
+        order = np.argsort(sign * scores)
+        xs = (sign * scores)[order]
+        ys = isotonic_regression(positives[order].astype(np.float64))
+        return sign, xs, ys
+
+    def _predict_one(self, calibrator, scores):
+        if self.method == 'sigmoid':
+            a, b = calibrator
+            return _sigmoid(scores, a, b)
+
+        sign, xs, ys = calibrator
+        #np.interp clips to the fitted range
+        return np.interp(sign * scores, xs, ys)
+
+    def fit(self, decision, targets, classes=None):
+        """Fit the calibrators on held-out decision values.
+
+        Parameters
+        ----------
+        decision: array
+            Output of decision_function on samples not used to fit the
+            classifier.
+
+        targets: array
+            True classes of those samples.
+
+        classes: array, optional
+            classes_ of the classifier. By default, the labels in targets.
+        """
+        targets = np.asarray(targets)
+        self.classes_ = np.unique(targets) if classes is None else np.asarray(classes)
+        scores = class_scores(decision, len(self.classes_))
+
+        if scores.shape[1] == 1:
+            #binary, the probability of classes_[1]
+            self.calibrators_ = [self._fit_one(scores[:, 0],
+                                               targets == self.classes_[1])]
+        else:
+            self.calibrators_ = [self._fit_one(scores[:, c],
+                                               targets == self.classes_[c])
+                                 for c in range(len(self.classes_))]
+        return self
+
+    def predict_proba(self, decision):
+        """Return the calibrated probabilities of each class, shape
+        n_samples x n_classes."""
+        scores = class_scores(decision, len(self.classes_))
+
+        if len(self.calibrators_) == 1:
+            p1 = self._predict_one(self.calibrators_[0], scores[:, 0])
+            return np.column_stack([1. - p1, p1])
+
+        probs = np.column_stack([self._predict_one(cal, scores[:, c])
+                                 for c, cal in enumerate(self.calibrators_)])
+        norm = probs.sum(axis=1)
+        uniform = norm == 0
+        probs[uniform] = 1. / len(self.classes_)
+        norm[uniform] = 1.
+        return probs / norm[:, np.newaxis]
+
+
+def can_calibrate(targets, n_folds):
+    """Return True if targets has at least two classes and n_folds samples
+    of each, so every split of heldout_decision_values has all the
+    classes."""
+    counts = np.bincount(np.unique(targets, return_inverse=True)[1])
+    return len(counts) > 1 and counts.min() >= n_folds
+
+
+def heldout_decision_values(estimator, samples, targets, n_folds=3):
+    """Return the decision values of each sample from clones of estimator
+    fitted on the other folds of a stratified n_folds split.
+
+    Returns
+    -------
+    decision: array
+    classes: classes_ of estimator
+    """
+    from sklearn.base import clone
+    from sklearn.cross_validation import StratifiedKFold
+
+    if not can_calibrate(targets, n_folds):
+        raise ValueError('Every class needs at least {} samples to get held-out '
+                         'decision values.'.format(n_folds))
+
+    classes = final_estimator(estimator).classes_
+    decision = None
+    for train, test in StratifiedKFold(targets, n_folds):
+        est = clone(estimator).fit(samples[train], targets[train])
+        scores = class_scores(est.decision_function(samples[test]),
+                              len(classes))
+        if decision is None:
+            decision = np.zeros((len(targets), scores.shape[1]))
+        decision[test] = scores
+    return decision, classes
+
+
+def fit_calibrator(estimator, samples, targets, method='sigmoid', n_folds=3):
+    """Fit a DecisionCalibrator for estimator on held-out decision values of
+    samples. estimator is only cloned, not refitted."""
+    decision, classes = heldout_decision_values(estimator, samples, targets,
+                                                n_folds)
+    return DecisionCalibrator(method).fit(decision, targets, classes)
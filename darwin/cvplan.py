@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-validation plan of a dataset: the fold splits and the NaN imputation
+and scaling of each fold, computed once and shared by many
+ClassificationPipelines.
+"""
+import logging
+import threading
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+
+log = logging.getLogger(__name__)
+
+
+def _impute(x, means):
+    """Replace in place the NaN values of x by means, if not None."""
+    if means is not None:
+        nans = np.isnan(x)
+        if nans.any():
+            x[nans] = np.take(means, np.where(nans)[1])
+    return x
+
+
+class CVPlan(object):
+    """Splits, imputation means and fitted scalers of the folds of a
+    dataset.
+
+    The preprocessing of each fold is the same as in
+    ClassificationPipeline.cross_validation: the NaN values are replaced by
+    the mean of each feature in the training set, then the data is scaled
+    with a scaler fitted on the training set.
+
+    Parameters
+    ----------
+    samples: array_like
+        Shape: n_samples x n_features
+
+    targets: array_like
+
+    cvmethod: str or int
+        See sklearn_utils.get_cv_method.
+
+    stratified: bool
+        See sklearn_utils.get_cv_method.
+
+    cv: sklearn.cross_validation object, optional
+        If given, used instead of cvmethod.
+
+    scaler: sklearn scaler object, optional
+        It is cloned for each fold. None for no scaling.
+
+    dtype: numpy dtype, optional
+        See ClassificationPipeline.
+
+    cache_blocks: bool
+        If True, keep the preprocessed train and test blocks of each fold,
+        which takes as much memory as n_folds copies of the data.
+        Otherwise keep only the imputation means and fitted scalers and
+        transform the fold data each time it is requested.
+
+    Note
+    ----
+    The arrays returned by fold_data may be shared by several consumers,
+    do not modify them in place.
+    """
+
+    def __init__(self, samples, targets, cvmethod='10', stratified=True,
+                 cv=None, scaler=StandardScaler(), dtype=None,
+                 cache_blocks=True):
+        from .sklearn_utils import get_cv_method
+
+        self.dtype = np.dtype(dtype if dtype is not None else np.float64)
+        self.samples = np.asarray(samples, dtype=self.dtype)
+        self.targets = np.asarray(targets)
+        self.cv = cv if cv is not None else get_cv_method(self.targets,
+                                                          cvmethod, stratified)
+        self.folds = list(self.cv)
+        self.scaler = scaler
+        self.cache_blocks = cache_blocks
+
+        self._transforms = {}
+        self._blocks = {}
+        self._locks = [threading.Lock() for _ in self.folds]
+
+    @property
+    def n_folds(self):
+        return len(self.folds)
+
+    @property
+    def n_fits(self):
+        """Number of folds whose preprocessing has been fitted. Each fold is
+        fitted once, under its own lock."""
+        return len(self._transforms)
+
+    def _split(self, fold):
+        train, test = self.folds[fold]
+        return self.samples[train, :], self.samples[test, :]
+
+    def _transform(self, x, means, scaler):
+        x = _impute(x, means)
+        if scaler is not None:
+            x = scaler.transform(x).astype(self.dtype, copy=False)
+        return x
+
+    def _fit(self, fold):
+        """Fit the imputation and scaler of fold and return its
+        preprocessed blocks."""
+        x_train, x_test = self._split(fold)
+
+        means = None
+        if np.isnan(x_train).any() or np.isnan(x_test).any():
+            means = np.nanmean(x_train, axis=0,
+                               dtype=np.float64).astype(self.dtype)
+            _impute(x_train, means)
+
+        scaler = None
+        if self.scaler is not None:
+            scaler = clone(self.scaler).fit(x_train)
+            x_train = scaler.transform(x_train).astype(self.dtype, copy=False)
+
+        x_test = self._transform(x_test, means, scaler)
+        return (means, scaler), (x_train, x_test)
+
+    def transforms(self, fold):
+        """Return the imputation means, None if there are no NaNs, and the
+        fitted scaler, None if no scaling, of fold."""
+        with self._locks[fold]:
+            if fold not in self._transforms:
+                transforms, blocks = self._fit(fold)
+                self._transforms[fold] = transforms
+                if self.cache_blocks:
+                    self._blocks[fold] = blocks
+        return self._transforms[fold]
+
+    def fold_data(self, fold):
+        """Return the preprocessed data of fold.
+
+        Returns
+        -------
+        x_train, x_test, y_train, y_test
+        """
+        means, scaler = self.transforms(fold)
+
+        if fold in self._blocks:
+            x_train, x_test = self._blocks[fold]
+        else:
+            x_train, x_test = [self._transform(x, means, scaler)
+                               for x in self._split(fold)]
+
+        train, test = self.folds[fold]
+        return x_train, x_test, self.targets[train], self.targets[test]
+
+    def prepare(self, n_jobs=1):
+        """Fit the preprocessing of all the folds now."""
+        if n_jobs == 1:
+            for fold in range(self.n_folds):
+                self.transforms(fold)
+        else:
+            from joblib import Parallel, delayed
+            Parallel(n_jobs=n_jobs, backend='threading')(
+                delayed(self.transforms)(fold) for fold in range(self.n_folds))
+        return self
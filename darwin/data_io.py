@@ -14,11 +14,8 @@ import sys
 import logging
 
 import numpy as np
-import nibabel as nib
-from sklearn.preprocessing import LabelEncoder
-from sklearn.datasets import load_svmlight_file
 
-from .filenames import parse_subjects_list, grep_one
+from .utils.filenames import parse_subjects_list, grep_one
 
 
 log = logging.getLogger(__name__)
@@ -34,6 +31,8 @@ def load_data(subjsf, datadir, maskf, labelsf=None):
     @return:
     x, y, scores, imgsiz, msk, indices
     """
+    import nibabel as nib
+    from sklearn.preprocessing import LabelEncoder
 
     #loading mask
     msk     = nib.load(maskf).get_data()
@@ -15,9 +15,9 @@
 #------------------------------------------------------------------------------
 
 import numpy as np
-import scipy.stats as stats
 
-from .validation import check_X_y
+from .validation import (check_X_y, column_or_1d, check_consistent_length,
+                         _assert_all_finite)
 from .utils.printable import Printable
 
 
@@ -36,7 +36,7 @@ class DistanceMeasure(object):
         self.score_func = score_func
         self.scores_ = None
 
-    def fit(self, samples, targets):
+    def fit(self, samples, targets, block_size=None):
         """
 
         Parameters
@@ -49,18 +49,34 @@ class DistanceMeasure(object):
             The target values (class labels in classification, real numbers in
             regression).
 
+        block_size: int, optional
+            If given, the features are scored in blocks of block_size
+            columns, without copying samples, see score_in_blocks.
+            By default, np.memmap samples are scored in blocks of about
+            64MB and other arrays all at once.
+
         Returns
         -------
         self : object
             Returns self.
         """
-        samples, targets = check_X_y(samples, targets, ['csr', 'csc', 'coo'])
-
         if not callable(self.score_func):
             raise TypeError("The score function should be a callable, %s (%s) "
                             "was passed."
                             % (self.score_func, type(self.score_func)))
 
+        if block_size is None and isinstance(samples, np.memmap):
+            block_size = cols_per_block(samples.shape[0])
+
+        if block_size is not None:
+            targets = column_or_1d(targets, warn=True)
+            self._check_params(samples, targets)
+            self.scores_ = score_in_blocks(samples, targets, self.score_func,
+                                           block_size)
+            return self
+
+        samples, targets = check_X_y(samples, targets, ['csr', 'csc', 'coo'])
+
         self._check_params(samples, targets)
         self.scores_ = np.asarray(self.score_func(samples, targets))
 
@@ -90,7 +106,7 @@ class PearsonCorrelationDistance(DistanceMeasure):
     """
 
     def __init__(self):
-        super(PearsonCorrelationDistance, self).__init__(stats.pearsonr)
+        super(PearsonCorrelationDistance, self).__init__(pearson_correlation)
 
 
 class WelchTestDistance(DistanceMeasure):
@@ -111,8 +127,8 @@ class WelchTestDistance(DistanceMeasure):
     Size: n_features
     """
 
-    def __init__(self, threshold):
-        super(WelchTestDistance, self).__init__(self, welch_ttest)
+    def __init__(self, threshold=None):
+        super(WelchTestDistance, self).__init__(welch_ttest)
 
 
 class BhatacharyyaGaussianDistance(DistanceMeasure):
@@ -135,15 +151,71 @@ class BhatacharyyaGaussianDistance(DistanceMeasure):
     """
 
     def __init__(self):
-        super(BhatacharyyaGaussianDistance, self).__init__(self,
-                                                           bhattacharyya_dist)
+        super(BhatacharyyaGaussianDistance, self).__init__(bhattacharyya_dist)
+
+
+def cols_per_block(n_samples, itemsize=8, block_bytes=2**26):
+    """Return how many columns of n_samples values of itemsize bytes fit in
+    block_bytes, at least 1."""
+    return max(1, int(block_bytes // (max(n_samples, 1) * itemsize)))
+
+
+def score_in_blocks(x, y, score_func, block_size):
+    """
+    Calculates score_func(x, y) for blocks of block_size features of x at a
+    time and returns the concatenated scores.
+
+    Only one block of x is in memory at a time, so x can be a np.memmap
+    larger than the memory. Each block is checked for NaN and infinite
+    values.
+
+    Parameters
+    ----------
+    x: numpy array or memmap
+        Shape: n_samples x n_features
+
+    y: numpy array
+        Size: n_samples
+
+    score_func: function
+        Taking a block of x and y and returning one score per column
+
+    block_size: int
+        Number of features of each block
+
+    Returns
+    -------
+    array_like
+    Size: n_features
+    """
+    check_consistent_length(x, y)
+    _assert_all_finite(y)
+
+    n_feats = x.shape[1]
+    scores = None
+    for start in range(0, n_feats, block_size):
+        block = np.asarray(x[:, start:start + block_size])
+        _assert_all_finite(block)
 
+        block_scores = np.asarray(score_func(block, y))
+        if scores is None:
+            scores = np.empty(n_feats, dtype=block_scores.dtype)
+        scores[start:start + block_size] = block_scores
 
-def pearson_correlation(x, y):
+    if scores is None:
+        scores = np.zeros(0)
+
+    return scores
+
+
+def pearson_correlation(x, y, dtype=None):
     """
     Calculates for each feature in X the
     pearson correlation with y.
 
+    All features are computed at once, in float64. Use score_in_blocks to
+    bound the memory used for large x.
+
     Parameters
     ----------
     x: numpy array
@@ -152,15 +224,68 @@ def pearson_correlation(x, y):
     y: numpy array or list
         Size: n_samples
 
+    dtype: numpy dtype, optional
+        Type of the output. By default, the floating point type of x.
+
     Returns
     -------
     array_like
     Size: n_features
     """
-    return distance_computation(x, y, stats.pearsonr)
+    y = np.asarray(y, dtype=np.float64)
+    yc = y - y.mean()
+
+    xc = np.asarray(x, dtype=np.float64)
+    xc = xc - xc.mean(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.dot(yc, xc) / np.sqrt((xc * xc).sum(axis=0) * np.dot(yc, yc))
+    r[~np.isfinite(r)] = 0
+
+    return np.clip(r, -1, 1).astype(_result_dtype(x, dtype), copy=False)
+
+
+def _result_dtype(x, dtype=None):
+    """Return dtype or, if None, the floating point type of x,
+    float64 for non-float x."""
+    if dtype is not None:
+        return np.dtype(dtype)
+    if np.issubdtype(x.dtype, np.floating):
+        return x.dtype
+    return np.dtype(np.float64)
+
+
+def _class_mean_var(x):
+    """Return the mean and variance of each column of x, accumulated in
+    float64."""
+    mean = np.mean(x, axis=0, dtype=np.float64)
+    var = np.var(x, axis=0, dtype=np.float64)
+    return mean, var
+
+
+def bhattacharyya_from_stats(mi, vi, mj, vj):
+    """Univariate Gaussian Bhattacharyya distance of each feature between
+    two classes with means mi, mj and variances vi, vj."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = 0.25 * (np.square(mi - mj) / (vi + vj)) + \
+            0.5 * (np.log((vi + vj) / (2*np.sqrt(vi*vj))))
+    d[np.isnan(d)] = 0
+    d[np.isinf(d)] = 0
+    return d
+
 
+def welch_from_stats(mi, vi, ni, mj, vj, nj):
+    """Welch's t statistic of each feature between two classes with means
+    mi, mj, variances vi, vj and sizes ni, nj."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (mi - mj) / np.sqrt((np.square(vi) / ni) +
+                                (np.square(vj) / nj))
+    t[np.isnan(t)] = 0
+    t[np.isinf(t)] = 0
+    return t
 
-def distance_computation(x, y, dist_function):
+
+def distance_computation(x, y, dist_function, dtype=None):
     """
     Calculates for each feature in X the
     given dist_function with y.
@@ -176,6 +301,9 @@ def distance_computation(x, y, dist_function):
     dist_function: function
         distance function
 
+    dtype: numpy dtype, optional
+        Type of the output. By default, the floating point type of x.
+
     Returns
     -------
     array_like
@@ -191,7 +319,7 @@ def distance_computation(x, y, dist_function):
     n_feats = x.shape[1]
 
     #creating output volume file
-    p = np.zeros(n_feats)
+    p = np.zeros(n_feats, dtype=_result_dtype(x, dtype))
 
     #calculating dist_function across all subjects
     for i in list(range(x.shape[1])):
@@ -202,11 +330,14 @@ def distance_computation(x, y, dist_function):
     return p
 
 
-def bhattacharyya_dist(x, y):
+def bhattacharyya_dist(x, y, dtype=None):
     """
     Univariate Gaussian Bhattacharyya distance
     between the groups in X, labeled by y.
 
+    The class statistics are accumulated in float64, the result has the
+    floating point type of x unless dtype is given.
+
     Parameters
     ----------
     x: numpy array
@@ -215,14 +346,15 @@ def bhattacharyya_dist(x, y):
     y: numpy array or list
         Size: n_samples
 
-    dist_function: function
-        distance function
+    dtype: numpy dtype, optional
+        Type of the output.
 
     Returns
     -------
     array_like
     Size: n_features
     """
+    y = np.asarray(y)
     classes = np.unique(y)
     n_class = len(classes)
     n_feats = x.shape[1]
@@ -231,32 +363,21 @@ def bhattacharyya_dist(x, y):
     for i in np.arange(n_class):
         for j in np.arange(i + 1, n_class):
             if j > i:
-                xi = x[y == i, :]
-                xj = x[y == j, :]
-
-                mi = np.mean (xi, axis=0)
-                mj = np.mean (xj, axis=0)
-
-                vi = np.var  (xi, axis=0)
-                vj = np.var  (xj, axis=0)
+                mi, vi = _class_mean_var(x[y == classes[i], :])
+                mj, vj = _class_mean_var(x[y == classes[j], :])
 
-                si = np.std  (xi, axis=0)
-                sj = np.std  (xj, axis=0)
+                b = np.maximum(b, bhattacharyya_from_stats(mi, vi, mj, vj))
 
-                d = 0.25 * (np.square(mi - mj) / (vi + vj)) + \
-                    0.5 * (np.log((vi + vj) / (2*si*sj)))
-                d[np.isnan(d)] = 0
-                d[np.isinf(d)] = 0
+    return b.astype(_result_dtype(x, dtype), copy=False)
 
-                b = np.maximum(b, d)
 
-    return b
-
-
-def welch_ttest(x, y):
+def welch_ttest(x, y, dtype=None):
     """
     Welch's t-test between the groups in X, labeled by y.
 
+    The class statistics are accumulated in float64, the result has the
+    floating point type of x unless dtype is given.
+
     Parameters
     ----------
     x: numpy array
@@ -265,14 +386,15 @@ def welch_ttest(x, y):
     y: numpy array or list
         Size: n_samples
 
-    dist_function: function
-        distance function
+    dtype: numpy dtype, optional
+        Type of the output.
 
     Returns
     -------
     array_like
     Size: n_features
     """
+    y = np.asarray(y)
     classes = np.unique(y)
     n_class = len(classes)
     n_feats = x.shape[1]
@@ -281,28 +403,19 @@ def welch_ttest(x, y):
     for i in np.arange(n_class):
         for j in np.arange(i+1, n_class):
             if j > i:
-                xi = x[y == i, :]
-                xj = x[y == j, :]
-                yi = y[y == i]
-                yj = y[y == j]
-
-                mi = np.mean (xi, axis=0)
-                mj = np.mean (xj, axis=0)
-
-                vi = np.var  (xi, axis=0)
-                vj = np.var  (xj, axis=0)
+                in_i = y == classes[i]
+                in_j = y == classes[j]
 
-                n_subjsi = len(yi)
-                n_subjsj = len(yj)
+                mi, vi = _class_mean_var(x[in_i, :])
+                mj, vj = _class_mean_var(x[in_j, :])
 
-                t = (mi - mj) / np.sqrt((np.square(vi) / n_subjsi) +
-                                        (np.square(vj) / n_subjsj))
-                t[np.isnan(t)] = 0
-                t[np.isinf(t)] = 0
+                n_subjsi = np.sum(in_i)
+                n_subjsj = np.sum(in_j)
 
-                b = np.maximum(b, t)
+                b = np.maximum(b, welch_from_stats(mi, vi, n_subjsi,
+                                                   mj, vj, n_subjsj))
 
-    return b
+    return b.astype(_result_dtype(x, dtype), copy=False)
 
 if __name__ == '__main__':
     from sklearn.datasets import make_classification
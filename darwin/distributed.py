@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Task backends to run the cross-validation folds of a ClassificationPipeline
+in worker processes, possibly on other hosts.
+
+FileQueueBackend uses a directory in a shared filesystem as task queue:
+
+    queue_dir/jobs/<job>/        samples.npy, targets.npy and spec.pkl
+    queue_dir/tasks/<job>-<fold>.task
+    queue_dir/claimed/<job>-<fold>.task.<worker>
+    queue_dir/results/<job>-<fold>.result
+
+The coordinator writes the data of the job once and one task file per fold.
+Each worker claims a task renaming it into claimed/, which is atomic, runs
+the fold and writes the result back. While the fold runs, the worker
+touches its claimed file every heartbeat interval, so the coordinator only
+requeues the tasks of dead workers. Start the workers with:
+
+    python -m darwin.distributed QUEUE_DIR [--idle-timeout SECONDS]
+"""
+import os
+import sys
+import time
+import uuid
+import pickle
+import shutil
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import os.path as op
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+TASK_EXT = '.task'
+RESULT_EXT = '.result'
+
+
+def _write_pickle(obj, path):
+    """Pickle obj into path atomically: readers never see a partial file."""
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+
+
+def _read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _task_name(job_id, fold):
+    return '{}-{:05d}{}'.format(job_id, fold, TASK_EXT)
+
+
+class TaskBackend(object):
+    """Base class of the backends that run the folds of a
+    ClassificationPipeline.cross_validation."""
+
+    def run_folds(self, pipeline, samples, targets, folds, profiler):
+        """Run pipeline.fit_fold on each fold.
+
+        Parameters
+        ----------
+        pipeline: pipeline.ClassificationPipeline
+
+        samples: numpy array
+
+        targets: numpy array
+
+        folds: list of (train, test) index arrays
+
+        profiler: profiling.Profiler
+            The stage records of each fold must be added to it.
+
+        Returns
+        -------
+        list of results.FoldResult, sorted by fold
+        """
+        raise NotImplementedError
+
+
+class FileQueueBackend(TaskBackend):
+    """Coordinator of a task queue in a shared directory.
+
+    Parameters
+    ----------
+    queue_dir: str
+        Directory shared with the workers. Created if it does not exist.
+
+    poll_interval: float
+        Seconds between checks of the results directory.
+
+    timeout: float, optional
+        Maximum seconds to wait for all the folds of a job.
+
+    task_timeout: float, optional
+        Seconds after which a claimed task not touched by its worker is put
+        back in the queue, e.g., because the worker died. It must be longer
+        than the heartbeat_interval of the workers.
+    """
+
+    def __init__(self, queue_dir, poll_interval=0.1, timeout=None,
+                 task_timeout=None):
+        self.queue_dir = queue_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.task_timeout = task_timeout
+        make_queue_dirs(queue_dir)
+
+    def submit(self, pipeline, samples, targets, folds):
+        """Write the data and the fold tasks of a job in the queue.
+
+        Returns
+        -------
+        job_id: str
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = op.join(self.queue_dir, 'jobs', job_id)
+        os.makedirs(job_dir)
+
+        np.save(op.join(job_dir, 'samples.npy'), samples)
+        np.save(op.join(job_dir, 'targets.npy'), np.asarray(targets))
+        _write_pickle(pipeline.get_spec(), op.join(job_dir, 'spec.pkl'))
+
+        for fold, (train, test) in enumerate(folds):
+            task = {'job_id': job_id, 'fold': fold,
+                    'train': np.asarray(train), 'test': np.asarray(test)}
+            _write_pickle(task, op.join(self.queue_dir, 'tasks',
+                                        _task_name(job_id, fold)))
+
+        log.debug('Submitted job {} with {} folds.'.format(job_id, len(folds)))
+        return job_id
+
+    def _requeue_stale(self, job_id):
+        claimed_dir = op.join(self.queue_dir, 'claimed')
+        now = time.time()
+        for fname in os.listdir(claimed_dir):
+            if not fname.startswith(job_id):
+                continue
+            path = op.join(claimed_dir, fname)
+            try:
+                if now - op.getmtime(path) > self.task_timeout:
+                    task_name = fname[:fname.index(TASK_EXT) + len(TASK_EXT)]
+                    os.rename(path, op.join(self.queue_dir, 'tasks', task_name))
+                    log.warning('Requeued stale task {}.'.format(task_name))
+            except OSError:
+                #the worker finished or someone else requeued it
+                pass
+
+    def wait(self, job_id, n_folds):
+        """Wait for the results of the n_folds folds of job_id.
+
+        Returns
+        -------
+        dict of fold -> result dict written by the worker
+        """
+        results_dir = op.join(self.queue_dir, 'results')
+        start = time.time()
+        results = {}
+        while len(results) < n_folds:
+            for fold in range(n_folds):
+                if fold in results:
+                    continue
+                path = op.join(results_dir, '{}-{:05d}{}'.format(job_id, fold,
+                                                                 RESULT_EXT))
+                if op.exists(path):
+                    result = _read_pickle(path)
+                    os.remove(path)
+                    if result.get('error') is not None:
+                        raise RuntimeError('Fold {} failed in worker {}:\n'
+                                           '{}'.format(fold, result['worker'],
+                                                       result['error']))
+                    results[fold] = result
+
+            if len(results) == n_folds:
+                break
+
+            if self.timeout is not None and time.time() - start > self.timeout:
+                raise RuntimeError('Timeout waiting for job {}: {} of {} '
+                                   'folds done.'.format(job_id, len(results),
+                                                        n_folds))
+            if self.task_timeout is not None:
+                self._requeue_stale(job_id)
+
+            time.sleep(self.poll_interval)
+
+        return results
+
+    def cleanup(self, job_id):
+        """Remove the data and any pending task or result of job_id."""
+        for subdir in ('tasks', 'claimed', 'results'):
+            dir_path = op.join(self.queue_dir, subdir)
+            for fname in os.listdir(dir_path):
+                if fname.startswith(job_id):
+                    try:
+                        os.remove(op.join(dir_path, fname))
+                    except OSError:
+                        pass
+        shutil.rmtree(op.join(self.queue_dir, 'jobs', job_id),
+                      ignore_errors=True)
+
+    def run_folds(self, pipeline, samples, targets, folds, profiler):
+        job_id = self.submit(pipeline, samples, targets, folds)
+        try:
+            results = self.wait(job_id, len(folds))
+        finally:
+            self.cleanup(job_id)
+
+        fold_results = []
+        for fold in range(len(folds)):
+            result = results[fold]
+            profiler.add_fold(fold, result['records'], result['seconds'])
+            fold_results.append(result['fold_result'])
+        return fold_results
+
+
+def make_queue_dirs(queue_dir):
+    for subdir in ('jobs', 'tasks', 'claimed', 'results'):
+        dir_path = op.join(queue_dir, subdir)
+        if not op.exists(dir_path):
+            try:
+                os.makedirs(dir_path)
+            except OSError:
+                #created by another process meanwhile
+                if not op.isdir(dir_path):
+                    raise
+
+
+class FileQueueWorker(object):
+    """Worker that runs the fold tasks of a FileQueueBackend queue.
+
+    Parameters
+    ----------
+    queue_dir: str
+
+    worker_id: str, optional
+        By default, hostname-pid.
+
+    poll_interval: float
+        Seconds to wait when the queue is empty.
+
+    heartbeat_interval: float
+        Seconds between touches of the claimed task file while its fold
+        runs.
+    """
+
+    def __init__(self, queue_dir, worker_id=None, poll_interval=0.2,
+                 heartbeat_interval=10.):
+        self.queue_dir = queue_dir
+        self.worker_id = worker_id or '{}-{}'.format(socket.gethostname(),
+                                                     os.getpid())
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._job = None
+        make_queue_dirs(queue_dir)
+
+    def claim(self):
+        """Claim the next task in the queue.
+
+        Returns
+        -------
+        path of the claimed task file, or None if the queue is empty.
+        """
+        tasks_dir = op.join(self.queue_dir, 'tasks')
+        for fname in sorted(os.listdir(tasks_dir)):
+            if not fname.endswith(TASK_EXT):
+                continue
+            claimed = op.join(self.queue_dir, 'claimed',
+                              '{}.{}'.format(fname, self.worker_id))
+            try:
+                os.rename(op.join(tasks_dir, fname), claimed)
+            except OSError:
+                #another worker claimed it first
+                continue
+            #the claim time is used to find stale tasks
+            os.utime(claimed, None)
+            return claimed
+        return None
+
+    def _load_job(self, job_id):
+        """Return the pipeline, samples and targets of job_id. The data of
+        the last job is kept, the samples are memory-mapped."""
+        from .pipeline import ClassificationPipeline
+
+        if self._job is None or self._job[0] != job_id:
+            job_dir = op.join(self.queue_dir, 'jobs', job_id)
+            spec = _read_pickle(op.join(job_dir, 'spec.pkl'))
+            samples = np.load(op.join(job_dir, 'samples.npy'), mmap_mode='r')
+            targets = np.load(op.join(job_dir, 'targets.npy'))
+            self._job = (job_id, ClassificationPipeline(**spec), samples,
+                         targets)
+        return self._job[1:]
+
+    def _heartbeat(self, claimed, done):
+        """Touch claimed every heartbeat_interval seconds until done is set
+        or the file is gone, e.g., requeued."""
+        while not done.wait(self.heartbeat_interval):
+            try:
+                os.utime(claimed, None)
+            except OSError:
+                break
+
+    def run_task(self, claimed):
+        """Run the claimed task and write its result. Nothing is written if
+        the job has been removed meanwhile, e.g., its coordinator already
+        got the result from another worker."""
+        from .profiling import Profiler
+
+        task = _read_pickle(claimed)
+        job_id, fold = task['job_id'], task['fold']
+        log.debug('Worker {} running fold {} of job {}.'.format(self.worker_id,
+                                                                fold, job_id))
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     args=(claimed, done))
+        heartbeat.daemon = True
+        heartbeat.start()
+
+        result = {'worker': self.worker_id, 'error': None}
+        try:
+            pipeline, samples, targets = self._load_job(job_id)
+            profiler = Profiler(measure_memory=pipeline.measure_memory)
+            fold_result = pipeline.fit_fold(samples, targets, task['train'],
+                                            task['test'], fold, profiler)
+            result.update(fold_result=fold_result,
+                          records=profiler.profile.records,
+                          seconds=profiler.profile.fold_seconds[fold])
+        except Exception:
+            log.exception('Error running fold {} of job {}.'.format(fold, job_id))
+            result['error'] = traceback.format_exc()
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if op.isdir(op.join(self.queue_dir, 'jobs', job_id)):
+            _write_pickle(result, op.join(self.queue_dir, 'results',
+                                          '{}-{:05d}{}'.format(job_id, fold,
+                                                               RESULT_EXT)))
+        else:
+            log.warning('Job {} was removed, dropping the result of fold '
+                        '{}.'.format(job_id, fold))
+        try:
+            os.remove(claimed)
+        except OSError:
+            pass
+
+    def run(self, max_tasks=None, idle_timeout=None):
+        """Run tasks until max_tasks are done or the queue has been empty
+        for idle_timeout seconds. Both None means forever.
+
+        Returns
+        -------
+        n_tasks: int
+            Number of tasks run.
+        """
+        n_tasks = 0
+        idle_since = time.time()
+        while max_tasks is None or n_tasks < max_tasks:
+            claimed = self.claim()
+            if claimed is None:
+                if idle_timeout is not None and \
+                   time.time() - idle_since > idle_timeout:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            self.run_task(claimed)
+            n_tasks += 1
+            idle_since = time.time()
+
+        return n_tasks
+
+
+def run_worker(queue_dir, worker_id=None, poll_interval=0.2, max_tasks=None,
+               idle_timeout=None, heartbeat_interval=10.):
+    """Run a FileQueueWorker on queue_dir. See FileQueueWorker.run."""
+    worker = FileQueueWorker(queue_dir, worker_id, poll_interval,
+                             heartbeat_interval)
+    return worker.run(max_tasks, idle_timeout)
+
+
+def start_local_workers(queue_dir, n_workers, idle_timeout=None,
+                        poll_interval=0.2):
+    """Start n_workers worker processes on this host.
+
+    Returns
+    -------
+    list of multiprocessing.Process
+        Terminate them when done, or give an idle_timeout.
+    """
+    import multiprocessing
+
+    make_queue_dirs(queue_dir)
+    workers = []
+    for i in range(n_workers):
+        proc = multiprocessing.Process(target=run_worker,
+                                       args=(queue_dir,),
+                                       kwargs={'poll_interval': poll_interval,
+                                               'idle_timeout': idle_timeout})
+        proc.daemon = True
+        proc.start()
+        workers.append(proc)
+    return workers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a darwin '
+                                                 'cross-validation worker.')
+    parser.add_argument('queue_dir', help='Shared task queue directory.')
+    parser.add_argument('--worker-id', default=None)
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    parser.add_argument('--max-tasks', type=int, default=None)
+    parser.add_argument('--idle-timeout', type=float, default=None)
+    parser.add_argument('--heartbeat-interval', type=float, default=10.)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    n_tasks = run_worker(args.queue_dir, args.worker_id, args.poll_interval,
+                         args.max_tasks, args.idle_timeout,
+                         args.heartbeat_interval)
+    log.info('Worker done after {} tasks.'.format(n_tasks))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
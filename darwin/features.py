@@ -15,14 +15,13 @@
 
 import os
 import numpy as np
-import scipy.stats as stats
 import logging
 
 from sklearn.feature_selection.base import SelectorMixin
 from sklearn.feature_selection.univariate_selection import (_BaseFilter,
                                                             _clean_nans)
 
-from .distance import (welch_ttest, bhattacharyya_dist,
+from .distance import (welch_ttest, bhattacharyya_dist, pearson_correlation,
                        DistanceMeasure,
                        PearsonCorrelationDistance,
                        BhatacharyyaGaussianDistance,
@@ -31,7 +30,7 @@ from .distance import (welch_ttest, bhattacharyya_dist,
 from .threshold import (Threshold, RobustThreshold, RankThreshold,
                         PercentileThreshold)
 from .utils.printable import Printable
-from .storage import save_variables_to_shelve
+from .storage import save_feature_set
 
 
 log = logging.getLogger(__name__)
@@ -103,7 +102,7 @@ class PearsonCorrelationSelection(DistanceBasedSelection):
     groups in X, labeled by y.
     """
     def __init__(self, threshold):
-        super(PearsonCorrelationSelection, self).__init__(stats.pearsonr,
+        super(PearsonCorrelationSelection, self).__init__(pearson_correlation,
                                                           threshold)
 
 
@@ -126,7 +125,7 @@ class BhatacharyyaGaussianSelection(DistanceBasedSelection):
 
 
 def feature_selection(samples, targets, method, thr=95, dist_function=None,
-                      thr_method='robust'):
+                      thr_method='robust', block_size=None):
     """
     Parameters
     ----------
@@ -149,6 +148,10 @@ def feature_selection(samples, targets, method, thr=95, dist_function=None,
     thr_method: str
         method for thresholding: None, 'robust', 'ranking', 'percentile'
 
+    block_size: int, optional
+        Number of features scored at a time, see DistanceMeasure.fit.
+        Use it, or a np.memmap as samples, for datasets larger than memory.
+
     Returns
     -------
     m:
@@ -180,7 +183,7 @@ def feature_selection(samples, targets, method, thr=95, dist_function=None,
         else:
             raise ValueError('Not valid argument input values.')
 
-    dists = distance.fit(samples, targets)
+    dists = distance.fit(samples, targets, block_size=block_size).scores_
 
     #if all distance values are 0
     if not dists.any():
@@ -203,74 +206,281 @@ def feature_selection(samples, targets, method, thr=95, dist_function=None,
     return dists
 
 
-def calculate_stats(data):
+STATS_NAMES = ['max', 'min', 'mean', 'var', 'median', 'kurtosis', 'skew']
+
+
+def _chunk_slices(n_rows, chunk_rows):
+    """Return a list of slices that split n_rows in blocks of chunk_rows."""
+    return [slice(start, min(start + chunk_rows, n_rows))
+            for start in range(0, n_rows, chunk_rows)]
+
+
+def _rows_per_chunk(n_feats, itemsize=8, chunk_bytes=2**26):
+    """Return how many rows of n_feats values of itemsize bytes fit in
+    chunk_bytes, at least 1."""
+    return max(1, int(chunk_bytes // (max(n_feats, 1) * itemsize)))
+
+
+def _calculate_chunk_stats(chunk):
+    """Return the STATS_NAMES statistics of each row of chunk.
+
+    The chunk is read once into a float64 block; the moments are computed
+    from the centered block and the median by selection.
     """
+    chunk = np.array(chunk, dtype=np.float64)
+    n_feats = chunk.shape[1]
+
+    feats = np.empty((chunk.shape[0], 7))
+    feats[:, 0] = chunk.max(axis=1)
+    feats[:, 1] = chunk.min(axis=1)
+
+    mean = chunk.sum(axis=1) / n_feats
+    feats[:, 2] = mean
+
+    #median by selection, as np.median but without sorting every row
+    half = n_feats // 2
+    kth = [half - 1, half] if n_feats % 2 == 0 else [half]
+
+    #centered moments, reusing the same temporaries
+    chunk -= mean[:, np.newaxis]
+    power = chunk * chunk
+    m2 = power.sum(axis=1) / n_feats
+    power *= chunk
+    m3 = power.sum(axis=1) / n_feats
+    power *= chunk
+    m4 = power.sum(axis=1) / n_feats
+    del power
+
+    chunk.partition(kth, axis=1)
+    feats[:, 4] = chunk[:, kth].mean(axis=1) + mean
+
+    feats[:, 3] = m2
+
+    #same values as scipy.stats kurtosis and skew with bias=True for
+    #constant rows
+    zero = m2 <= (np.finfo(np.float64).resolution * mean) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        feats[:, 5] = np.where(zero, 0, m4 / m2 ** 2) - 3
+        feats[:, 6] = np.where(zero, 0, m3 / m2 ** 1.5)
 
-    @param data: numpy array
+    return feats
+
+
+def calculate_stats(data, n_jobs=1, chunk_rows=None):
+    """Return the maximum, minimum, mean, variance, median, kurtosis and
+    skewness of each sample in data (see STATS_NAMES).
+
+    The samples are processed in blocks of rows, each block is read only once,
+    so data can be a np.memmap larger than memory. The blocks are processed
+    in parallel threads.
+
+    @param data: numpy array or memmap
     Shape: n_samples x n_features
 
-    @return:
+    @param n_jobs: int
+    Number of threads
+
+    @param chunk_rows: int
+    Number of samples in each block. By default, blocks of about 64MB.
+
+    @return: numpy array
+    Shape: n_samples x 7
     """
-    n_subjs = data.shape[0]
+    n_subjs, n_feats = data.shape
 
-    feats = np.zeros((n_subjs, 7))
+    if chunk_rows is None:
+        chunk_rows = _rows_per_chunk(n_feats)
 
-    feats[:, 0] = data.max(axis=1)
-    feats[:, 1] = data.min(axis=1)
-    feats[:, 2] = data.mean(axis=1)
-    feats[:, 3] = data.var(axis=1)
-    feats[:, 4] = np.median(data, axis=1)
-    feats[:, 5] = stats.kurtosis(data, axis=1)
-    feats[:, 6] = stats.skew(data, axis=1)
+    slices = _chunk_slices(n_subjs, chunk_rows)
 
-    return feats
+    if n_jobs == 1 or len(slices) == 1:
+        feats = [_calculate_chunk_stats(data[sl]) for sl in slices]
+    else:
+        from joblib import Parallel, delayed
+        feats = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(_calculate_chunk_stats)(data[sl]) for sl in slices)
+
+    if not feats:
+        return np.zeros((0, 7))
+
+    return np.concatenate(feats, axis=0)
+
+
+def _hist3d_bin_indices(chunk, bins, value_range=None):
+    """Return the flat 3D histogram bin index of each point in chunk.
+
+    Parameters
+    ----------
+    chunk: numpy array
+    Shape: n_samples x n_points x 3
 
+    bins: int
 
-def calculate_hist3d(data, bins):
+    value_range: sequence of 3 (min, max) pairs, optional
+    If None, the range of each sample and dimension is used, as
+    np.histogramdd does. Points outside value_range get index -1.
+
+    Returns
+    -------
+    numpy array
+    Shape: n_samples x n_points, with values in [0, bins**3) or -1
     """
+    if value_range is None:
+        lo = chunk.min(axis=1).astype(np.float64)
+        hi = chunk.max(axis=1).astype(np.float64)
+        #same as np.histogramdd for empty ranges
+        empty = lo == hi
+        lo[empty] -= 0.5
+        hi[empty] += 0.5
+        lo = lo[:, np.newaxis, :]
+        hi = hi[:, np.newaxis, :]
+    else:
+        value_range = np.array(value_range, dtype=np.float64)
+        lo = value_range[:, 0]
+        hi = value_range[:, 1]
+        empty = lo == hi
+        lo[empty] -= 0.5
+        hi[empty] += 0.5
 
-    @param data: numpy array
-    Shape: n_samples x n_features
+    scaled = (chunk - lo) * (bins / (hi - lo))
+
+    #the right edge belongs to the last bin
+    idx = np.clip(scaled.astype(np.intp), 0, bins - 1)
+    flat = (idx[..., 0] * bins + idx[..., 1]) * bins + idx[..., 2]
+
+    if value_range is not None:
+        outside = ((chunk < lo) | (chunk > hi)).any(axis=2)
+        flat[outside] = -1
+
+    return flat
 
-    @param bins:
-    @return:
+
+def _calculate_chunk_hist3d(chunk, bins, value_range=None, sparse=False):
+    """Return the 3D histograms of the samples in chunk (see calculate_hist3d)
+    accumulated with only one bincount.
     """
-    n_subjs = data.shape[0]
+    n_subjs = chunk.shape[0]
+    n_bins = bins ** 3
+    chunk = np.asarray(chunk).reshape(n_subjs, -1, 3)
 
-    feats = np.zeros((n_subjs, bins*bins*bins))
+    flat = _hist3d_bin_indices(chunk, bins, value_range)
+    rows = np.repeat(np.arange(n_subjs), flat.shape[1])
+    flat = flat.ravel()
+    inside = flat >= 0
+    rows, flat = rows[inside], flat[inside]
 
-    for s in np.arange(n_subjs):
-        h, edges = np.histogramdd(data[s, ], bins=(bins, bins, bins))
-        feats[s, :] = h.flatten()
+    if sparse:
+        import scipy.sparse as sp
+        counts = np.ones(len(flat))
+        return sp.coo_matrix((counts, (rows, flat)),
+                             shape=(n_subjs, n_bins)).tocsr()
 
-    return feats
+    counts = np.bincount(rows * n_bins + flat, minlength=n_subjs * n_bins)
+    return counts.reshape(n_subjs, n_bins).astype(np.float64)
+
+
+def calculate_hist3d(data, bins, value_range=None, sparse=False, n_jobs=1,
+                     chunk_rows=None):
+    """Return the flattened 3D histogram of each sample in data.
+
+    The features of each sample are taken as points of 3 coordinates,
+    i.e., reshaped to n_points x 3. The histograms of a block of samples are
+    accumulated at once, and the blocks can be processed in parallel threads.
+
+    @param data: numpy array or memmap
+    Shape: n_samples x n_features, n_features multiple of 3
+
+    @param bins: int
+    Number of bins in each dimension
+
+    @param value_range: sequence of 3 (min, max) pairs
+    Range of the histogram in each dimension. If None, the range of each
+    sample is used, as np.histogramdd does.
+
+    @param sparse: bool
+    If True, return a scipy.sparse.csr_matrix. Use this for high values
+    of bins.
+
+    @param n_jobs: int
+    Number of threads
+
+    @param chunk_rows: int
+    Number of samples in each block. By default, blocks of about 64MB.
+
+    @return: numpy array or scipy.sparse.csr_matrix
+    Shape: n_samples x bins**3
+    """
+    n_subjs, n_feats = data.shape
+
+    if n_feats % 3:
+        raise ValueError('The number of features should be a multiple of 3, '
+                         'got {}.'.format(n_feats))
+
+    if chunk_rows is None:
+        chunk_rows = _rows_per_chunk(n_feats, itemsize=24)
+
+    slices = _chunk_slices(n_subjs, chunk_rows)
 
+    if n_jobs == 1 or len(slices) == 1:
+        feats = [_calculate_chunk_hist3d(data[sl], bins, value_range, sparse)
+                 for sl in slices]
+    else:
+        from joblib import Parallel, delayed
+        feats = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(_calculate_chunk_hist3d)(data[sl], bins, value_range,
+                                             sparse) for sl in slices)
+
+    if sparse:
+        import scipy.sparse as sp
+        if not feats:
+            return sp.csr_matrix((0, bins ** 3))
+        return sp.vstack(feats, format='csr')
+
+    if not feats:
+        return np.zeros((0, bins ** 3))
+
+    return np.concatenate(feats, axis=0)
 
-def create_feature_sets(fsmethod, samples, mask, targets, outdir, outbasename):
-    """Calculates and saves a feature set in a pyshelf shelve file.
+
+def create_feature_sets(fsmethod, samples, mask, targets, outdir, outbasename,
+                        bins=10, chunks=(1024, 4096), compression=None):
+    """Calculates and saves a feature set in a feature set store,
+    see storage.save_feature_set.
 
     Parameters
     ----------
-    fsmethod:
-
-    fsgrid:
+    fsmethod: str
+        'stats', 'hist3d' or 'none'
 
-    data: array_like
+    samples: array_like
         Shape: n_samples x n_features
 
-    msk: array_like
+    mask: array_like
 
     targets:
 
     outdir:
 
     outbasename:
-    """
-    np.savetxt(os.path.join(outdir, outbasename + '_labels.txt'), targets,
-               fmt="%.2f")
+        The feature set is saved in the folder outdir/outbasename, with
+        the targets as its 'labels' variable.
+
+    bins: int
+        Number of bins in each dimension for 'hist3d'
 
-    outfname = os.path.join(outdir, outbasename)
-    log.info('Creating ' + outfname)
+    chunks: tuple of 2 ints
+        Samples and features of each stored block.
+
+    compression: str, optional
+        See storage.save_feature_set
+
+    Returns
+    -------
+    outpath: str
+        Path to the feature set folder.
+    """
+    outpath = os.path.join(outdir, outbasename)
+    log.info('Creating ' + outpath)
 
     fs = samples[:, mask > 0]
 
@@ -278,10 +488,16 @@ def create_feature_sets(fsmethod, samples, mask, targets, outdir, outbasename):
         feats = calculate_stats(fs)
 
     elif fsmethod == 'hist3d':
-        feats = calculate_hist3d(fs)
+        feats = calculate_hist3d(fs, bins)
 
     elif fsmethod == 'none':
         feats = fs
 
+    else:
+        raise ValueError('Unknown feature set method {}.'.format(fsmethod))
+
     #save file
-    save_variables_to_shelve(outfname + otype, {'feats': feats})
+    save_feature_set(outpath, feats, {'labels': np.asarray(targets)},
+                     chunks=chunks, compression=compression)
+
+    return outpath
@@ -1,27 +1,69 @@
 # -*- coding: utf-8 -*-
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.stats as stats
-from sklearn.ensemble import ExtraTreesClassifier
-from sklearn.cross_validation import LeaveOneOut
+from sklearn.utils import check_random_state
 
-from .pipeline import ClassificationPipeline
+#private helpers of the forest bootstrap, if this sklearn has them
+try:
+    from sklearn.ensemble._forest import (_generate_unsampled_indices,
+                                          _get_n_samples_bootstrap)
+except ImportError:
+    _get_n_samples_bootstrap = None
+    try:
+        from sklearn.ensemble.forest import _generate_unsampled_indices
+    except ImportError:
+        _generate_unsampled_indices = None
 
 
 class FeaturesGiniIndex(object):
     """This class wraps a classification method to estimate discrimination
      Gini indices from a set of features using an sklearn.ExtraTreesClassifier
+
+    Parameters
+    ----------
+    mode: str
+        'loo' to average the feature importances of a LeaveOneOut
+        ClassificationPipeline with grid search.
+        'oob' to fit only one bootstrap ensemble and estimate the
+        importances and their stability from the out-of-bag samples.
+
+    n_estimators: int
+        Number of trees of the ensemble in 'oob' mode.
+
+    permutation: bool
+        If True, also compute out-of-bag permutation importances in 'oob'
+        mode. This needs one prediction per tree and feature.
+
+    random_state: int or np.random.RandomState, optional
+        Seed for the 'oob' mode ensemble and permutations.
     """
 
+    def __init__(self, mode='loo', n_estimators=500, permutation=False,
+                 random_state=None):
+        self.mode = mode
+        self.n_estimators = n_estimators
+        self.permutation = permutation
+        self.random_state = random_state
+
     def fit_transform(self, samples, targets, n_cpus=1):
-        """Return the average Gini-index for each sample in a LeaveOneOut
+        """Return the average Gini-index for each feature.
+
+        In 'loo' mode the average is taken over the folds of a LeaveOneOut
         classification Cross-validation test using ExtraTreesClassifier.
+        In 'oob' mode it is taken over the trees of one bootstrap
+        ExtraTreesClassifier, see fit_transform_oob.
 
         Returns
         -------
         array_like
         Vector of the size of number of features in each sample.
         """
+        if self.mode == 'oob':
+            return self.fit_transform_oob(samples, targets, n_cpus=n_cpus)
+        elif self.mode != 'loo':
+            raise ValueError('Unknown mode {}, expected "loo" or '
+                             '"oob".'.format(self.mode))
+
+        from .pipeline import ClassificationPipeline
 
         n_feats = samples.shape[1]
 
@@ -34,6 +76,137 @@ class FeaturesGiniIndex(object):
 
         return ginis.mean(axis=0)
 
+    def fit_transform_oob(self, samples, targets, n_cpus=1):
+        """Return the Gini-index for each feature from one bootstrap
+        ExtraTreesClassifier.
+
+        NaN values are replaced by the feature mean. After this call:
+        - self.importances_std_ holds the standard deviation of the
+        importances across trees, as a stability estimate,
+        - self.oob_score_ holds the out-of-bag accuracy of the ensemble and
+        - self.permutation_importances_ holds the mean out-of-bag accuracy
+        decrease when permuting each feature, if self.permutation is True.
+
+        Returns
+        -------
+        array_like
+        Vector of the size of number of features in each sample.
+        """
+        from sklearn.ensemble import ExtraTreesClassifier
+
+        samples = np.array(samples, dtype=float)
+        targets = np.asarray(targets)
+
+        nan_samples = np.isnan(samples)
+        if nan_samples.any():
+            nan_mean = np.nanmean(samples, axis=0)
+            samples[nan_samples] = np.take(nan_mean,
+                                           np.where(nan_samples)[1])
+
+        rng = check_random_state(self.random_state)
+
+        forest = ExtraTreesClassifier(n_estimators=self.n_estimators,
+                                      bootstrap=True, oob_score=True,
+                                      n_jobs=n_cpus,
+                                      random_state=rng.randint(np.iinfo(np.int32).max))
+        forest.fit(samples, targets)
+
+        tree_imps = np.array([tree.feature_importances_
+                              for tree in forest.estimators_])
+
+        self.forest_ = forest
+        self.oob_score_ = forest.oob_score_
+        self.importances_std_ = tree_imps.std(axis=0)
+        self.permutation_importances_ = None
+
+        if self.permutation:
+            self.permutation_importances_ = \
+                oob_permutation_importances(forest, samples, targets, rng)
+
+        return forest.feature_importances_
+
+
+def _oob_indices(tree, n_samples, max_samples=None):
+    """Return the indices of the samples that were left out of the bootstrap
+    sample used to fit tree.
+
+    This uses the bootstrap helpers of sklearn.ensemble.forest if they exist.
+    Otherwise, it draws the same bootstrap sample than the forests of older
+    sklearn versions, n_samples indices from the random_state of each tree.
+    """
+    if _generate_unsampled_indices is not None:
+        if _get_n_samples_bootstrap is None:
+            return _generate_unsampled_indices(tree.random_state, n_samples)
+        try:
+            n_boot = _get_n_samples_bootstrap(n_samples, max_samples)
+            return _generate_unsampled_indices(tree.random_state, n_samples,
+                                               n_boot)
+        except TypeError:
+            #the helpers of newer versions also take the sample weights
+            n_boot = _get_n_samples_bootstrap(n_samples, max_samples, None)
+            return _generate_unsampled_indices(tree.random_state, n_samples,
+                                               n_boot, None)
+
+    rng = check_random_state(tree.random_state)
+    sample_indices = rng.randint(0, n_samples, n_samples)
+
+    unsampled = np.ones(n_samples, dtype=bool)
+    unsampled[sample_indices] = False
+    return np.where(unsampled)[0]
+
+
+def oob_permutation_importances(forest, samples, targets, random_state=None):
+    """Return the mean decrease in out-of-bag accuracy of each tree in forest
+    when the values of each feature are permuted among its out-of-bag samples.
+
+    Parameters
+    ----------
+    forest: sklearn.ensemble forest
+        Fitted with bootstrap=True on samples and targets.
+
+    samples: array_like
+        Shape: n_samples x n_features
+
+    targets: array_like
+        Shape: n_samples
+
+    random_state: int or np.random.RandomState, optional
+
+    Returns
+    -------
+    array_like
+    Vector of the size of number of features in each sample.
+    """
+    rng = check_random_state(random_state)
+    n_samples, n_feats = samples.shape
+
+    importances = np.zeros(n_feats)
+    n_trees = 0
+    for tree in forest.estimators_:
+        oob = _oob_indices(tree, n_samples, getattr(forest, 'max_samples', None))
+        if len(oob) == 0:
+            continue
+
+        x_oob = samples[oob, :].astype(np.float32)
+        y_oob = targets[oob]
+
+        base_acc = np.mean(forest.classes_.take(tree.predict(x_oob).astype(int))
+                           == y_oob)
+
+        for f in range(n_feats):
+            col = x_oob[:, f].copy()
+            x_oob[:, f] = rng.permutation(col)
+            pred = forest.classes_.take(tree.predict(x_oob).astype(int))
+            importances[f] += base_acc - np.mean(pred == y_oob)
+            x_oob[:, f] = col
+
+        n_trees += 1
+
+    if n_trees:
+        importances /= n_trees
+
+    return importances
+
 
 def get_gini_indices(samples, targets):
     """
@@ -42,6 +215,9 @@ def get_gini_indices(samples, targets):
     :param targets:
     :return:
     """
+    from sklearn.ensemble import ExtraTreesClassifier
+    from sklearn.cross_validation import LeaveOneOut
+
     # Leave One Out
     cv = LeaveOneOut(len(targets))
     feat_imp = np.zeros(samples.shape[1])
@@ -53,7 +229,7 @@ def get_gini_indices(samples, targets):
                           targets[train], targets[test]
 
         # We correct NaN values in x_train and x_test
-        nan_mean = stats.nanmean(x_train)
+        nan_mean = np.nanmean(x_train, axis=0)
         nan_train = np.isnan(x_train)
         nan_test = np.isnan(x_test)
 
@@ -109,6 +285,8 @@ def plot_gini_indices(ginis, var_names, comparison_name,
     num_vars_to_plot: int
 
     """
+    import matplotlib.pyplot as plt
+
     if num_vars_to_plot > len(ginis):
         num_vars_to_plot = len(ginis)
 
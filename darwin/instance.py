@@ -2,14 +2,178 @@
 """
 YAML Class Instantiator
 """
+import os
 import os.path as op
 import sys
 import yaml
+import pickle
+import hashlib
 import logging
+import threading
 import importlib
 
+from sklearn.base import clone
+
 log = logging.getLogger(__name__)
 
+#Process-wide caches of the parsed YAML files, imported objects and method
+#prototypes, so building many pipelines does not reparse nor reimport anything.
+_cache_lock = threading.RLock()
+_yaml_cache = {}
+_imported_cache = {}
+_prototype_cache = {}
+
+#Use the libyaml parser if PyYAML was built with it
+YamlLoader = getattr(yaml, 'CLoader', yaml.Loader)
+
+#Directory of the pickled snapshots of the parsed YAML files, shared across
+#processes. None to disable them. Only point it to a directory you trust,
+#the snapshots found there are unpickled.
+SNAPSHOT_DIR = os.environ.get('DARWIN_YAML_SNAPSHOT_DIR') or None
+
+
+def clear_cache():
+    """Empty the cached YAML files, imported objects and method prototypes."""
+    with _cache_lock:
+        _yaml_cache.clear()
+        _imported_cache.clear()
+        _prototype_cache.clear()
+
+
+def get_yaml_snapshot_path(ymlpath, content_hash, snapshot_dir):
+    """Return the path to the pickled snapshot of the YAML file in ymlpath
+    for the given content hash, in snapshot_dir. The name also has a hash
+    of the YAML file path, so files with the same name do not collide.
+    """
+    path_hash = hashlib.sha1(op.abspath(ymlpath).encode('utf-8')).hexdigest()[:12]
+    return op.join(snapshot_dir, '{}.{}.{}.pkl'.format(op.basename(ymlpath),
+                                                       path_hash, content_hash))
+
+
+def validate_method_specs(yamldata, ymlpath):
+    """Check that yamldata has the syntax of learners.yml and selectors.yml.
+
+    Raises
+    ------
+    ValueError
+        If any of the items is not a dict with a 'class' entry.
+    """
+    if not isinstance(yamldata, dict):
+        raise ValueError('File {} should contain a mapping of method '
+                         'definitions.'.format(ymlpath))
+
+    for method_name, item in yamldata.items():
+        if not isinstance(item, dict) or 'class' not in item:
+            raise ValueError('Definition of {} in {} should have a "class" '
+                             'entry.'.format(method_name, ymlpath))
+
+
+def _read_yaml_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path, 'rb') as f:
+            return pickle.load(f)
+    except (IOError, OSError):
+        return None
+    except Exception:
+        log.debug('Ignoring unreadable YAML snapshot {}.'.format(snapshot_path))
+        return None
+
+
+def _write_yaml_snapshot(snapshot_path, yamldata):
+    """Pickle yamldata into snapshot_path, removing older snapshots of the
+    same YAML file. If the snapshot directory can not be written, nothing
+    is done.
+    """
+    snapshot_dir, snapshot_name = op.split(snapshot_path)
+    prefix = snapshot_name.rsplit('.', 2)[0] + '.'
+    tmp_path = '{}.{}.tmp'.format(snapshot_path, os.getpid())
+    try:
+        if not op.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(yamldata, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, snapshot_path)
+
+        for fname in os.listdir(snapshot_dir):
+            if fname.startswith(prefix) and fname.endswith('.pkl') and \
+               fname != snapshot_name:
+                os.remove(op.join(snapshot_dir, fname))
+    except (IOError, OSError):
+        log.debug('Could not write YAML snapshot {}.'.format(snapshot_path))
+        if op.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_yaml_file(ymlpath, snapshot_dir=None):
+    """Return the content of the YAML file in ymlpath.
+
+    The parsed content is cached for the whole process and read again only
+    if the modification time of the file changes. The returned object is
+    shared, it should not be modified.
+
+    Optionally, the validated content is also stored in a pickled snapshot
+    in snapshot_dir, keyed by the hash of its content, so new processes do
+    not need to parse the YAML file again.
+
+    Parameters
+    ----------
+    ymlpath: str
+        Path to the YAML file.
+
+    snapshot_dir: str, optional
+        Directory of the snapshots, by default SNAPSHOT_DIR, which is set
+        from the DARWIN_YAML_SNAPSHOT_DIR environment variable. If both are
+        empty, the YAML file is parsed and no snapshot is written.
+
+    Returns
+    -------
+    yamldata: dict
+
+    Raises
+    ------
+    IOError
+        If the file is not found
+
+    ValueError
+        If the content does not have the syntax of learners.yml.
+    """
+    if not op.exists(ymlpath):
+        raise IOError('File {} not found.'.format(ymlpath))
+
+    mtime = op.getmtime(ymlpath)
+
+    with _cache_lock:
+        cached = _yaml_cache.get(ymlpath)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(ymlpath, 'rb') as f:
+            content = f.read()
+
+        if snapshot_dir is None:
+            snapshot_dir = SNAPSHOT_DIR
+
+        yamldata = None
+        if snapshot_dir:
+            content_hash = hashlib.sha1(content).hexdigest()
+            snapshot_path = get_yaml_snapshot_path(ymlpath, content_hash,
+                                                   snapshot_dir)
+            yamldata = _read_yaml_snapshot(snapshot_path)
+
+        if yamldata is None:
+            yamldata = yaml.load(content, Loader=YamlLoader)
+            validate_method_specs(yamldata, ymlpath)
+            if snapshot_dir:
+                _write_yaml_snapshot(snapshot_path, yamldata)
+
+        #the prototypes of an outdated file are not valid anymore
+        for key in [k for k in _prototype_cache if k[0] == ymlpath]:
+            del _prototype_cache[key]
+
+        _yaml_cache[ymlpath] = (mtime, yamldata)
+        return yamldata
+
 
 def import_this(object_module_path):
     """Import any class or function to the global Python environment.j
@@ -28,11 +192,18 @@ def import_this(object_module_path):
     -------
     The specified module will be inserted into sys.modules and returned.
     """
+    try:
+        return _imported_cache[object_module_path]
+    except KeyError:
+        pass
+
     try:
         mod_path_list = object_module_path.split('.')
 
         mod = import_module('.'.join(mod_path_list[:-1]))
-        return getattr(mod, mod_path_list[-1])
+        obj = getattr(mod, mod_path_list[-1])
+        _imported_cache[object_module_path] = obj
+        return obj
     except:
         log.exception('Importing object {}.'.format(object_module_path))
         raise
@@ -145,10 +316,9 @@ class MethodInstantiator(object):
         self._method_name = None
 
         try:
-            with open(self._ymlpath, 'rt') as f:
-                self.yamldata = yaml.load(f)
+            self.yamldata = load_yaml_file(self._ymlpath)
 
-        except IOError:
+        except (IOError, OSError):
             log.exception("File {} not found.".format(ymlpath))
             raise
         except:
@@ -252,7 +422,7 @@ class MethodInstantiator(object):
 
         try:
             class_data = self.get_yaml_item(method_name)
-            def_parms = class_data['default']
+            def_parms = dict(class_data['default'])
 
             for parm_name in def_parms:
                 obj = get_if_any_instance(def_parms[parm_name])
@@ -291,8 +461,7 @@ class MethodInstantiator(object):
 
         """
         try:
-            class_data = self.get_yaml_item(method_name)
-            return instantiate_this(class_data['class'], self.get_default_params(method_name))
+            return clone(self._get_method_prototype(method_name))
         except ImportError:
             log.exception("Error importing module class {}.".format(method_name))
             raise
@@ -300,6 +469,18 @@ class MethodInstantiator(object):
             log.exception("Error reading definition for method {} in {}.".format(method_name, self._ymlpath))
             raise
 
+    def _get_method_prototype(self, method_name):
+        """Return the cached, never fitted, instance of method_name.
+        get_method_instance hands out clones of this object.
+        """
+        key = (self._ymlpath, method_name)
+        with _cache_lock:
+            if key not in _prototype_cache:
+                class_data = self.get_yaml_item(method_name)
+                _prototype_cache[key] = instantiate_this(class_data['class'],
+                                                         self.get_default_params(method_name))
+            return _prototype_cache[key]
+
     def get_param_grid(self, method_name):
         """Return the defined parameter grid for the given learner class.
 
@@ -1,16 +1,212 @@
 # -*- coding: utf-8 -*-
+import logging
+import collections
+from multiprocessing.pool import ThreadPool
 
-from .instance import Instantiator
+import numpy as np
+
+from .utils.strings import string_types
 from .utils.persist import PersistenceMixin
 
+log = logging.getLogger(__name__)
+
+#Attributes missing in the Learners saved before they were added
+LEARNER_DEFAULTS = {'_mask': None, 'scaler': None, 'selector': None,
+                    'calibrator': None}
+
 
 class Learner(PersistenceMixin):
+        """Wraps a classification model with its parameter grid and the
+        preprocessing steps needed to predict new subjects.
+
+        Parameters
+        ----------
+        learner_instance: sklearn estimator
+
+        param_grid: dict, optional
+
+        mask: str or array_like, optional
+            Path to a NIfTI mask file or mask volume. The voxels > 0 are the
+            features of each subject volume.
+
+        scaler: fitted sklearn transformer, optional
+            Applied to the masked subject features before the selector.
+
+        selector: fitted sklearn transformer, optional
+            Feature selection applied before the model.
+
+        calibrator: calibration.DecisionCalibrator, optional
+            Maps the model decision values to probabilities, for models
+            without predict_proba, e.g., SVC without probability=True.
+        """
 
-        def __init__(self, learner_instance, param_grid=None):
+        def __init__(self, learner_instance, param_grid=None, mask=None,
+                     scaler=None, selector=None, calibrator=None):
             self.model = learner_instance
             self.param_grid = param_grid
+            self.mask = mask
+            self.scaler = scaler
+            self.selector = selector
+            self.calibrator = calibrator
+
+        def __getattr__(self, name):
+            #not class attributes, they would hide the lazy attributes of
+            #artifacts from PersistenceMixin.__getattr__
+            try:
+                return super(Learner, self).__getattr__(name)
+            except AttributeError:
+                if name in LEARNER_DEFAULTS:
+                    return LEARNER_DEFAULTS[name]
+                raise
 
         @property
         def model_type(self):
             ''' A string representation of the underlying modeltype '''
             return type(self.model)
+
+        @property
+        def mask(self):
+            """Boolean mask volume, or None"""
+            return self._mask
+
+        @mask.setter
+        def mask(self, mask):
+            if mask is None:
+                self._mask = None
+                return
+
+            if isinstance(mask, string_types):
+                import nibabel as nib
+                mask = nib.load(mask).get_data()
+
+            self._mask = np.asarray(mask) > 0
+
+        def load_subject(self, subject):
+            """Return the feature vector of subject.
+
+            Parameters
+            ----------
+            subject: str or array_like
+                Path to a NIfTI file, a volume or a feature vector.
+                Volumes are masked with self.mask.
+
+            Returns
+            -------
+            numpy array
+            """
+            if isinstance(subject, string_types):
+                import nibabel as nib
+                subject = nib.load(subject).get_data()
+
+            subject = np.asarray(subject)
+            if self._mask is not None and subject.ndim > 1:
+                if subject.shape != self._mask.shape:
+                    raise ValueError('Subject volume shape {} and mask shape {} '
+                                     'do not coincide.'.format(subject.shape,
+                                                               self._mask.shape))
+                subject = subject[self._mask]
+
+            return subject.ravel()
+
+        def transform(self, samples):
+            """Apply the scaler and selector steps to samples.
+
+            Parameters
+            ----------
+            samples: array_like
+                Shape: n_samples x n_features
+            """
+            if self.scaler is not None:
+                samples = self.scaler.transform(samples)
+            if self.selector is not None:
+                samples = self.selector.transform(samples)
+            return samples
+
+        def iter_batches(self, subjects, batch_size=32, n_io_threads=4):
+            """Yield the feature matrices of subjects in batches of
+            batch_size rows.
+
+            The subjects are read by a pool of n_io_threads threads, that
+            reads ahead at most two batches, so the memory use does not
+            depend on the number of subjects.
+
+            Parameters
+            ----------
+            subjects: iterable
+                NIfTI file paths, volumes or feature vectors. See load_subject.
+
+            batch_size: int
+
+            n_io_threads: int
+            """
+            if n_io_threads <= 1:
+                batch = []
+                for subj in subjects:
+                    batch.append(self.load_subject(subj))
+                    if len(batch) == batch_size:
+                        yield np.vstack(batch)
+                        batch = []
+                if batch:
+                    yield np.vstack(batch)
+                return
+
+            pool = ThreadPool(n_io_threads)
+            try:
+                pending = collections.deque()
+                batch = []
+                subjects = iter(subjects)
+                exhausted = False
+                while True:
+                    while not exhausted and len(pending) < 2 * batch_size:
+                        try:
+                            subj = next(subjects)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        pending.append(pool.apply_async(self.load_subject, (subj, )))
+
+                    if not pending:
+                        break
+
+                    batch.append(pending.popleft().get())
+                    if len(batch) == batch_size:
+                        yield np.vstack(batch)
+                        batch = []
+
+                if batch:
+                    yield np.vstack(batch)
+            finally:
+                pool.terminate()
+
+        def predict_proba_transformed(self, samples):
+            """Return the class probabilities of samples already passed
+            through transform, from the calibrator if there is one."""
+            if getattr(self, 'calibrator', None) is not None:
+                return self.calibrator.predict_proba(self.model.decision_function(samples))
+            return self.model.predict_proba(samples)
+
+        def predict_stream(self, subjects, batch_size=32, n_io_threads=4):
+            """Yield the model prediction for each of the subjects, predicting
+            in batches of batch_size. See iter_batches."""
+            for batch in self.iter_batches(subjects, batch_size, n_io_threads):
+                for pred in self.model.predict(self.transform(batch)):
+                    yield pred
+
+        def predict_proba_stream(self, subjects, batch_size=32, n_io_threads=4):
+            """Yield the model class probabilities for each of the subjects,
+            predicting in batches of batch_size. See iter_batches."""
+            for batch in self.iter_batches(subjects, batch_size, n_io_threads):
+                for prob in self.predict_proba_transformed(self.transform(batch)):
+                    yield prob
+
+        def predict(self, subjects, batch_size=32, n_io_threads=4):
+            """Return an array with the predictions of subjects.
+            See predict_stream."""
+            return np.array(list(self.predict_stream(subjects, batch_size,
+                                                     n_io_threads)))
+
+        def predict_proba(self, subjects, batch_size=32, n_io_threads=4):
+            """Return an array with the class probabilities of subjects.
+            See predict_proba_stream."""
+            return np.array(list(self.predict_proba_stream(subjects, batch_size,
+                                                           n_io_threads)))
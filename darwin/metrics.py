@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized binary and multi-class classification metrics.
+
+The metrics of many groups of samples, e.g., the folds of a
+cross-validation, are computed at once: one confusion matrix accumulation
+for all groups and one sort per class for the one-vs-rest AUCs.
+"""
+import logging
+import collections
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def _safe_ratio(num, den):
+    """Return num / den element-wise, 0 where den is 0."""
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    out = np.zeros(np.broadcast(num, den).shape)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def _check_groups(n_samples, groups=None, n_groups=None):
+    if groups is None:
+        groups = np.zeros(n_samples, dtype=np.intp)
+    groups = np.asarray(groups, dtype=np.intp)
+    if n_groups is None:
+        n_groups = groups.max() + 1 if len(groups) else 0
+    return groups, n_groups
+
+
+def confusion_matrices(truth, preds, labels, groups=None, n_groups=None):
+    """Return the confusion matrix of each group, with the true labels in
+    rows, computed with a single bincount. As sklearn confusion_matrix, the
+    samples with labels not in labels are ignored.
+
+    Parameters
+    ----------
+    truth: array
+
+    preds: array
+
+    labels: sorted array
+
+    groups: array of ints, optional
+        Group of each sample, from 0 to n_groups - 1. By default, one group.
+
+    n_groups: int, optional
+
+    Returns
+    -------
+    numpy array of shape n_groups x n_labels x n_labels
+    """
+    truth = np.asarray(truth)
+    preds = np.asarray(preds)
+    labels = np.asarray(labels)
+    groups, n_groups = _check_groups(len(truth), groups, n_groups)
+
+    n_labels = len(labels)
+    if n_labels == 0:
+        return np.zeros((n_groups, 0, 0), dtype=np.intp)
+
+    t_idx = np.searchsorted(labels, truth).clip(0, n_labels - 1)
+    p_idx = np.searchsorted(labels, preds).clip(0, n_labels - 1)
+    valid = (labels[t_idx] == truth) & (labels[p_idx] == preds)
+    flat = ((groups * n_labels + t_idx) * n_labels + p_idx)[valid]
+    counts = np.bincount(flat, minlength=n_groups * n_labels * n_labels)
+    return counts.reshape(n_groups, n_labels, n_labels)
+
+
+def grouped_roc_auc(scores, positives, groups=None, n_groups=None):
+    """Return the ROC AUC of scores for the positives of each group, with a
+    single sort for all groups. Tied scores get their average rank.
+
+    Parameters
+    ----------
+    scores: array of floats
+
+    positives: array of bools
+
+    groups: array of ints, optional
+
+    n_groups: int, optional
+
+    Returns
+    -------
+    array of n_groups AUCs, NaN for the groups without positives or
+    negatives.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    positives = np.asarray(positives, dtype=bool)
+    groups, n_groups = _check_groups(len(scores), groups, n_groups)
+
+    order = np.lexsort((scores, groups))
+    grp = groups[order]
+    scr = scores[order]
+    pos = positives[order]
+
+    sizes = np.bincount(grp, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    ranks = np.arange(len(scr)) - starts[grp] + 1.
+
+    #average rank of tied scores within a group
+    new_run = np.ones(len(scr), dtype=bool)
+    new_run[1:] = (grp[1:] != grp[:-1]) | (scr[1:] != scr[:-1])
+    run_id = np.cumsum(new_run) - 1
+    ranks = (np.bincount(run_id, weights=ranks) / np.bincount(run_id))[run_id]
+
+    n_pos = np.bincount(grp, weights=pos.astype(np.float64), minlength=n_groups)
+    n_neg = sizes - n_pos
+    pos_ranks = np.bincount(grp, weights=ranks * pos, minlength=n_groups)
+
+    auc = np.full(n_groups, np.nan)
+    defined = (n_pos > 0) & (n_neg > 0)
+    auc[defined] = ((pos_ranks[defined] - n_pos[defined] * (n_pos[defined] + 1) / 2.)
+                    / (n_pos[defined] * n_neg[defined]))
+    return auc
+
+
+class MulticlassMetrics(collections.namedtuple('Multiclass_Metrics',
+                                               ['labels', 'n_samples',
+                                                'accuracy', 'sensitivity',
+                                                'specificity', 'precision',
+                                                'f1_score', 'area_under_curve',
+                                                'confusion', 'micro_auc'])):
+    """
+    Namedtuple with the metrics of each group of samples.
+    accuracy and n_samples have shape n_groups, the per-class metrics
+    n_groups x n_labels and confusion n_groups x n_labels x n_labels.
+    The AUCs are one-vs-rest, from probabilities if they were given, else
+    from the hard predictions.
+    """
+
+    @property
+    def n_groups(self):
+        return len(self.accuracy)
+
+    def positive_class(self):
+        """Index of the positive label of binary problems, sklearn's
+        default 1, or the last label."""
+        labels = list(self.labels)
+        return labels.index(1) if 1 in labels else len(labels) - 1
+
+    def macro(self):
+        """Return an array of shape n_groups x 6 with accuracy and the
+        unweighted mean over classes of sensitivity, specificity,
+        precision, F1 and AUC."""
+        #mean of the defined class AUCs
+        defined = ~np.isnan(self.area_under_curve)
+        n_defined = defined.sum(axis=1)
+        auc_sum = np.where(defined, self.area_under_curve, 0).sum(axis=1)
+        auc = np.full(self.n_groups, np.nan)
+        auc[n_defined > 0] = auc_sum[n_defined > 0] / n_defined[n_defined > 0]
+        return np.column_stack([self.accuracy,
+                                self.sensitivity.mean(axis=1),
+                                self.specificity.mean(axis=1),
+                                self.precision.mean(axis=1),
+                                self.f1_score.mean(axis=1), auc])
+
+    def micro(self):
+        """Return an array of shape n_groups x 6 with accuracy and the
+        sensitivity, specificity, precision, F1 and AUC of the pooled
+        one-vs-rest decisions of all classes."""
+        cm = self.confusion
+        tp = np.einsum('gii->g', cm)
+        total = cm.sum(axis=(1, 2))
+        #each error is a false positive of one class and a false negative
+        #of another
+        errors = total - tp
+        n_labels = len(self.labels)
+        tn = total * n_labels - tp - 2 * errors
+
+        sens = _safe_ratio(tp, tp + errors)
+        spec = _safe_ratio(tn, tn + errors)
+        return np.column_stack([self.accuracy, sens, spec, sens, sens,
+                                self.micro_auc])
+
+    def binary(self):
+        """Return an array of shape n_groups x 6 with accuracy and the
+        sensitivity, specificity, precision, F1 and AUC of the positive
+        class."""
+        pos = self.positive_class()
+        return np.column_stack([self.accuracy, self.sensitivity[:, pos],
+                                self.specificity[:, pos],
+                                self.precision[:, pos], self.f1_score[:, pos],
+                                self.area_under_curve[:, pos]])
+
+    def summary(self, average='macro'):
+        """Return an array of shape n_groups x 6 with acc, sens, spec, prec,
+        f1 and roc_auc: the positive class metrics for binary problems,
+        otherwise the average ('macro' or 'micro') over classes."""
+        if len(self.labels) == 2:
+            return self.binary()
+        if average == 'macro':
+            return self.macro()
+        if average == 'micro':
+            return self.micro()
+        raise ValueError('Unknown average {}, use "macro" or '
+                         '"micro".'.format(average))
+
+
+def multiclass_metrics(truth, preds, probs=None, labels=None, groups=None,
+                       n_groups=None):
+    """Compute per-class sensitivity, specificity, precision, F1 and
+    one-vs-rest AUC of each group of samples.
+
+    Parameters
+    ----------
+    truth: array
+
+    preds: array
+
+    probs: array, optional
+        Shape: n_samples x n_labels, the columns in the order of labels,
+        e.g., the output of predict_proba. If None or with other number of
+        columns, the AUCs are computed from the hard predictions.
+
+    labels: array, optional
+        By default, the labels in truth or preds.
+
+    groups: array of ints, optional
+        Group of each sample, e.g., its CV fold. By default, one group.
+
+    n_groups: int, optional
+
+    Returns
+    -------
+    MulticlassMetrics
+    """
+    truth = np.asarray(truth)
+    preds = np.asarray(preds)
+    if labels is None:
+        labels = np.union1d(truth, preds)
+    labels = np.unique(labels)
+    groups, n_groups = _check_groups(len(truth), groups, n_groups)
+
+    cm = confusion_matrices(truth, preds, labels, groups, n_groups)
+
+    tp = np.diagonal(cm, axis1=1, axis2=2).astype(np.float64)
+    n_true = cm.sum(axis=2)
+    n_pred = cm.sum(axis=1)
+    n_samples = np.bincount(groups, minlength=n_groups)
+    total = cm.sum(axis=(1, 2))[:, np.newaxis]
+
+    fn = n_true - tp
+    fp = n_pred - tp
+    tn = total - tp - fn - fp
+
+    sens = _safe_ratio(tp, tp + fn)
+    spec = _safe_ratio(tn, tn + fp)
+    prec = _safe_ratio(tp, tp + fp)
+    f1 = _safe_ratio(2 * prec * sens, prec + sens)
+    acc = _safe_ratio(np.bincount(groups, weights=(truth == preds).astype(np.float64),
+                                  minlength=n_groups), n_samples)
+
+    if probs is not None:
+        probs = np.asarray(probs, dtype=np.float64)
+        if probs.ndim != 2 or probs.shape[1] != len(labels):
+            log.debug('The probabilities do not have one column per label, '
+                      'using the predictions for the AUC.')
+            probs = None
+
+    n_labels = len(labels)
+    auc = np.full((n_groups, n_labels), np.nan)
+    indicators = truth[:, np.newaxis] == labels[np.newaxis, :]
+    if probs is None:
+        scores = (preds[:, np.newaxis] == labels[np.newaxis, :]).astype(np.float64)
+    else:
+        scores = probs
+
+    for c in range(n_labels):
+        auc[:, c] = grouped_roc_auc(scores[:, c], indicators[:, c], groups,
+                                    n_groups)
+
+    micro_auc = grouped_roc_auc(scores.ravel(), indicators.ravel(),
+                                np.repeat(groups, n_labels), n_groups)
+
+    return MulticlassMetrics(labels, n_samples, acc, sens, spec, prec, f1, auc,
+                             cm, micro_auc)
+
+
+def _bootstrap_chunk(truth, preds, probs, labels, indices, average):
+    """Return the summary metrics of the resamples in the rows of indices."""
+    n_resamples, n_samples = indices.shape
+    flat = indices.ravel()
+    groups = np.repeat(np.arange(n_resamples), n_samples)
+    chunk_probs = None if probs is None else probs[flat]
+    mets = multiclass_metrics(truth[flat], preds[flat], chunk_probs, labels,
+                              groups, n_resamples)
+    return mets.summary(average)
+
+
+def bootstrap_metrics(truth, preds, probs=None, labels=None, n_boot=2000,
+                      random_state=None, n_jobs=1, chunk_size=250,
+                      average='macro'):
+    """Compute the metrics of n_boot bootstrap resamples of the samples.
+
+    Each chunk of resamples is drawn as one index matrix, gathered at once
+    and scored with a single multiclass_metrics call, grouping by resample.
+    The chunks are scored in a thread pool of n_jobs.
+
+    Parameters
+    ----------
+    truth: array
+
+    preds: array
+
+    probs: array, optional
+        Shape: n_samples x n_labels
+
+    labels: array, optional
+
+    n_boot: int
+        Number of resamples.
+
+    random_state: int or numpy RandomState, optional
+
+    n_jobs: int
+
+    chunk_size: int
+        Number of resamples scored at a time, to bound the memory.
+
+    average: str
+        See MulticlassMetrics.summary.
+
+    Returns
+    -------
+    numpy array of shape n_boot x 6 with acc, sens, spec, prec, f1 and
+    roc_auc of each resample.
+    """
+    truth = np.asarray(truth)
+    preds = np.asarray(preds)
+    if probs is not None:
+        probs = np.asarray(probs)
+    if labels is None:
+        labels = np.union1d(truth, preds)
+
+    rng = random_state
+    if not isinstance(rng, np.random.RandomState):
+        rng = np.random.RandomState(rng)
+
+    n_samples = len(truth)
+    #drawn here, in order, so the result does not depend on n_jobs
+    chunks = [rng.randint(0, n_samples, (min(chunk_size, n_boot - start), n_samples))
+              for start in range(0, n_boot, chunk_size)]
+
+    if n_jobs == 1 or len(chunks) == 1:
+        results = [_bootstrap_chunk(truth, preds, probs, labels, idx, average)
+                   for idx in chunks]
+    else:
+        from joblib import Parallel, delayed
+        results = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(_bootstrap_chunk)(truth, preds, probs, labels, idx, average)
+            for idx in chunks)
+
+    if not results:
+        return np.zeros((0, 6))
+    return np.concatenate(results, axis=0)
+
+
+def percentile_intervals(values, alpha=0.05):
+    """Return the lower and upper alpha/2 percentiles of each column of
+    values, ignoring NaNs.
+
+    Returns
+    -------
+    lower, upper: arrays with one value per column
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lower = np.full(values.shape[1], np.nan)
+    upper = np.full(values.shape[1], np.nan)
+    for col in range(values.shape[1]):
+        vals = values[:, col]
+        vals = vals[~np.isnan(vals)]
+        if len(vals):
+            lower[col], upper[col] = np.percentile(vals, [100 * alpha / 2.,
+                                                          100 * (1 - alpha / 2.)])
+    return lower, upper
@@ -0,0 +1,734 @@
+# -*- coding: utf-8 -*-
+"""
+Nested cross-validation with explicit inner splits of each outer training
+set.
+
+The inner folds are built from the outer fold instead of from scratch: the
+per-class sufficient statistics (counts, sums and sums of squares of each
+feature) of the outer training set are computed once, and the statistics of
+each inner training set are obtained by downdating, i.e., subtracting the
+statistics of its held-out rows. The imputation means, the StandardScaler
+parameters and the pearson, welcht and bhattacharyya feature scores are
+functions of those statistics. The Gram matrix of each inner design is
+computed once and shared by all the kernel SVC grid points, and with
+inner_preprocessing='outer' the inner folds and the final refit all slice
+the Gram matrix of the outer training set.
+
+The inner-loop stages are timed in their own profile.
+"""
+import logging
+import collections
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+from sklearn.cross_validation import LeaveOneOut
+
+from .utils.printable import Printable
+from .profiling import Profiler
+from .cvplan import _impute
+from .calibration import DecisionCalibrator, has_native_proba, class_scores
+from .distance import bhattacharyya_from_stats, welch_from_stats
+from .threshold import apply_threshold
+from .results import (ClassificationResult, ClassificationMetrics,
+                      classification_metrics, get_cv_classification_metrics,
+                      enlist_cv_results_from_dict)
+
+log = logging.getLogger(__name__)
+
+#Stages of each outer fold and of each inner fold, in order
+NESTED_STAGES = ['stats', 'inner_loop', 'select', 'transform', 'kernel', 'fit',
+                 'predict', 'calibrate', 'predict_proba']
+INNER_STAGES = ['downdate', 'select', 'transform', 'kernel', 'fit', 'score']
+
+PREFS_METHODS = ['pearson', 'welcht', 'bhattacharyya']
+INNER_PREPROCESSING = ['downdate', 'outer']
+KERNEL_PARAMS = ('kernel', 'gamma', 'degree', 'coef0')
+
+
+class NestedCVResult(collections.namedtuple('Nested_CV_Result',
+                                            ['result', 'metrics', 'grid',
+                                             'inner_scores', 'inner_profile'])):
+    """
+    Namedtuple with the results of a nested cross-validation.
+    result is the results.ClassificationResult of the outer folds and
+    metrics its results.ClassificationMetrics, as returned by
+    ClassificationPipeline.cross_validation. grid is the list of candidate
+    parameters, inner_scores a dict of outer fold -> array of shape
+    [n_inner_folds x n_candidates] and inner_profile the
+    profiling.PipelineProfile of the inner loops, whose folds are
+    (outer fold, inner fold) tuples.
+    """
+    pass
+
+
+class ClassStats(object):
+    """Per-class sufficient statistics of the rows of a training set.
+
+    The values are shifted by shift before being accumulated in float64,
+    so the variances do not lose precision for features far from 0. NaN
+    values are not accumulated, counts has the number of non-NaN values.
+
+    Parameters
+    ----------
+    classes: array
+        Class labels, the rows of the statistics.
+
+    n_rows: array of floats
+        Number of rows of each class.
+
+    counts, sums, squares: arrays of floats
+        Shape: n_classes x n_features
+
+    shift: array of floats
+        Size: n_features
+    """
+
+    def __init__(self, classes, n_rows, counts, sums, squares, shift):
+        self.classes = classes
+        self.n_rows = n_rows
+        self.counts = counts
+        self.sums = sums
+        self.squares = squares
+        self.shift = shift
+
+    @classmethod
+    def from_rows(cls, x, y, classes, shift=None):
+        """Return the statistics of the rows x with labels y.
+
+        Parameters
+        ----------
+        x: numpy array
+            Shape: n_samples x n_features
+
+        y: numpy array
+
+        classes: array
+            All the class labels, also those not in y.
+
+        shift: array, optional
+            By default, the mean of each feature in x.
+        """
+        if shift is None:
+            with np.errstate(invalid='ignore'):
+                shift = np.nanmean(x, axis=0, dtype=np.float64)
+            shift[np.isnan(shift)] = 0
+
+        n_feats = x.shape[1]
+        n_rows = np.zeros(len(classes))
+        counts = np.zeros((len(classes), n_feats))
+        sums = np.zeros((len(classes), n_feats))
+        squares = np.zeros((len(classes), n_feats))
+        for c, label in enumerate(classes):
+            xc = np.asarray(x[y == label], dtype=np.float64) - shift
+            n_rows[c] = len(xc)
+            nans = np.isnan(xc)
+            if nans.any():
+                xc[nans] = 0
+                counts[c] = len(xc) - nans.sum(axis=0)
+            else:
+                counts[c] = len(xc)
+            sums[c] = xc.sum(axis=0)
+            squares[c] = np.einsum('ij,ij->j', xc, xc)
+
+        return cls(classes, n_rows, counts, sums, squares, shift)
+
+    def __sub__(self, other):
+        return ClassStats(self.classes, self.n_rows - other.n_rows,
+                          self.counts - other.counts, self.sums - other.sums,
+                          self.squares - other.squares, self.shift)
+
+    def downdate(self, x, y):
+        """Return the statistics without the rows x with labels y, which
+        must be rows of this set."""
+        return self - ClassStats.from_rows(x, y, self.classes, self.shift)
+
+    def _shifted_means(self):
+        total = self.counts.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = self.sums.sum(axis=0) / total
+        means[total == 0] = 0
+        return means
+
+    def imputation_means(self):
+        """Return the mean of the non-NaN values of each feature."""
+        return self.shift + self._shifted_means()
+
+    def moments(self):
+        """Return the number of rows, shifted means and variances of each
+        class after replacing the NaN values by imputation_means.
+
+        Returns
+        -------
+        n_rows: array of shape n_classes
+        means, variances: arrays of shape n_classes x n_features
+        """
+        m = self._shifted_means()
+        n_nans = self.n_rows[:, np.newaxis] - self.counts
+        sums = self.sums + n_nans * m
+        squares = self.squares + n_nans * m * m
+
+        n = self.n_rows[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / n
+            variances = np.maximum(squares / n - means * means, 0)
+        return self.n_rows, means, variances
+
+    def preprocessing(self, scaler):
+        """Return the imputation means, centers and scales of the features
+        as computed by the scaler, a StandardScaler or None, fitted on the
+        imputed rows. center and scale are None if not used."""
+        means = self.imputation_means()
+        if scaler is None:
+            return means, None, None
+        if not isinstance(scaler, StandardScaler):
+            raise ValueError('Nested cross-validation downdates the statistics '
+                             'of a StandardScaler, got {}.'.format(scaler))
+
+        n_rows, class_means, class_vars = self.moments()
+        n = n_rows.sum()
+        weights = n_rows[:, np.newaxis] / n
+        present = n_rows > 0
+        mean = (weights * np.where(present[:, np.newaxis], class_means, 0)).sum(axis=0)
+        #total variance: within-class plus between-class variance
+        var = (weights * np.where(present[:, np.newaxis],
+                                  class_vars + np.square(class_means - mean),
+                                  0)).sum(axis=0)
+
+        center = self.shift + mean if scaler.with_mean else None
+        scale = None
+        if scaler.with_std:
+            scale = np.sqrt(var)
+            scale[scale == 0] = 1.
+        return means, center, scale
+
+    def scores(self, method):
+        """Return the feature scores of the pre-feature selection method,
+        as computed by features.feature_selection on the imputed rows.
+
+        Parameters
+        ----------
+        method: str
+            'pearson', 'welcht' or 'bhattacharyya'
+        """
+        if method not in PREFS_METHODS:
+            raise ValueError('Unknown pre-feature selection method {}, use one '
+                             'of {}.'.format(method, PREFS_METHODS))
+
+        n_rows, means, variances = self.moments()
+        present = np.where(n_rows > 0)[0]
+
+        if method == 'pearson':
+            y = np.asarray(self.classes[present], dtype=np.float64)
+            n_y = n_rows[present]
+            n = n_y.sum()
+            yc = y - np.dot(n_y, y) / n
+            mean = np.dot(n_y, means[present]) / n
+            #sums of the products of the centered values
+            sxy = np.dot(yc * n_y, means[present])
+            sxx = np.dot(n_y, variances[present] + np.square(means[present] - mean))
+            syy = np.dot(n_y, yc * yc)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r = sxy / np.sqrt(sxx * syy)
+            r[~np.isfinite(r)] = 0
+            return np.clip(r, -1, 1)
+
+        b = np.zeros(means.shape[1])
+        for idx, i in enumerate(present):
+            for j in present[idx + 1:]:
+                if method == 'bhattacharyya':
+                    d = bhattacharyya_from_stats(means[i], variances[i],
+                                                 means[j], variances[j])
+                else:
+                    d = welch_from_stats(means[i], variances[i], n_rows[i],
+                                         means[j], variances[j], n_rows[j])
+                b = np.maximum(b, d)
+        return b
+
+
+class _Design(object):
+    """Imputed, scaled and selected rows of a training set, with their Gram
+    matrix computed on first use."""
+
+    def __init__(self, z):
+        self.z = z
+        self._gram = None
+        self._sq_norms = None
+
+    @property
+    def gram(self):
+        if self._gram is None:
+            self._gram = np.dot(self.z, self.z.T)
+            self._sq_norms = np.diag(self._gram).copy()
+        return self._gram
+
+    @property
+    def sq_norms(self):
+        self.gram
+        return self._sq_norms
+
+
+def _kernel(kernel, gamma, degree, coef0, gram, sq_rows, sq_cols, n_feats):
+    """Return the kernel matrix of kernel from the Gram matrix gram of two
+    sets of rows with squared norms sq_rows and sq_cols, with the
+    conventions of sklearn.svm.SVC."""
+    if kernel == 'linear':
+        return gram
+    if not gamma:
+        gamma = 1. / n_feats
+    if kernel == 'rbf':
+        d2 = sq_rows[:, np.newaxis] + sq_cols[np.newaxis, :] - 2 * gram
+        np.maximum(d2, 0, out=d2)
+        return np.exp(-gamma * d2)
+    return (gamma * gram + coef0) ** int(degree)
+
+
+def _param_points(param_grid):
+    """Return the list of parameter dicts of param_grid, where single values
+    are also accepted instead of lists."""
+    from sklearn.grid_search import ParameterGrid
+
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+    grids = [dict((k, v if isinstance(v, (list, tuple)) else [v])
+                  for k, v in grid.items()) for grid in param_grid]
+    return list(ParameterGrid(grids))
+
+
+class NestedCrossValidation(Printable):
+    """Nested cross-validation of a classifier with a grid search, and
+    optionally a pre-feature selection threshold, selected in explicit
+    inner folds of each outer training set.
+
+    Parameters
+    ----------
+    clfmethod: str
+        See sklearn_utils.get_clfmethod.
+
+    prefs: str, optional
+        Pre-feature selection method: 'pearson', 'welcht' or
+        'bhattacharyya'. The features are scored on the imputed unscaled
+        training rows, as in sweep.SweepRunner.
+
+    prefs_thrs: list of float
+        Thresholds of the feature scores, in [0, 100], selected in the
+        inner loop together with the classifier parameters.
+
+    thr_method: str
+        See threshold.apply_threshold.
+
+    cvmethod: str or int
+        Outer folds, see sklearn_utils.get_cv_method.
+
+    inner_cvmethod: str or int
+        Inner folds of each outer training set.
+
+    stratified: bool
+        See sklearn_utils.get_cv_method.
+
+    scaler: sklearn.preprocessing.StandardScaler or None
+        Its parameters are computed from the downdated statistics, so
+        other scalers are not supported.
+
+    inner_preprocessing: str
+        'downdate' to impute, scale and select the features of each inner
+        fold with the statistics of its own training rows, as a
+        GridSearchCV of the whole pipeline would. 'outer' to reuse the
+        preprocessing of the outer training set in its inner folds, which
+        leaks the statistics of the inner held-out rows into the inner
+        scores, but not into the outer test set, and lets all of them
+        share one Gram matrix.
+
+    gs_scoring: str or callable
+        Grid search objective, see sklearn.metrics.scorer.SCORERS.
+
+    calibration: str, optional
+        For classifiers without probability estimates: 'sigmoid' or
+        'isotonic' calibrators fitted on the inner held-out decision
+        values of the selected parameters, without extra fits. See
+        calibration.DecisionCalibrator.
+
+    n_jobs: int
+        Number of outer folds run at the same time.
+
+    collectors: list of profiling.ProfileCollector, optional
+        Receive the timings of the outer stages. The inner loop of each
+        outer fold is one 'inner_loop' stage.
+
+    measure_memory: bool
+        See profiling.Profiler.
+    """
+
+    def __init__(self, clfmethod, prefs=None, prefs_thrs=(95,),
+                 thr_method='robust', cvmethod='10', inner_cvmethod='5',
+                 stratified=True, scaler=StandardScaler(),
+                 inner_preprocessing='downdate', gs_scoring='accuracy',
+                 calibration='sigmoid', n_jobs=1, collectors=None,
+                 measure_memory=True):
+        if inner_preprocessing not in INNER_PREPROCESSING:
+            raise ValueError('Unknown inner_preprocessing {}, use one of '
+                             '{}.'.format(inner_preprocessing,
+                                          INNER_PREPROCESSING))
+        if prefs is not None and prefs not in PREFS_METHODS:
+            raise ValueError('Unknown pre-feature selection method {}, use one '
+                             'of {}.'.format(prefs, PREFS_METHODS))
+
+        self.clfmethod = clfmethod
+        self.prefs = prefs
+        self.prefs_thrs = list(prefs_thrs) if prefs is not None else [None]
+        self.thr_method = thr_method
+        self.cvmethod = cvmethod
+        self.inner_cvmethod = inner_cvmethod
+        self.stratified = stratified
+        self.scaler = scaler
+        self.inner_preprocessing = inner_preprocessing
+        self.gs_scoring = gs_scoring
+        self.calibration = calibration
+        self.n_jobs = n_jobs
+        self.collectors = collectors
+        self.measure_memory = measure_memory
+
+        self.n_grams = 0
+
+        from .sklearn_utils import get_clfmethod
+        self._classifier, self._param_grid = get_clfmethod(clfmethod)
+        self._points = _param_points(self._param_grid)
+
+    @property
+    def grid(self):
+        """List of the candidate parameters, one dict per prefs threshold
+        and classifier grid point, in the order of the inner scores."""
+        grid = []
+        for thr in self.prefs_thrs:
+            for point in self._points:
+                params = dict(point)
+                if thr is not None:
+                    params['prefs_thr'] = thr
+                grid.append(params)
+        return grid
+
+    def _kernel_args(self, point):
+        """Return the (kernel, gamma, degree, coef0) of the grid point if
+        the classifier is an SVC with a kernel that can be precomputed,
+        else None."""
+        from sklearn.svm import SVC
+
+        if not isinstance(self._classifier, SVC):
+            return None
+        args = tuple(point.get(k, getattr(self._classifier, k))
+                     for k in KERNEL_PARAMS)
+        if args[0] not in ('linear', 'rbf', 'poly'):
+            return None
+        return args
+
+    def _estimator(self, point, precomputed):
+        params = dict(point)
+        if precomputed:
+            for k in KERNEL_PARAMS:
+                params.pop(k, None)
+            params['kernel'] = 'precomputed'
+        return clone(self._classifier).set_params(**params)
+
+    def _kernel_groups(self):
+        """Return a list of (kernel args, grid point indices), the grid
+        points that share each kernel matrix."""
+        groups = collections.OrderedDict()
+        for p, point in enumerate(self._points):
+            groups.setdefault(self._kernel_args(point), []).append(p)
+        return list(groups.items())
+
+    def _scorer(self):
+        if callable(self.gs_scoring):
+            return self.gs_scoring
+        from sklearn.metrics.scorer import SCORERS
+        return SCORERS[self.gs_scoring]
+
+    def _masks(self, stats):
+        """Return the selected features mask of each threshold, None for
+        all the features."""
+        if self.prefs is None:
+            return [None]
+
+        scores = stats.scores(self.prefs)
+        masks = []
+        for thr in self.prefs_thrs:
+            mask = apply_threshold(scores.copy(), thr, self.thr_method) != 0
+            if not mask.any():
+                log.debug('No feature passes the {} threshold {}, using the '
+                          'best one.'.format(self.prefs, thr))
+                mask[np.argmax(scores)] = True
+            masks.append(mask)
+        return masks
+
+    def _transform(self, x, prep, mask):
+        """Return the imputed, scaled and selected rows of x."""
+        means, center, scale = prep
+        if mask is None:
+            z = np.array(x, dtype=np.float64)
+            mask = slice(None)
+        else:
+            z = np.asarray(x[:, mask], dtype=np.float64)
+        _impute(z, means[mask])
+        if center is not None:
+            z -= center[mask]
+        if scale is not None:
+            z /= scale[mask]
+        return z
+
+    def _design(self, designs, x, prep, mask):
+        """Return the _Design of x with mask, from designs if it was already
+        built with the same preprocessing."""
+        key = None if mask is None else tuple(np.packbits(mask).tolist())
+        if key not in designs:
+            designs[key] = _Design(self._transform(x, prep, mask))
+        return designs[key]
+
+    def _kernel_matrix(self, design, kernel_args):
+        return _kernel(*(kernel_args + (design.gram, design.sq_norms,
+                                        design.sq_norms, design.z.shape[1])))
+
+    def _inner_fold(self, x, y, tr, te, prep, masks, designs, scores, decisions,
+                    n_classes, profiler, key):
+        """Fit and score all the candidates on one inner fold of the outer
+        training rows x, y. Fill the row of scores and the held-out
+        decision values."""
+        scorer = self._scorer()
+        groups = self._kernel_groups()
+        n_points = len(self._points)
+
+        for t, mask in enumerate(masks):
+            with profiler.stage(key, 'transform'):
+                design = self._design(designs, x, prep, mask)
+
+            for kernel_args, point_idx in groups:
+                if kernel_args is not None:
+                    with profiler.stage(key, 'kernel'):
+                        k = self._kernel_matrix(design, kernel_args)
+                        x_tr, x_te = k[np.ix_(tr, tr)], k[np.ix_(te, tr)]
+                else:
+                    x_tr, x_te = design.z[tr], design.z[te]
+
+                for p in point_idx:
+                    est = self._estimator(self._points[p], kernel_args is not None)
+                    with profiler.stage(key, 'fit'):
+                        est.fit(x_tr, y[tr])
+                    with profiler.stage(key, 'score'):
+                        c = t * n_points + p
+                        scores[c] = scorer(est, x_te, y[te])
+                        if decisions is not None and decisions[c] is not None:
+                            if len(est.classes_) == n_classes:
+                                decisions[c][te] = class_scores(
+                                    est.decision_function(x_te), n_classes)
+                            else:
+                                decisions[c] = None
+
+    def _needs_calibration(self):
+        if self.calibration is None:
+            return False
+        point = self._points[0]
+        est = self._estimator(point, self._kernel_args(point) is not None)
+        return not has_native_proba(est) and hasattr(est, 'decision_function')
+
+    def outer_fold(self, samples, targets, train, test, fold, classes=None,
+                   profiler=None, inner_profiler=None):
+        """Run the inner loop of one outer fold, refit the best candidate on
+        the outer training set and predict the outer test set.
+
+        Parameters
+        ----------
+        classes: array, optional
+            Labels of all the targets, by default np.unique(targets).
+
+        Returns
+        -------
+        fold, predictions, probabilities, test targets, best parameters,
+        features importance, inner scores, number of Gram matrices computed
+        """
+        if classes is None:
+            classes = np.unique(targets)
+        if profiler is None:
+            profiler = Profiler(measure_memory=False)
+        if inner_profiler is None:
+            inner_profiler = Profiler(measure_memory=False)
+
+        from .sklearn_utils import get_cv_method
+
+        x, y = samples[train], targets[train]
+        n_cands = len(self.prefs_thrs) * len(self._points)
+
+        with profiler.fold(fold):
+            with profiler.stage(fold, 'stats'):
+                stats = ClassStats.from_rows(x, y, classes)
+                prep = stats.preprocessing(self.scaler)
+
+            with profiler.stage(fold, 'select'):
+                masks = self._masks(stats)
+
+            inner = list(get_cv_method(y, self.inner_cvmethod, self.stratified))
+            inner_scores = np.zeros((len(inner), n_cands))
+            decisions = None
+            if self._needs_calibration():
+                n_scores = 1 if len(classes) == 2 else len(classes)
+                decisions = [np.zeros((len(y), n_scores)) for _ in range(n_cands)]
+
+            #designs of the outer training set, shared by the inner folds
+            #with 'outer' preprocessing and by the refit
+            outer_designs = {}
+            all_designs = [outer_designs]
+            with profiler.stage(fold, 'inner_loop'):
+                for j, (tr, te) in enumerate(inner):
+                    key = (fold, j)
+                    with inner_profiler.fold(key):
+                        if self.inner_preprocessing == 'outer':
+                            inner_prep, inner_masks = prep, masks
+                            designs = outer_designs
+                        else:
+                            with inner_profiler.stage(key, 'downdate'):
+                                inner_stats = stats.downdate(x[te], y[te])
+                                inner_prep = inner_stats.preprocessing(self.scaler)
+                            with inner_profiler.stage(key, 'select'):
+                                inner_masks = self._masks(inner_stats)
+                            designs = {}
+                            all_designs.append(designs)
+
+                        self._inner_fold(x, y, tr, te, inner_prep, inner_masks,
+                                         designs, inner_scores[j], decisions,
+                                         len(classes), inner_profiler, key)
+
+            best = int(np.argmax(inner_scores.mean(axis=0)))
+            t, p = divmod(best, len(self._points))
+            best_params = self.grid[best]
+            point = self._points[p]
+            kernel_args = self._kernel_args(point)
+            log.debug('Fold {} best parameters: {}'.format(fold, best_params))
+
+            with profiler.stage(fold, 'transform'):
+                design = self._design(outer_designs, x, prep, masks[t])
+                z_test = self._transform(samples[test], prep, masks[t])
+
+            est = self._estimator(point, kernel_args is not None)
+            if kernel_args is not None:
+                with profiler.stage(fold, 'kernel'):
+                    x_train = self._kernel_matrix(design, kernel_args)
+                    sq_test = np.einsum('ij,ij->i', z_test, z_test)
+                    x_test = _kernel(*(kernel_args +
+                                       (np.dot(z_test, design.z.T), sq_test,
+                                        design.sq_norms, design.z.shape[1])))
+            else:
+                x_train, x_test = design.z, z_test
+
+            with profiler.stage(fold, 'fit'):
+                est.fit(x_train, y)
+
+            with profiler.stage(fold, 'predict'):
+                preds = est.predict(x_test)
+
+            calibrator = None
+            if decisions is not None and decisions[best] is not None:
+                with profiler.stage(fold, 'calibrate'):
+                    calibrator = DecisionCalibrator(self.calibration).fit(
+                        decisions[best], y, est.classes_)
+
+            with profiler.stage(fold, 'predict_proba'):
+                if calibrator is not None:
+                    probs = calibrator.predict_proba(est.decision_function(x_test))
+                elif has_native_proba(est):
+                    probs = est.predict_proba(x_test)
+                else:
+                    probs = None
+
+            imp = getattr(est, 'feature_importances_', None)
+
+        #counted here rather than on self, the folds may run in threads
+        n_grams = sum(d._gram is not None
+                      for designs in all_designs for d in designs.values())
+
+        return (fold, preds, probs, targets[test], best_params, imp,
+                inner_scores, n_grams)
+
+    def cross_validation(self, samples, targets, cvmethod=None):
+        """Run the nested cross-validation of samples and targets.
+
+        Parameters
+        ----------
+        samples: array_like
+            Shape: n_samples x n_features
+
+        targets: array_like
+
+        cvmethod: sklearn.cross_validation object, optional
+            Outer folds, by default from self.cvmethod.
+
+        Returns
+        -------
+        NestedCVResult
+        """
+        from .sklearn_utils import get_cv_method
+
+        samples = np.asarray(samples)
+        targets = np.asarray(targets)
+        cv = cvmethod if cvmethod is not None else get_cv_method(targets,
+                                                                 self.cvmethod,
+                                                                 self.stratified)
+        self.classes_ = np.unique(targets)
+
+        n_cands = len(self.grid)
+        profiler = Profiler(self.collectors, n_cands, self.measure_memory)
+        inner_profiler = Profiler(None, n_cands, self.measure_memory)
+        profiler.start()
+        inner_profiler.start()
+
+        folds = list(cv)
+        if self.n_jobs == 1:
+            fold_results = [self.outer_fold(samples, targets, train, test, fold,
+                                            self.classes_, profiler, inner_profiler)
+                            for fold, (train, test) in enumerate(folds)]
+        else:
+            from joblib import Parallel, delayed
+            fold_results = Parallel(n_jobs=self.n_jobs, backend='threading')(
+                delayed(self.outer_fold)(samples, targets, train, test, fold,
+                                         self.classes_, profiler, inner_profiler)
+                for fold, (train, test) in enumerate(folds))
+
+        inner_profile = inner_profiler.end()
+        profile = profiler.end()
+
+        preds = collections.OrderedDict()
+        probs = collections.OrderedDict()
+        truth = collections.OrderedDict()
+        best_pars = collections.OrderedDict()
+        importance = collections.OrderedDict()
+        inner_scores = collections.OrderedDict()
+        self.n_grams = 0
+        for fold, pred, prob, y_test, params, imp, scores, n_grams in fold_results:
+            preds[fold] = pred
+            probs[fold] = prob
+            truth[fold] = y_test
+            best_pars[fold] = params
+            importance[fold] = imp
+            inner_scores[fold] = scores
+            self.n_grams += n_grams
+
+        if any(p is None for p in probs.values()):
+            probs = None
+        if all(i is None for i in importance.values()):
+            importance = None
+
+        if isinstance(cv, LeaveOneOut):
+            truth, preds, probs, labels = enlist_cv_results_from_dict(truth, preds, probs)
+            metrics = ClassificationMetrics(*classification_metrics(truth, preds,
+                                                                    probs, labels))
+        else:
+            labels = self.classes_
+            fold_metrics = get_cv_classification_metrics(truth, preds, probs)
+            metrics = (ClassificationMetrics(*tuple(fold_metrics.mean(axis=0))),
+                       ClassificationMetrics(*tuple(fold_metrics.std(axis=0))))
+
+        result = ClassificationResult(preds, probs, truth, best_pars, cv,
+                                      importance, targets, labels, profile)
+
+        log.info('Nested cross-validation of {}: {} Gram matrices, inner '
+                 'loop {}'.format(self.clfmethod, self.n_grams, inner_profile))
+
+        return NestedCVResult(result, metrics, self.grid, inner_scores,
+                              inner_profile)
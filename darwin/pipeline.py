@@ -18,23 +18,71 @@
 import logging
 
 import numpy as np
-from scipy import stats
 from collections import OrderedDict
-from sklearn.grid_search import GridSearchCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.cross_validation import LeaveOneOut
 
 from .utils.printable import Printable
+from .profiling import Profiler
+from .calibration import has_native_proba, can_calibrate, fit_calibrator
 from .sklearn_utils import (get_pipeline,
                             get_cv_method)
 
-from .results import (ClassificationResult, ClassificationMetrics,
+from .results import (ClassificationResult, ClassificationMetrics, FoldResult,
                       classification_metrics, get_cv_classification_metrics,
+                      get_bootstrap_confidence_intervals,
                       enlist_cv_results_from_dict, enlist_cv_results)
 
 log = logging.getLogger(__name__)
 
 
+def count_grid_points(param_grid):
+    """Return the number of parameter combinations in param_grid, a dict
+    or list of dicts of parameter name -> list of values."""
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+
+    n_points = 0
+    for grid in param_grid:
+        points = 1
+        for values in grid.values():
+            points *= len(values) if isinstance(values, (list, tuple)) else 1
+        n_points += points
+    return n_points
+
+
+def impute_nan_mean(x_train, x_test):
+    """Replace in place the NaN values of x_train and x_test by the mean
+    of each feature in x_train.
+
+    The means are accumulated in float64 and cast to the dtype of the data,
+    so float32 data stays float32.
+
+    Parameters
+    ----------
+    x_train: numpy array of floats
+        Shape: n_train_samples x n_features
+
+    x_test: numpy array of floats
+        Shape: n_test_samples x n_features
+
+    Returns
+    -------
+    x_train, x_test
+    """
+    nan_train = np.isnan(x_train)
+    nan_test = np.isnan(x_test)
+    if not nan_train.any() and not nan_test.any():
+        return x_train, x_test
+
+    nan_mean = np.nanmean(x_train, axis=0, dtype=np.float64).astype(x_train.dtype)
+
+    x_train[nan_train] = np.take(nan_mean, np.where(nan_train)[1])
+    x_test[nan_test] = np.take(nan_mean, np.where(nan_test)[1])
+
+    return x_train, x_test
+
+
 #Classification Pipeline
 class ClassificationPipeline(Printable):
     """This class wraps a classification pipeline with grid search.
@@ -86,12 +134,48 @@ class ClassificationPipeline(Printable):
 
     gs_scoring: str
         Grid search scoring objective function.
+
+    dtype: numpy dtype, optional
+        Floating point type of the data along the pipeline. Use np.float32
+        to halve the memory used; the imputation statistics are still
+        accumulated in float64. By default, float64.
+
+    collectors: list of profiling.ProfileCollector, optional
+        Callbacks that receive the timings of each stage of each fold
+        during cross_validation. The whole profile is also returned in the
+        ClassificationResult.
+
+    measure_memory: bool
+        If True, record the change of the process resident memory in each
+        stage, see profiling.Profiler.
+
+    backend: distributed.TaskBackend, optional
+        Backend that runs the cross-validation folds, e.g., a
+        distributed.FileQueueBackend to run them in worker processes on
+        this or other hosts. If None, the folds are run in this process.
+
+    n_bootstrap: int
+        Number of bootstrap resamples of the pooled out-of-fold predictions
+        used for the confidence intervals of the metrics computed after
+        cross_validation, see result_confidence_intervals. 0 to disable.
+
+    calibration: str, optional
+        Probability estimates of classifiers without predict_proba, e.g.,
+        SVC without probability=True: 'sigmoid' (Platt) or 'isotonic'
+        calibration of the decision values. The calibrator of each fold is
+        fitted on held-out decision values of its training set, see
+        calibrators. None to have no probabilities for those classifiers.
+
+    calibration_cv: int
+        Number of folds of the training set used to fit each calibrator.
     """
 
     def __init__(self, clfmethod, n_feats, fsmethod1=None, fsmethod2=None,
                  fsmethod1_kwargs={}, fsmethod2_kwargs={}, clfmethod_kwargs={},
                  scaler=StandardScaler(), cvmethod='10', stratified=True,
-                 n_cpus=1, gs_scoring='accuracy'):
+                 n_cpus=1, gs_scoring='accuracy', dtype=None, collectors=None,
+                 measure_memory=True, backend=None, n_bootstrap=1000,
+                 calibration='sigmoid', calibration_cv=3):
 
         self.n_feats = n_feats
         self.fsmethod1 = fsmethod1
@@ -114,6 +198,13 @@ class ClassificationPipeline(Printable):
         self.scaler = scaler
         self.n_cpus = n_cpus
         self.gs_scoring = gs_scoring
+        self.dtype = dtype
+        self.collectors = collectors
+        self.measure_memory = measure_memory
+        self.backend = backend
+        self.n_bootstrap = n_bootstrap
+        self.calibration = calibration
+        self.calibration_cv = calibration_cv
 
         self.reset()
 
@@ -123,6 +214,7 @@ class ClassificationPipeline(Printable):
         You can use this to modify parameters of this object and this will call
          the necessary functions to remake the pipeline.
         """
+        from sklearn.grid_search import GridSearchCV
 
         self._pipe = None
         self._params = None
@@ -130,6 +222,8 @@ class ClassificationPipeline(Printable):
         self._gs = None
         self._results = None
         self._metrics = None
+        self._intervals = None
+        self._calibrators = {}
 
         self._pipe, self._params = get_pipeline(self.fsmethod1, self.fsmethod2,
                                                 self.clfmethod)
@@ -138,7 +232,7 @@ class ClassificationPipeline(Printable):
         self._gs = GridSearchCV(self._pipe, self._params, n_jobs=self.n_cpus,
                                 verbose=0, scoring=self.gs_scoring)
 
-    def cross_validation(self, samples, targets, cvmethod=None):
+    def cross_validation(self, samples, targets, cvmethod=None, plan=None):
         """Performs a cross-validation against a dataset and its labels.
 
         Parameters
@@ -150,16 +244,30 @@ class ClassificationPipeline(Printable):
 
         cv: sklearn.crossvalidation class
 
+        plan: cvplan.CVPlan, optional
+            Prepared splits and preprocessing of the dataset, shared with
+            other pipelines. If given, samples, targets and cvmethod are
+            taken from it and the scaler of this pipeline is not used.
+            A backend only uses its splits.
+
         Returns
         -------
         Classification_Results, Classification Metrics
         """
-        if cvmethod is None:
+        if plan is not None:
+            samples, targets = plan.samples, plan.targets
+            self._cv = plan.cv
+        elif cvmethod is None:
             self._cv = get_cv_method(targets, self.cvmethod, self.stratified)
         else:
             self._cv = cvmethod
 
         self.n_feats = samples.shape[1]
+        self._calibrators = {}
+
+        dtype = np.dtype(self.dtype if self.dtype is not None else np.float64)
+        samples = np.asarray(samples, dtype=dtype)
+        folds = plan.folds if plan is not None else list(self._cv)
 
         #We use dictionaries to save each fold classification result
         #because we will need to identify all sets of results to one fold.
@@ -171,47 +279,167 @@ class ClassificationPipeline(Printable):
         best_pars = OrderedDict()
         importance = OrderedDict()
 
-        fold_count = 0
-        for train, test in self._cv:
-            log.debug('Processing fold ' + str(fold_count))
+        profiler = Profiler(self.collectors, count_grid_points(self._params),
+                            self.measure_memory)
+        profiler.start()
+
+        if self.backend is None:
+            fold_results = [self.fit_fold(samples, targets, train, test,
+                                          fold_count, profiler,
+                                          plan.fold_data(fold_count)
+                                          if plan is not None else None)
+                            for fold_count, (train, test) in enumerate(folds)]
+        else:
+            fold_results = self.backend.run_folds(self, samples, targets,
+                                                  folds, profiler)
+
+        for fold_result in fold_results:
+            fold_count = fold_result.fold
+            preds[fold_count] = fold_result.predictions
+            probs[fold_count] = fold_result.probabilities
+            truth[fold_count] = fold_result.cv_targets
+            best_pars[fold_count] = fold_result.best_parameters
+            importance[fold_count] = fold_result.features_importance
+
+        profile = profiler.end()
+
+        #summarize results
+        has_values = lambda adict: bool([i for i in adict if adict[i] is not None])
+
+        if not has_values(probs):
+            probs = None
+        if not has_values(importance):
+            importance = None
+
+        if isinstance(self._cv, LeaveOneOut):
+            truth, preds, probs, labels = enlist_cv_results_from_dict(truth, preds, probs)
+        else:
+            labels = np.unique(targets)
 
-            #data cv separation
-            x_train, x_test, \
-            y_train, y_test = samples[train, :], samples[test, :], \
-                              targets[train], targets[test]
+        self._results = ClassificationResult(preds, probs, truth, best_pars, self._cv, importance, targets, labels,
+                                             profile)
 
-            # We correct NaN values in x_train and x_test
-            nan_mean = stats.nanmean(x_train)
-            nan_train = np.isnan(x_train)
-            nan_test = np.isnan(x_test)
+        #calculate performance metrics
+        self._metrics = self.result_metrics()
+        if self.n_bootstrap:
+            self._intervals = self.result_confidence_intervals()
+
+        return self._results, self._metrics
+
+    def get_spec(self):
+        """Return a dict with the constructor arguments of this pipeline,
+        except the profile collectors, so an equivalent pipeline can be
+        built in another process with ClassificationPipeline(**spec)."""
+        return dict(clfmethod=self.clfmethod, n_feats=self.n_feats,
+                    fsmethod1=self.fsmethod1, fsmethod2=self.fsmethod2,
+                    fsmethod1_kwargs=self.fsmethod1_kwargs,
+                    fsmethod2_kwargs=self.fsmethod2_kwargs,
+                    clfmethod_kwargs=self.clfmethod_kwargs,
+                    scaler=self.scaler, cvmethod=self.cvmethod,
+                    stratified=self.stratified, n_cpus=self.n_cpus,
+                    gs_scoring=self.gs_scoring, dtype=self.dtype,
+                    measure_memory=self.measure_memory,
+                    n_bootstrap=self.n_bootstrap,
+                    calibration=self.calibration,
+                    calibration_cv=self.calibration_cv)
+
+    def _fold_calibrator(self, x_train, y_train, fold):
+        """Return the calibrator of the best estimator of the last grid
+        search on x_train, None if a class is too small to calibrate."""
+        if not can_calibrate(y_train, self.calibration_cv):
+            log.warning('Fold {}: a class has fewer than {} training samples, '
+                        'the probabilities are not calibrated.'.format(
+                            fold, self.calibration_cv))
+            return None
+
+        calibrator = fit_calibrator(self._gs.best_estimator_, x_train, y_train,
+                                    self.calibration, self.calibration_cv)
+        self._calibrators[fold] = calibrator
+        return calibrator
+
+    def _needs_calibration(self):
+        best = self._gs.best_estimator_
+        return (self.calibration is not None and not has_native_proba(best)
+                and hasattr(best, 'decision_function'))
+
+    @property
+    def calibrators(self):
+        """Dict of fold -> calibration.DecisionCalibrator of the last
+        cross_validation."""
+        return self._calibrators
+
+    def fit_fold(self, samples, targets, train, test, fold, profiler=None,
+                 prepared=None):
+        """Run the imputation, scaling, grid search and prediction of one
+        cross-validation fold.
+
+        Parameters
+        ----------
+        samples: numpy array
+            Shape: n_samples x n_features, already in the pipeline dtype.
+
+        targets: numpy array
 
-            #remove Nan values
-            x_test[nan_test] = 0
-            x_test = x_test + nan_test*nan_mean
+        train: array of ints or bools
+            Indices of the training samples.
 
-            x_train[nan_train] = 0
-            x_train = x_train + nan_train*nan_mean
+        test: array of ints or bools
+            Indices of the test samples.
 
-            #y_train = y_train.ravel()
-            #y_test = y_test.ravel()
+        fold: int
+            Fold number.
 
-            #scaling
-            #if clfmethod == 'linearsvc' or clfmethod == 'onevsonesvc':
-            if self.scaler is not None:
-                log.debug('Normalizing data with: {}'.format(str(self.scaler)))
-                x_train = self.scaler.fit_transform(x_train)
-                x_test = self.scaler.transform(x_test)
+        profiler: profiling.Profiler, optional
+            If None, the stages of the fold are not recorded.
+
+        prepared: tuple, optional
+            (x_train, x_test, y_train, y_test) already imputed and scaled,
+            e.g., from cvplan.CVPlan.fold_data. If given, samples, targets,
+            train and test are not used.
+
+        Returns
+        -------
+        results.FoldResult
+        """
+        if profiler is None:
+            profiler = Profiler(measure_memory=False)
+
+        log.debug('Processing fold ' + str(fold))
+
+        with profiler.fold(fold):
+            if prepared is not None:
+                with profiler.stage(fold, 'split'):
+                    x_train, x_test, y_train, y_test = prepared
+            else:
+                dtype = samples.dtype
+
+                #data cv separation
+                with profiler.stage(fold, 'split'):
+                    x_train, x_test, \
+                    y_train, y_test = samples[train, :], samples[test, :], \
+                                      targets[train], targets[test]
+
+                # We correct NaN values in x_train and x_test
+                with profiler.stage(fold, 'impute'):
+                    x_train, x_test = impute_nan_mean(x_train, x_test)
+
+                #scaling
+                if self.scaler is not None:
+                    log.debug('Normalizing data with: {}'.format(str(self.scaler)))
+                    with profiler.stage(fold, 'scale'):
+                        x_train = self.scaler.fit_transform(x_train).astype(dtype, copy=False)
+                        x_test = self.scaler.transform(x_test).astype(dtype, copy=False)
 
             #do it
-            log.debug('Running grid search for fold {}'.format(fold_count))
-            self._gs.fit(x_train, y_train)
+            log.debug('Running grid search for fold {}'.format(fold))
+            with profiler.stage(fold, 'fit'):
+                self._gs.fit(x_train, y_train)
 
             log.debug('Predicting on test set')
 
             #predictions
-            preds[fold_count] = self._gs.predict(x_test)
-            truth[fold_count] = y_test
-            best_pars[fold_count] = self._gs.best_params_
+            with profiler.stage(fold, 'predict'):
+                preds = self._gs.predict(x_test)
 
             #features importances
             if hasattr(self._gs.best_estimator_, 'support_vectors_'):
@@ -221,37 +449,26 @@ class ClassificationPipeline(Printable):
             else:
                 imp = None
 
-            importance[fold_count] = imp
-
-            #best grid-search parameters
-            try:
-                probs[fold_count] = self._gs.predict_proba(x_test)
-            except Exception as exc:
-                probs[fold_count] = None
-
-            log.debug('Result: {} classifies as {}.'.format(y_test, preds[fold_count]))
-
-            fold_count += 1
-
-        #summarize results
-        has_values = lambda adict: bool([i for i in adict if adict[i] is not None])
+            #probabilities, calibrated if the classifier has none
+            calibrator = None
+            if self._needs_calibration():
+                with profiler.stage(fold, 'calibrate'):
+                    calibrator = self._fold_calibrator(x_train, y_train, fold)
 
-        if not has_values(probs):
-            probs = None
-        if not has_values(importance):
-            importance = None
+            with profiler.stage(fold, 'predict_proba'):
+                if calibrator is not None:
+                    decision = self._gs.best_estimator_.decision_function(x_test)
+                    probs = calibrator.predict_proba(decision)
+                elif has_native_proba(self._gs.best_estimator_):
+                    probs = self._gs.predict_proba(x_test)
+                else:
+                    log.debug('{} has no probability estimates.'.format(self.clfmethod))
+                    probs = None
 
-        if isinstance(self._cv, LeaveOneOut):
-            truth, preds, probs, labels = enlist_cv_results_from_dict(truth, preds, probs)
-        else:
-            labels = np.unique(targets)
+        log.debug('Result: {} classifies as {}.'.format(y_test, preds))
 
-        self._results = ClassificationResult(preds, probs, truth, best_pars, self._cv, importance, targets, labels)
-
-        #calculate performance metrics
-        self._metrics = self.result_metrics()
-
-        return self._results, self._metrics
+        return FoldResult(fold, preds, probs, y_test, self._gs.best_params_,
+                          imp)
 
     def result_metrics(self, classification_results=None, cvmethod=None):
         """Return the Accuracy, Sensitivity, Specificity, Precision, F1-Score
@@ -309,3 +526,48 @@ class ClassificationPipeline(Printable):
             stds = ClassificationMetrics(*tuple(std_metrics))
 
             return avgs, stds
+
+    def result_confidence_intervals(self, classification_results=None,
+                                    n_boot=None, alpha=0.05, random_state=0):
+        """Return percentile bootstrap confidence intervals of the Accuracy,
+        Sensitivity, Specificity, Precision, F1-Score and Area-under-ROC of
+        the pooled out-of-fold predictions of classification_results, or
+        self._results if None.
+
+        Parameters
+        ----------
+        classification_results: results.Classification_Result
+
+        n_boot: int, optional
+            Number of resamples, by default self.n_bootstrap.
+
+        alpha: float
+            The intervals have 1 - alpha coverage.
+
+        random_state: int or numpy RandomState
+            Fixed by default so the intervals of a result are reproducible.
+
+        Returns
+        -------
+        lower, upper: results.Classification_Metrics
+        """
+        cr = classification_results
+        if cr is None:
+            if self._results is None:
+                log.error('Cross-validation should be performed before this.')
+                return None
+            cr = self._results
+
+        if n_boot is None:
+            n_boot = self.n_bootstrap or 1000
+
+        return get_bootstrap_confidence_intervals(cr.cv_targets, cr.predictions,
+                                                  cr.probabilities, n_boot,
+                                                  alpha, random_state,
+                                                  self.n_cpus)
+
+    @property
+    def confidence_intervals(self):
+        """Lower and upper ClassificationMetrics of the last
+        cross_validation, None if n_bootstrap is 0."""
+        return self._intervals
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and memory instrumentation of the ClassificationPipeline stages.
+"""
+import os
+import sys
+import time
+import logging
+import collections
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+#Stages of each cross-validation fold, in order
+PIPELINE_STAGES = ['split', 'impute', 'scale', 'fit', 'predict',
+                   'calibrate', 'predict_proba']
+
+
+def current_memory():
+    """Return the current resident memory of this process in bytes, or
+    None if it can not be measured in this platform."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def peak_memory():
+    """Return the peak resident memory of this process so far, over its
+    whole lifetime, in bytes, or None if it can not be measured in this
+    platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes, OS X bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class StageRecord(collections.namedtuple('Stage_Record',
+                                         ['fold', 'stage', 'seconds',
+                                          'memory_delta'])):
+    """
+    Namedtuple with the duration of one stage of one fold and the change of
+    the process resident memory in bytes between its start and end, None if
+    not measured. Memory allocated and released within the stage, or by
+    other threads, is not told apart.
+    """
+    pass
+
+
+class PipelineProfile(object):
+    """Timing records of one ClassificationPipeline.cross_validation run.
+
+    Parameters
+    ----------
+    n_grid_points: int
+        Number of parameter combinations of the grid search.
+    """
+
+    def __init__(self, n_grid_points=None):
+        self.n_grid_points = n_grid_points
+        self.records = []
+        self.fold_seconds = collections.OrderedDict()
+        self.total_seconds = None
+        #peak resident memory of the process so far when the run ended
+        self.peak_memory = None
+
+    def add(self, record):
+        self.records.append(record)
+
+    @property
+    def n_folds(self):
+        return len(self.fold_seconds)
+
+    def stage_seconds(self):
+        """Return an OrderedDict with the total seconds of each stage
+        across folds."""
+        totals = collections.OrderedDict()
+        for record in self.records:
+            totals[record.stage] = totals.get(record.stage, 0.) + record.seconds
+        return totals
+
+    def stage_memory_delta(self):
+        """Return an OrderedDict with the total change of resident memory in
+        bytes of each measured stage across folds."""
+        totals = collections.OrderedDict()
+        for record in self.records:
+            if record.memory_delta is not None:
+                totals[record.stage] = totals.get(record.stage, 0) + record.memory_delta
+        return totals
+
+    def as_dict(self):
+        """Return the profile as a dict of builtin types, e.g., to
+        serialize it as JSON."""
+        return {'n_grid_points': self.n_grid_points,
+                'n_folds': self.n_folds,
+                'total_seconds': self.total_seconds,
+                'peak_memory': self.peak_memory,
+                'stage_seconds': dict(self.stage_seconds()),
+                'stage_memory_delta': dict(self.stage_memory_delta()),
+                'fold_seconds': list(self.fold_seconds.values()),
+                'records': [dict(r._asdict()) for r in self.records]}
+
+    def __repr__(self):
+        stages = ', '.join('{}={:.3f}s'.format(k, v)
+                           for k, v in self.stage_seconds().items())
+        return '{}(n_folds={}, {})'.format(type(self).__name__, self.n_folds,
+                                           stages)
+
+
+class ProfileCollector(object):
+    """Base class for the callbacks that receive the records of a
+    ClassificationPipeline profile while it runs. Override any of its
+    methods."""
+
+    def on_start(self, profile):
+        pass
+
+    def on_stage(self, record):
+        pass
+
+    def on_fold_end(self, fold, seconds):
+        pass
+
+    def on_end(self, profile):
+        pass
+
+
+class LoggingCollector(ProfileCollector):
+    """Logs each stage and the profile summary."""
+
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def on_stage(self, record):
+        log.log(self.level, 'Fold {} {}: {:.4f} s'.format(record.fold,
+                                                          record.stage,
+                                                          record.seconds))
+
+    def on_end(self, profile):
+        log.log(self.level, 'Cross-validation profile: {}'.format(profile))
+
+
+class Profiler(object):
+    """Measures the stages of a cross-validation and notifies the
+    collectors.
+
+    Parameters
+    ----------
+    collectors: list of ProfileCollector, optional
+
+    n_grid_points: int, optional
+
+    measure_memory: bool
+        If True, sample the process resident memory at the start and end of
+        each stage, and its peak memory at the end of the run.
+    """
+
+    def __init__(self, collectors=None, n_grid_points=None,
+                 measure_memory=True):
+        self.collectors = list(collectors or [])
+        self.measure_memory = measure_memory
+        self.profile = PipelineProfile(n_grid_points)
+        self._start = None
+
+    def _notify(self, event, *args):
+        for collector in self.collectors:
+            try:
+                getattr(collector, event)(*args)
+            except Exception:
+                log.exception('Error in profile collector {}.'.format(collector))
+
+    def start(self):
+        self._start = time.time()
+        self._notify('on_start', self.profile)
+
+    def end(self):
+        self.profile.total_seconds = time.time() - self._start
+        if self.measure_memory:
+            self.profile.peak_memory = peak_memory()
+        self._notify('on_end', self.profile)
+        return self.profile
+
+    @contextmanager
+    def stage(self, fold, name):
+        """Context manager that records the duration of stage name of fold."""
+        start = time.time()
+        start_mem = current_memory() if self.measure_memory else None
+        try:
+            yield
+        finally:
+            delta = None
+            if start_mem is not None:
+                end_mem = current_memory()
+                delta = end_mem - start_mem if end_mem is not None else None
+            record = StageRecord(fold, name, time.time() - start, delta)
+            self.profile.add(record)
+            self._notify('on_stage', record)
+
+    def add_fold(self, fold, records, seconds):
+        """Add the stage records and duration of a fold measured elsewhere,
+        e.g., in a worker process, and notify the collectors."""
+        for record in records:
+            self.profile.add(record)
+            self._notify('on_stage', record)
+        self.profile.fold_seconds[fold] = seconds
+        self._notify('on_fold_end', fold, seconds)
+
+    @contextmanager
+    def fold(self, fold):
+        """Context manager that records the duration of a whole fold."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            self.profile.fold_seconds[fold] = seconds
+            self._notify('on_fold_end', fold, seconds)
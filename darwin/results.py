@@ -15,12 +15,8 @@ import collections
 import numpy as np
 
 #scores
-from sklearn.metrics import roc_auc_score
-from sklearn.metrics import accuracy_score
-from sklearn.metrics import precision_score
-from sklearn.metrics import recall_score
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import f1_score
+from .metrics import (multiclass_metrics, confusion_matrices,
+                      bootstrap_metrics, percentile_intervals)
 
 log = logging.getLogger(__name__)
 
@@ -28,13 +24,45 @@ log = logging.getLogger(__name__)
 #Classification results namedtuple
 classif_results_varnames = ['predictions', 'probabilities', 'cv_targets',
                             'best_parameters', 'cv_folds',
-                            'features_importance', 'targets', 'labels']
+                            'features_importance', 'targets', 'labels',
+                            'profile']
 
 
 class ClassificationResult(collections.namedtuple('Classification_Result',
                                                   classif_results_varnames)):
     """
     Namedtuple to store classification results.
+    profile is a profiling.PipelineProfile, or None.
+    """
+    def __new__(cls, predictions, probabilities, cv_targets, best_parameters,
+                cv_folds, features_importance, targets, labels, profile=None):
+        return super(ClassificationResult, cls).__new__(cls, predictions,
+                                                        probabilities,
+                                                        cv_targets,
+                                                        best_parameters,
+                                                        cv_folds,
+                                                        features_importance,
+                                                        targets, labels,
+                                                        profile)
+
+    def as_table(self):
+        """Return these results as a CVResultTable."""
+        test_indices = None
+        if self.cv_folds is not None:
+            test_indices = [test for _, test in self.cv_folds]
+            if len(test_indices) != len(self.cv_targets):
+                test_indices = None
+        return CVResultTable.from_folds(self.cv_targets, self.predictions,
+                                        self.probabilities, test_indices)
+
+
+class FoldResult(collections.namedtuple('Fold_Result',
+                                        ['fold', 'predictions', 'probabilities',
+                                         'cv_targets', 'best_parameters',
+                                         'features_importance'])):
+    """
+    Namedtuple to store the classification results of one CV fold.
+    probabilities and features_importance may be None.
     """
     pass
 
@@ -52,6 +80,202 @@ class ClassificationMetrics(collections.namedtuple('Classification_Metrics',
     pass
 
 
+class CVResultTable(object):
+    """Columnar table of cross-validation results, one row per test sample.
+
+    The rows are sorted by fold, fold_offsets[i]:fold_offsets[i+1] are the
+    rows of the i-th fold. The metrics of all folds are computed at once
+    with metrics.multiclass_metrics instead of a loop of per-fold sklearn
+    calls.
+
+    Parameters
+    ----------
+    fold: array of ints
+        Position of the fold of each row, from 0 to n_folds - 1, sorted.
+
+    truth: array
+
+    prediction: array
+
+    probability: array, optional
+        Shape: n_rows x n_classes
+
+    sample_index: array of ints, optional
+        Index of each row in the original dataset.
+
+    fold_keys: list, optional
+        Name of each fold, the keys of the per-fold dicts.
+    """
+
+    def __init__(self, fold, truth, prediction, probability=None,
+                 sample_index=None, fold_keys=None):
+        self.fold = np.asarray(fold, dtype=np.intp)
+        self.truth = np.asarray(truth)
+        self.prediction = np.asarray(prediction)
+        self.probability = None if probability is None else np.asarray(probability)
+        self.sample_index = None if sample_index is None else np.asarray(sample_index,
+                                                                         dtype=np.intp)
+
+        if len(self.fold) and np.any(np.diff(self.fold) < 0):
+            raise ValueError('The rows of a CVResultTable must be sorted by fold.')
+
+        n_folds = self.fold[-1] + 1 if len(self.fold) else 0
+        sizes = np.bincount(self.fold, minlength=n_folds)
+        self.fold_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.intp)
+        self.fold_keys = list(range(n_folds)) if fold_keys is None else list(fold_keys)
+        self.labels = np.unique(self.truth)
+
+    @classmethod
+    def from_folds(cls, cv_targets, cv_preds, cv_probs=None, test_indices=None):
+        """Build a table from per-fold results: dicts of fold -> array as in
+        ClassificationResult, lists or arrays with one row per fold.
+
+        Parameters
+        ----------
+        cv_targets:
+        cv_preds:
+        cv_probs: optional
+        test_indices: list of arrays, optional
+            Test indices of each fold.
+
+        Returns
+        -------
+        CVResultTable
+        """
+        sample_index = None
+        if test_indices is not None:
+            sample_index = np.concatenate([np.flatnonzero(idx)
+                                           if np.asarray(idx).dtype == bool
+                                           else np.asarray(idx)
+                                           for idx in test_indices])
+
+        if isinstance(cv_targets, np.ndarray) and cv_targets.ndim == 1:
+            #collated leave-one-out results, one sample per fold
+            probs = None if cv_probs is None else np.asarray(cv_probs)
+            return cls(np.arange(len(cv_targets)), cv_targets,
+                       np.asarray(cv_preds), probs, sample_index)
+
+        if isinstance(cv_targets, dict):
+            keys = list(cv_targets.keys())
+        else:
+            keys = list(range(len(cv_targets)))
+
+        truth = [np.atleast_1d(cv_targets[k]) for k in keys]
+        sizes = [len(t) for t in truth]
+        fold = np.repeat(np.arange(len(keys)), sizes)
+        truth = np.concatenate(truth) if keys else np.zeros(0)
+        preds = np.concatenate([np.atleast_1d(cv_preds[k]) for k in keys]) \
+            if keys else np.zeros(0)
+
+        probs = None
+        if cv_probs is not None and len(cv_probs) and \
+           all(cv_probs[k] is not None for k in keys):
+            probs = np.concatenate([np.atleast_2d(cv_probs[k]) for k in keys])
+
+        return cls(fold, truth, preds, probs, sample_index, keys)
+
+    @property
+    def n_folds(self):
+        return len(self.fold_offsets) - 1
+
+    def __len__(self):
+        return len(self.truth)
+
+    def fold_slice(self, i):
+        """Return the slice of the rows of the i-th fold."""
+        return slice(self.fold_offsets[i], self.fold_offsets[i + 1])
+
+    def to_dicts(self):
+        """Return OrderedDicts of fold key -> array of the truth,
+        predictions and probabilities (None if not present)."""
+        truth = collections.OrderedDict()
+        preds = collections.OrderedDict()
+        probs = None if self.probability is None else collections.OrderedDict()
+        for i, key in enumerate(self.fold_keys):
+            sl = self.fold_slice(i)
+            truth[key] = self.truth[sl]
+            preds[key] = self.prediction[sl]
+            if probs is not None:
+                probs[key] = self.probability[sl]
+        return truth, preds, probs
+
+    def confusion_matrices(self, labels=None):
+        """Return the confusion matrix of each fold, with the true labels
+        in rows, computed with a single bincount.
+
+        Parameters
+        ----------
+        labels: array, optional
+            By default, all labels present in truth or predictions.
+
+        Returns
+        -------
+        numpy array of shape n_folds x n_labels x n_labels
+        """
+        if labels is None:
+            labels = np.union1d(self.truth, self.prediction)
+        return confusion_matrices(self.truth, self.prediction, labels,
+                                  self.fold, self.n_folds)
+
+    def metrics(self, pooled=False):
+        """Return the per-class metrics of each fold, or of all the rows
+        together if pooled.
+
+        Returns
+        -------
+        metrics.MulticlassMetrics
+        """
+        groups, n_groups = self.fold, self.n_folds
+        if pooled:
+            groups, n_groups = np.zeros(len(self), dtype=np.intp), 1
+        return multiclass_metrics(self.truth, self.prediction, self.probability,
+                                  groups=groups, n_groups=n_groups)
+
+    def fold_metrics(self, average='macro'):
+        """Return a matrix of size [n_folds x 6], where 6 are: acc, sens,
+        spec, prec, f1, roc_auc. See metrics.MulticlassMetrics.summary."""
+        mets = self.metrics()
+        summary = mets.summary(average)
+        #as classification_metrics, single sample folds have AUC 0
+        summary[mets.n_samples <= 1, 5] = 0
+        return summary
+
+    def pooled_metrics(self, average='macro'):
+        """Return acc, sens, spec, prec, f1 and roc_auc of all the rows
+        together, e.g., for leave-one-out results."""
+        return tuple(self.metrics(pooled=True).summary(average)[0])
+
+    def significance(self):
+        """Return the mean Fisher exact test p-value of the confusion matrix
+        of each fold, see get_cv_significance."""
+        cms = self.confusion_matrices(self.labels)
+        return np.mean([get_confusion_matrix_fisher_significance(cm)[1]
+                        for cm in cms])
+
+    def save(self, filepath, compress=False):
+        """Save the table columns in a numpy .npz file."""
+        cols = dict(fold=self.fold, truth=self.truth,
+                    prediction=self.prediction,
+                    fold_keys=np.asarray(self.fold_keys))
+        if self.probability is not None:
+            cols['probability'] = self.probability
+        if self.sample_index is not None:
+            cols['sample_index'] = self.sample_index
+
+        savez = np.savez_compressed if compress else np.savez
+        with open(filepath, 'wb') as f:
+            savez(f, **cols)
+
+    @classmethod
+    def load(cls, filepath):
+        """Load a table saved with save."""
+        with np.load(filepath) as cols:
+            return cls(cols['fold'], cols['truth'], cols['prediction'],
+                       cols['probability'] if 'probability' in cols else None,
+                       cols['sample_index'] if 'sample_index' in cols else None,
+                       cols['fold_keys'].tolist())
+
+
 # class Result(collections.namedtuple('Result', ['metrics', 'cl', 'prefs_thr',
 #                                               'subjsf', 'presels', 'prefs',
 #                                               'fs1', 'fs2',
@@ -59,53 +283,35 @@ class ClassificationMetrics(collections.namedtuple('Classification_Metrics',
 #    pass
 
 
-def classification_metrics(targets, preds, probs=None, labels=None):
+def classification_metrics(targets, preds, probs=None, labels=None,
+                           average='macro'):
     """Calculate Accuracy, Sensitivity, Specificity, Precision, F1-Score
     and Area-under-ROC of given classification results.
 
+    For binary problems these are the metrics of the positive class, label
+    1 by default. For multi-class problems, their average over classes,
+    see metrics.MulticlassMetrics. The AUC is computed from the
+    probabilities if given, else from the predictions.
+
     Parameters
     ----------
     targets:
     preds:
-    probs:
+    probs: array, optional
+        Shape: n_samples x n_labels, e.g., the output of predict_proba.
     labels:
+    average: str
+        'macro' or 'micro', for multi-class problems.
 
     Returns
     -------
     (acc, sens, spec, prec, f1, auc)
     """
+    mets = multiclass_metrics(targets, preds, probs, labels)
+    acc, sens, spec, prec, f1, auc = mets.summary(average)[0]
 
-#    if probs != None and len(probs) > 0:
-#        fpr, tpr, thresholds = roc_curve(targets, probs[:, 1], 1)
-#        roc_auc = roc_auc_score(fpr, tpr)
-#    else:
-#        fpr, tpr, thresholds = roc_curve(targets, preds, 1)
-#        roc_auc = roc_auc_score(targets, preds)
-
-    auc = 0
-    if len(targets) > 1:
-        auc = roc_auc_score(targets, preds)
-
-    cm = confusion_matrix(targets, preds, labels)
-
-    #accuracy
-    acc = accuracy_score(targets, preds)
-
-    #recall? True Positive Rate or Sensitivity or Recall
-    sens = recall_score(targets, preds)
-
-    #precision
-    prec = precision_score(targets, preds)
-
-    #f1-score
-    f1 = f1_score(targets, preds, np.unique(targets), 1)
-
-    tnr  = 0.0
-    spec = 0.0
-    #True Negative Rate or Specificity (tn / (tn+fp))
-    if len(cm) == 2:
-        if (cm[0, 0] + cm[0, 1]) != 0:
-            spec = float(cm[0, 0])/(cm[0, 0] + cm[0, 1])
+    if len(targets) <= 1:
+        auc = 0
 
     return acc, sens, spec, prec, f1, auc
 
@@ -114,6 +320,11 @@ def enlist_cv_results_from_dict(cv_targets, cv_preds, cv_probs=None):
     """Put cv_targets, cv_preds and cv_probs in lists for performance measures.
     Also returns the set of target labels.
 
+    For leave-one-out results, i.e., all folds with one sample, the fold
+    arrays are concatenated at once: targets and preds are arrays of
+    n_samples values and probs an array of n_samples x n_classes.
+    Otherwise, they are lists with the array of each fold.
+
     Parameters
     ----------
     cv_targets: dict
@@ -124,56 +335,37 @@ def enlist_cv_results_from_dict(cv_targets, cv_preds, cv_probs=None):
     -------
     targets, preds, probs, labels
     """
-    targets = []
-    preds = []
-    labels = set()
-
-    if cv_probs is None:
-        probs = None
-    elif len(cv_probs) == 0:
-        probs = None
-    else:
-        probs = []
-
-    #see if it is a LOO result set
-    fold_len = 1
-    for fold in cv_targets:
-        if len(cv_targets[fold]) != fold_len:
-            fold_len = len(cv_targets[fold])
-            break
-
-    #read results
-    for fold in cv_targets:
+    folds = list(cv_targets.keys())
+    try:
+        targets = [cv_targets[fold] for fold in folds]
+        preds = [cv_preds[fold] for fold in folds]
+    except:
+        log.exception('Error accessing classification results.')
+        raise
+
+    probs = None
+    if cv_probs is not None and len(cv_probs) > 0:
         try:
-            if fold_len == 1:
-                trgt = cv_targets[fold][0]
-                pred = cv_preds[fold][0]
-            else:
-                trgt = cv_targets[fold]
-                pred = cv_preds[fold]
-
-            targets.append(trgt)
-            preds.append(pred)
+            probs = [cv_probs[fold] for fold in folds]
         except:
-            log.exception('Error accessing classification results.')
+            log.exception('Error accessing cv_probs.')
             raise
+        if any(prob is None for prob in probs):
+            probs = None
 
-        if cv_probs is not None:
-            try:
-                if fold_len == 1:
-                    prob = cv_probs[fold][0]
-                else:
-                    prob = cv_probs[fold]
-
-                probs.append(prob)
-            except:
-                log.exception('Error accessing cv_probs.')
-                raise
+    sizes = np.fromiter((len(trgt) for trgt in targets), dtype=np.intp,
+                        count=len(targets))
+    all_targets = np.concatenate(targets) if targets else np.zeros(0)
+    labels = np.unique(all_targets)
 
-        for t in np.unique(trgt):
-            labels.add(t)
+    #see if it is a LOO result set
+    if len(sizes) and np.all(sizes == 1):
+        targets = all_targets
+        preds = np.concatenate(preds)
+        if probs is not None:
+            probs = np.concatenate(probs)
 
-    return targets, preds, probs, list(labels)
+    return targets, preds, probs, labels
 
 
 def enlist_cv_results(cv_targets, cv_preds, cv_probs=None):
@@ -237,26 +429,45 @@ def get_cv_classification_metrics(cv_targets, cv_preds, cv_probs=None):
     array_like: metrics
     """
 
-    targets, preds, probs, labels = enlist_cv_results(cv_targets,
-                                                      cv_preds,
-                                                      cv_probs)
+    return CVResultTable.from_folds(cv_targets, cv_preds,
+                                    cv_probs).fold_metrics()
 
-    metrics = np.zeros((len(targets), 6))
 
-    for i in range(len(targets)):
-        y_true = targets[i]
-        y_pred = preds[i]
+def get_bootstrap_confidence_intervals(cv_targets, cv_preds, cv_probs=None,
+                                       n_boot=2000, alpha=0.05,
+                                       random_state=None, n_jobs=1):
+    """Return percentile bootstrap confidence intervals of the metrics of
+    the pooled out-of-fold predictions.
 
-        y_prob = None
-        if probs is not None:
-            y_prob = probs[i]
+    Parameters
+    ----------
+    cv_targets:
+    cv_preds:
+    cv_probs:
+        Per-fold results, as in ClassificationResult, or collated
+        leave-one-out arrays.
 
-        acc, sens, spec, prec, \
-        f1, roc_auc = classification_metrics(y_true, y_pred, y_prob, labels)
+    n_boot: int
+        Number of bootstrap resamples.
 
-        metrics[i, :] = np.array([acc, sens, spec, prec, f1, roc_auc])
+    alpha: float
+        The intervals have 1 - alpha coverage.
 
-    return metrics
+    random_state: int or numpy RandomState, optional
+
+    n_jobs: int
+        Number of threads, see metrics.bootstrap_metrics.
+
+    Returns
+    -------
+    lower, upper: ClassificationMetrics
+    """
+    table = CVResultTable.from_folds(cv_targets, cv_preds, cv_probs)
+    boots = bootstrap_metrics(table.truth, table.prediction, table.probability,
+                              n_boot=n_boot, random_state=random_state,
+                              n_jobs=n_jobs)
+    lower, upper = percentile_intervals(boots, alpha)
+    return ClassificationMetrics(*lower), ClassificationMetrics(*upper)
 
 
 def get_cv_significance(cv_targets, cv_preds):
@@ -287,16 +498,7 @@ def get_cv_significance(cv_targets, cv_preds):
 
     """
 
-    targets, preds, probs, labels = enlist_cv_results(cv_targets, cv_preds)
-
-    signfs = []
-    for i in range(len(targets)):
-        y_true   = targets[i]
-        y_pred   = preds  [i]
-        conf_mat = confusion_matrix(y_true, y_pred, labels)
-        signfs.append(get_confusion_matrix_fisher_significance(conf_mat)[1])
-
-    return np.mean(signfs)
+    return CVResultTable.from_folds(cv_targets, cv_preds).significance()
 
 
 def get_confusion_matrix_fisher_significance(table, alternative='two-sided'):
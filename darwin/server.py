@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Local asyncio prediction server for fitted darwin Learners.
+
+The models are loaded once and kept in memory. Concurrent requests to the
+same model are coalesced into batched predict/predict_proba calls, waiting at
+most max_latency seconds for a batch to fill.
+
+HTTP API (JSON bodies):
+    GET  /models                    -> {"models": [names]}
+    POST /models/<name>/predict     {"samples": [[...], ...]} or {"paths": [...]}
+                                    -> {"predictions": [...]}
+    POST /models/<name>/predict_proba
+                                    -> {"probabilities": [[...], ...]}
+    GET  /models/<name>/stats       -> request count and latency histogram
+
+This module needs Python >= 3.5, setup.py does not install it on older
+versions.
+"""
+import json
+import time
+import asyncio
+import logging
+import functools
+
+import numpy as np
+
+from .learner import Learner
+
+log = logging.getLogger(__name__)
+
+#Upper bounds in milliseconds of the latency histogram buckets
+LATENCY_BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000,
+                      float('inf')]
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class LatencyHistogram(object):
+    """Counts of request latencies in LATENCY_BUCKETS_MS buckets."""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total = 0
+        self.sum_ms = 0.
+
+    def add(self, seconds):
+        ms = seconds * 1000.
+        self.counts[np.searchsorted(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def as_dict(self):
+        return {'count': self.total,
+                'mean_ms': self.sum_ms / self.total if self.total else 0.,
+                'buckets_ms': [str(b) for b in LATENCY_BUCKETS_MS],
+                'counts': list(self.counts)}
+
+
+def _n_input_features(estimator):
+    """Return the number of features a fitted estimator expects, None if
+    it can not be found out."""
+    n_feats = getattr(estimator, 'n_features_in_', None)
+    if n_feats is not None:
+        return int(n_feats)
+    for attr in ('mean_', 'scale_', 'std_', 'scores_', 'feature_importances_'):
+        values = getattr(estimator, attr, None)
+        if values is not None:
+            return int(np.size(values))
+    for attr in ('coef_', 'support_vectors_'):
+        values = getattr(estimator, attr, None)
+        if values is not None and np.ndim(values) == 2 and np.shape(values)[1]:
+            return int(np.shape(values)[1])
+    return None
+
+
+class BatchingModel(object):
+    """Coalesces the predict and predict_proba requests of one Learner into
+    batches.
+
+    Parameters
+    ----------
+    learner: darwin.learner.Learner
+
+    max_batch_size: int
+        Maximum number of samples in a batch.
+
+    max_latency: float
+        Maximum seconds to wait for more requests once the first request of
+        a batch has arrived.
+    """
+
+    def __init__(self, learner, max_batch_size=64, max_latency=0.005):
+        self.learner = learner
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.latency = LatencyHistogram()
+        self.n_batches = 0
+        self.n_batched_samples = 0
+        self._queue = None
+        self._worker = None
+
+    @property
+    def n_features(self):
+        """Number of features of the samples, as expected by the first
+        step of the learner, None if unknown."""
+        for step in (self.learner.scaler, self.learner.selector,
+                     self.learner.model):
+            if step is not None:
+                return _n_input_features(step)
+        return None
+
+    @property
+    def mean_batch_size(self):
+        return self.n_batched_samples / float(self.n_batches) if self.n_batches else 0.
+
+    def load_paths(self, paths):
+        """Return the stacked feature vectors of the subject files."""
+        return np.vstack([self.learner.load_subject(p) for p in paths])
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def predict(self, samples, kind='predict'):
+        """Return the predictions ('predict') or probabilities
+        ('predict_proba') of the samples, batched with other requests."""
+        start = time.time()
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((kind, samples, future))
+        try:
+            return await future
+        finally:
+            self.latency.add(time.time() - start)
+
+    async def _next_batch(self):
+        loop = asyncio.get_event_loop()
+        batch = [await self._queue.get()]
+        n_samples = len(batch[0][1])
+        deadline = loop.time() + self.max_latency
+
+        while n_samples < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            n_samples += len(item[1])
+
+        return batch
+
+    def _predict_batch(self, kind, samples):
+        samples = self.learner.transform(samples)
+        if kind == 'predict_proba':
+            return self.learner.predict_proba_transformed(samples)
+        return self.learner.model.predict(samples)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._next_batch()
+
+            for kind in ('predict', 'predict_proba'):
+                items = [item for item in batch if item[0] == kind]
+                if not items:
+                    continue
+
+                n_samples = sum(len(item[1]) for item in items)
+                self.n_batches += 1
+                self.n_batched_samples += n_samples
+                try:
+                    samples = np.vstack([item[1] for item in items])
+                    results = await loop.run_in_executor(
+                        None, functools.partial(self._predict_batch, kind, samples))
+                except Exception as exc:
+                    log.exception('Error predicting a batch of {} '
+                                  'samples.'.format(n_samples))
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(exc)
+                    continue
+
+                start = 0
+                for _, item_samples, future in items:
+                    stop = start + len(item_samples)
+                    if not future.done():
+                        future.set_result(results[start:stop])
+                    start = stop
+
+
+class ModelServer(object):
+    """Local HTTP server of darwin Learners over TCP or a Unix socket.
+
+    Parameters
+    ----------
+    models: dict
+        Model name -> Learner or path to a Learner saved with
+        PersistenceMixin.save or save_artifact.
+
+    max_batch_size: int
+
+    max_latency: float
+        See BatchingModel.
+
+    mmap_mode: str, optional
+        mmap_mode used to load the models from files, see
+        PersistenceMixin.from_file.
+    """
+
+    def __init__(self, models, max_batch_size=64, max_latency=0.005,
+                 mmap_mode='r'):
+        self.models = {}
+        for name, learner in models.items():
+            if not isinstance(learner, Learner):
+                learner = Learner.from_file(learner, mmap_mode=mmap_mode)
+            self.models[name] = BatchingModel(learner, max_batch_size,
+                                              max_latency)
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=0, unix_path=None):
+        """Start serving on host:port, or on unix_path if given.
+
+        Returns
+        -------
+        server: asyncio.AbstractServer
+        """
+        for model in self.models.values():
+            model.start()
+
+        if unix_path is not None:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                           path=unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server is not None else []
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        for model in self.models.values():
+            await model.stop()
+
+    def stats(self):
+        """Return the latency histogram and batch sizes of each model."""
+        return dict((name, {'latency': model.latency.as_dict(),
+                            'n_batches': model.n_batches,
+                            'mean_batch_size': model.mean_batch_size})
+                    for name, model in self.models.items())
+
+    async def _route(self, method, path, body):
+        parts = [p for p in path.split('?')[0].split('/') if p]
+
+        if parts == ['models']:
+            return 200, {'models': sorted(self.models.keys())}
+
+        if len(parts) != 3 or parts[0] != 'models' or parts[1] not in self.models:
+            return 404, {'error': 'Unknown path {}.'.format(path)}
+
+        name, action = parts[1], parts[2]
+        model = self.models[name]
+
+        if action == 'stats':
+            return 200, self.stats()[name]
+
+        if action not in ('predict', 'predict_proba'):
+            return 404, {'error': 'Unknown action {}.'.format(action)}
+
+        if method != 'POST':
+            return 405, {'error': 'Use POST to predict.'}
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+            if 'paths' in request:
+                #nibabel reads the files, keep it out of the event loop
+                samples = await asyncio.get_event_loop().run_in_executor(
+                    None, model.load_paths, request['paths'])
+            else:
+                samples = np.atleast_2d(np.asarray(request['samples'],
+                                                   dtype=np.float64))
+        except Exception as exc:
+            return 400, {'error': 'Invalid request: {}'.format(exc)}
+
+        n_feats = model.n_features
+        if samples.ndim != 2 or (n_feats is not None and samples.shape[1] != n_feats):
+            return 400, {'error': 'Invalid request: samples of shape {}, the '
+                                  'model expects {} features.'.format(samples.shape,
+                                                                      n_feats)}
+
+        try:
+            results = await model.predict(samples, action)
+        except Exception as exc:
+            return 500, {'error': str(exc)}
+
+        key = 'predictions' if action == 'predict' else 'probabilities'
+        return 200, {key: np.asarray(results).tolist()}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                method, path = request_line.decode('latin-1').split()[:2]
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                status, response = await self._route(method, path, body)
+
+                payload = json.dumps(response).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+                             'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                                 status, HTTP_REASONS[status], len(payload),
+                                 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            log.exception('Error handling a request.')
+        finally:
+            writer.close()
+
+
+def run_server(models, host='127.0.0.1', port=8765, unix_path=None,
+               max_batch_size=64, max_latency=0.005):
+    """Serve models until interrupted. See ModelServer."""
+    loop = asyncio.get_event_loop()
+    server = ModelServer(models, max_batch_size, max_latency)
+    loop.run_until_complete(server.start(host, port, unix_path))
+    log.info('Serving {} on {}.'.format(sorted(server.models.keys()),
+                                        unix_path or '{}:{}'.format(host, port)))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
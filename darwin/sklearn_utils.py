@@ -15,17 +15,8 @@
 import numpy as np
 import logging
 
-#classification
-from sklearn import tree
-from sklearn.svm import SVC
-from sklearn.svm import LinearSVC
-from sklearn.mixture import GMM
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import SGDClassifier
-from sklearn.linear_model import Perceptron
-
-#feature selection
-from sklearn.ensemble import ExtraTreesClassifier
+#the classification and feature selection classes are imported on demand
+#by the instantiators, from the definitions in learners.yml and selectors.yml
 
 #cross-validation
 from sklearn.cross_validation import KFold
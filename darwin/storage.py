@@ -10,14 +10,26 @@
 #-------------------------------------------------------------------------------
 
 import os
+import os.path as op
+import io
+import json
+import zlib
 import shelve
 import logging
 
+import numpy as np
+
 from .utils.filenames import (get_extension,
                               add_extension_if_needed)
+from .exceptions import FolderNotFound
 
 log = logging.getLogger(__name__)
 
+#Feature set store format
+FEATURE_SET_FORMAT = 'darwin-featureset'
+FEATURE_SET_VERSION = 1
+FEATURE_SET_MANIFEST = 'manifest.json'
+
 
 def save_variables_to_shelve(file_path, variables):
     """
@@ -53,3 +65,206 @@ def save_variables_to_shelve(file_path, variables):
             raise
 
     mashelf.close()
+
+
+def _block_fname(row_block, col_block, compression):
+    ext = '.npy.z' if compression == 'zlib' else '.npy'
+    return 'block_{}_{}{}'.format(row_block, col_block, ext)
+
+
+def _save_array(file_path, array, compression=None):
+    if compression is None:
+        np.save(file_path, array)
+    else:
+        buf = io.BytesIO()
+        np.save(buf, array)
+        with open(file_path, 'wb') as f:
+            f.write(zlib.compress(buf.getvalue()))
+
+
+def _load_array(file_path, compression=None, mmap_mode=None):
+    if compression is None:
+        return np.load(file_path, mmap_mode=mmap_mode)
+
+    with open(file_path, 'rb') as f:
+        return np.load(io.BytesIO(zlib.decompress(f.read())))
+
+
+def save_feature_set(dir_path, feats, variables=None, chunks=(1024, 4096),
+                     compression=None):
+    """Save the feature matrix feats into dir_path as a grid of binary
+    blocks with a JSON manifest.
+
+    Each block is stored in its own .npy file, so a subset of the samples or
+    features can be read by load_feature_set without reading the rest.
+
+    Parameters
+    ----------
+    dir_path: str
+        Output directory, it will be created if needed.
+
+    feats: array_like
+        Shape: n_samples x n_features
+
+    variables: dict, optional
+        Other arrays to store with the feature set, e.g.: {'labels': targets}.
+        Variable name -> array
+
+    chunks: tuple of 2 ints
+        Number of samples and features of each block.
+
+    compression: str, optional
+        None for uncompressed blocks, that can be memory mapped, or
+        'zlib' for compressed blocks.
+
+    Returns
+    -------
+    manifest: dict
+    """
+    if compression not in (None, 'zlib'):
+        raise ValueError('Unknown compression {}, expected None or '
+                         '"zlib".'.format(compression))
+
+    feats = np.asarray(feats)
+    if feats.ndim != 2:
+        raise ValueError('Expected a 2D feature matrix, got shape '
+                         '{}.'.format(feats.shape))
+
+    if not op.exists(dir_path):
+        os.makedirs(dir_path)
+
+    n_rows, n_cols = feats.shape
+    row_chunk, col_chunk = [max(1, int(c)) for c in chunks]
+
+    for i, r in enumerate(range(0, n_rows, row_chunk)):
+        for j, c in enumerate(range(0, n_cols, col_chunk)):
+            block = np.ascontiguousarray(feats[r:r + row_chunk, c:c + col_chunk])
+            _save_array(op.join(dir_path, _block_fname(i, j, compression)),
+                        block, compression)
+
+    var_files = {}
+    for vn, var in (variables or {}).items():
+        var_files[vn] = '{}.npy'.format(vn)
+        np.save(op.join(dir_path, var_files[vn]), np.asarray(var))
+
+    manifest = {'format': FEATURE_SET_FORMAT,
+                'version': FEATURE_SET_VERSION,
+                'shape': [n_rows, n_cols],
+                'dtype': feats.dtype.str,
+                'chunks': [row_chunk, col_chunk],
+                'compression': compression,
+                'variables': var_files}
+
+    #the manifest is written last, so an incomplete store cannot be read
+    with open(op.join(dir_path, FEATURE_SET_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def read_feature_set_manifest(dir_path):
+    """Return the manifest of the feature set stored in dir_path.
+
+    Raises
+    ------
+    FolderNotFound
+        If dir_path does not exist.
+
+    ValueError
+        If dir_path does not contain a feature set.
+    """
+    if not op.isdir(dir_path):
+        raise FolderNotFound(dir_path)
+
+    manifest_path = op.join(dir_path, FEATURE_SET_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        log.exception('Error reading {}.'.format(manifest_path))
+        raise ValueError('{} does not contain a feature set.'.format(dir_path))
+
+    if manifest.get('format') != FEATURE_SET_FORMAT:
+        raise ValueError('{} does not contain a feature set.'.format(dir_path))
+
+    if manifest['version'] > FEATURE_SET_VERSION:
+        raise ValueError('Feature set {} has version {}, newer than the '
+                         'supported {}.'.format(dir_path, manifest['version'],
+                                                FEATURE_SET_VERSION))
+    return manifest
+
+
+def _as_indices(selection, size):
+    if selection is None:
+        return np.arange(size)
+    if isinstance(selection, slice):
+        return np.arange(size)[selection]
+
+    selection = np.asarray(selection)
+    if selection.dtype == np.bool:
+        return np.where(selection)[0]
+    return np.where(selection < 0, selection + size, selection)
+
+
+def load_feature_set(dir_path, rows=None, cols=None, mmap_mode='r'):
+    """Return the features stored by save_feature_set in dir_path.
+
+    Only the blocks that contain the selected samples and features are read.
+    Uncompressed blocks are memory mapped.
+
+    Parameters
+    ----------
+    dir_path: str
+
+    rows: slice, array of ints or booleans, optional
+        Samples to read. None for all.
+
+    cols: slice, array of ints or booleans, optional
+        Features to read. None for all.
+
+    mmap_mode: str, optional
+        np.load mmap_mode for the uncompressed blocks.
+
+    Returns
+    -------
+    feats: numpy array
+        Shape: n_selected_rows x n_selected_cols
+    """
+    manifest = read_feature_set_manifest(dir_path)
+    n_rows, n_cols = manifest['shape']
+    row_chunk, col_chunk = manifest['chunks']
+    compression = manifest['compression']
+
+    row_idx = _as_indices(rows, n_rows)
+    col_idx = _as_indices(cols, n_cols)
+
+    feats = np.empty((len(row_idx), len(col_idx)),
+                     dtype=np.dtype(str(manifest['dtype'])))
+
+    row_blocks = row_idx // row_chunk
+    col_blocks = col_idx // col_chunk
+    for i in np.unique(row_blocks):
+        out_rows = np.where(row_blocks == i)[0]
+        in_rows = row_idx[out_rows] - i * row_chunk
+        for j in np.unique(col_blocks):
+            out_cols = np.where(col_blocks == j)[0]
+            in_cols = col_idx[out_cols] - j * col_chunk
+
+            block = _load_array(op.join(dir_path, _block_fname(i, j, compression)),
+                                compression, mmap_mode)
+            feats[np.ix_(out_rows, out_cols)] = block[np.ix_(in_rows, in_cols)]
+
+    return feats
+
+
+def load_feature_set_variable(dir_path, var_name, mmap_mode=None):
+    """Return the variable var_name stored with the feature set in dir_path.
+
+    Raises
+    ------
+    KeyError
+        If the feature set has no variable var_name.
+    """
+    manifest = read_feature_set_manifest(dir_path)
+    return np.load(op.join(dir_path, manifest['variables'][var_name]),
+                   mmap_mode=mmap_mode)
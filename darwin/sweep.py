@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Sweep of classification experiments over the cross-product of datasets,
+pre-feature selection methods, thresholds and classifiers.
+
+The work shared between experiments is done once: each dataset is loaded
+once, its cross-validation folds are split once, and the feature scores of
+each fold are computed once per pre-feature selection method and reused by
+all the thresholds and classifiers.
+"""
+import csv
+import logging
+import itertools
+import collections
+
+import numpy as np
+
+from .utils.printable import Printable
+from .results import (ClassificationResult, classification_metrics,
+                      classif_metrics_varnames, get_cv_classification_metrics,
+                      enlist_cv_results_from_dict)
+from .threshold import apply_threshold
+
+log = logging.getLogger(__name__)
+
+
+class SweepResult(collections.namedtuple('Sweep_Result',
+                                         ['subjsf', 'prefs', 'prefs_thr', 'cl',
+                                          'metrics', 'n_selected', 'result'])):
+    """
+    Namedtuple with the results of one experiment of a sweep.
+    metrics is an array of shape [n_folds x 6] with acc, sens, spec, prec,
+    f1 and roc_auc of each fold, as expected by plot.plot_results.
+    n_selected is the number of features selected in each fold and result
+    the results.ClassificationResult.
+    """
+    pass
+
+
+class SweepRunner(Printable):
+    """Runs a ClassificationPipeline for each combination of dataset,
+    pre-feature selection method, threshold and classifier.
+
+    Parameters
+    ----------
+    datasets: list of str or dict
+        Subjects files to be loaded with data_io.load_data, or a dict of
+        dataset name -> (samples, targets) already loaded.
+
+    prefs_methods: list of str
+        Distance measures for the pre-feature selection, see
+        features.feature_selection, e.g. ['pearson', 'bhattacharyya',
+        'welcht'].
+
+    prefs_thrs: list of float
+        Thresholds of the feature scores, in [0, 100].
+
+    clf_methods: list of str
+        Classifiers, see sklearn_utils.get_clfmethod.
+
+    datadir: str
+        See data_io.load_data.
+
+    maskf: str
+        See data_io.load_data.
+
+    labelsf: str, optional
+        See data_io.load_data.
+
+    thr_method: str
+        Threshold method of the feature scores: 'robust', 'rank' or
+        'percentile'.
+
+    priorities: dict, optional
+        Classifier name -> priority. The experiments with higher priority
+        are scheduled first. By default, all 0.
+
+    n_jobs: int
+        Number of experiments run at the same time.
+
+    pipeline_kwargs:
+        Other arguments of ClassificationPipeline, e.g. cvmethod or
+        stratified.
+    """
+
+    def __init__(self, datasets, prefs_methods, prefs_thrs, clf_methods,
+                 datadir='', maskf=None, labelsf=None, thr_method='robust',
+                 priorities=None, n_jobs=1, **pipeline_kwargs):
+        self.datasets = datasets
+        self.prefs_methods = list(prefs_methods)
+        self.prefs_thrs = list(prefs_thrs)
+        self.clf_methods = list(clf_methods)
+        self.datadir = datadir
+        self.maskf = maskf
+        self.labelsf = labelsf
+        self.thr_method = thr_method
+        self.priorities = priorities or {}
+        self.n_jobs = n_jobs
+        self.pipeline_kwargs = pipeline_kwargs
+
+        self._data = collections.OrderedDict()
+        self._plans = {}
+        self._scores = {}
+        self._masks = {}
+
+    @property
+    def dataset_names(self):
+        if isinstance(self.datasets, dict):
+            return list(self.datasets.keys())
+        return list(self.datasets)
+
+    def load(self, name):
+        """Return the samples and targets of dataset name, loading them the
+        first time."""
+        if name not in self._data:
+            if isinstance(self.datasets, dict):
+                samples, targets = self.datasets[name]
+            else:
+                from .data_io import load_data
+                samples, targets = load_data(name, self.datadir, self.maskf,
+                                             self.labelsf)[:2]
+            self._data[name] = (np.asarray(samples), np.asarray(targets))
+        return self._data[name]
+
+    def plan(self, name):
+        """Return the cvplan.CVPlan of dataset name, shared by all its
+        experiments."""
+        from .cvplan import CVPlan
+
+        if name not in self._plans:
+            samples, targets = self.load(name)
+            kwargs = dict((k, self.pipeline_kwargs[k])
+                          for k in ('cvmethod', 'stratified', 'scaler', 'dtype')
+                          if k in self.pipeline_kwargs)
+            self._plans[name] = CVPlan(samples, targets, **kwargs)
+        return self._plans[name]
+
+    def folds(self, name):
+        """Return the list of (train, test) indices of dataset name."""
+        return self.plan(name).folds
+
+    def scores(self, name, prefs):
+        """Return the list of feature scores of each training fold of
+        dataset name with the pre-feature selection method prefs."""
+        from .features import feature_selection
+        from .cvplan import _impute
+
+        key = (name, prefs)
+        if key not in self._scores:
+            plan = self.plan(name)
+            fold_scores = []
+            for fold, (train, test) in enumerate(plan.folds):
+                #the NaNs are replaced by the training means, as in the
+                #pipeline, before the finiteness check of the scoring
+                means, _ = plan.transforms(fold)
+                x_train = _impute(plan.samples[train], means)
+                scores = feature_selection(x_train, plan.targets[train],
+                                           prefs, thr_method=None)
+                fold_scores.append(np.nan_to_num(scores))
+            self._scores[key] = fold_scores
+        return self._scores[key]
+
+    def masks(self, name, prefs, thr):
+        """Return the list of selected features masks of each fold."""
+        key = (name, prefs, thr)
+        if key not in self._masks:
+            masks = []
+            for scores in self.scores(name, prefs):
+                mask = apply_threshold(scores.copy(), thr, self.thr_method) != 0
+                if not mask.any():
+                    log.warning('No feature of {} passes the {} threshold {}, '
+                                'using the best one.'.format(name, prefs, thr))
+                    mask[np.argmax(scores)] = True
+                masks.append(mask)
+            self._masks[key] = masks
+        return self._masks[key]
+
+    def experiments(self):
+        """Return the list of (dataset, prefs, thr, classifier) combinations,
+        sorted by priority."""
+        combs = list(itertools.product(self.dataset_names, self.prefs_methods,
+                                       self.prefs_thrs, self.clf_methods))
+        #sorted is stable, so equal priorities keep the sweep order
+        return sorted(combs, key=lambda c: -self.priorities.get(c[3], 0))
+
+    def run_experiment(self, name, prefs, thr, clfmethod):
+        """Run the cross-validation of one experiment on the prepared folds
+        of the dataset.
+
+        Returns
+        -------
+        SweepResult
+        """
+        from .pipeline import ClassificationPipeline, count_grid_points
+        from .profiling import Profiler
+
+        samples, targets = self.load(name)
+        plan = self.plan(name)
+        masks = self.masks(name, prefs, thr)
+
+        pipe = ClassificationPipeline(clfmethod, samples.shape[1],
+                                      **self.pipeline_kwargs)
+
+        profiler = Profiler(pipe.collectors, count_grid_points(pipe._params),
+                            pipe.measure_memory)
+        profiler.start()
+
+        preds = collections.OrderedDict()
+        probs = collections.OrderedDict()
+        truth = collections.OrderedDict()
+        best_pars = collections.OrderedDict()
+        importance = collections.OrderedDict()
+        for fold, (train, test) in enumerate(plan.folds):
+            #imputation and scaling are per feature, so selecting the
+            #features of the prepared blocks is the same as preparing the
+            #selected features
+            x_train, x_test, y_train, y_test = plan.fold_data(fold)
+            prepared = (x_train[:, masks[fold]], x_test[:, masks[fold]],
+                        y_train, y_test)
+            fold_result = pipe.fit_fold(plan.samples, plan.targets, train,
+                                        test, fold, profiler, prepared)
+            preds[fold] = fold_result.predictions
+            probs[fold] = fold_result.probabilities
+            truth[fold] = fold_result.cv_targets
+            best_pars[fold] = fold_result.best_parameters
+            importance[fold] = fold_result.features_importance
+
+        profile = profiler.end()
+
+        if any(p is None for p in probs.values()):
+            probs = None
+
+        cv = plan.cv
+        if all(len(t) == 1 for t in truth.values()):
+            #leave-one-out: the metrics of the pooled predictions
+            cv_truth, cv_preds, cv_probs, labels = enlist_cv_results_from_dict(truth, preds, probs)
+            metrics = np.atleast_2d(classification_metrics(cv_truth, cv_preds,
+                                                           cv_probs, labels))
+        else:
+            cv_truth, cv_preds, cv_probs = truth, preds, probs
+            labels = np.unique(targets)
+            metrics = get_cv_classification_metrics(truth, preds, probs)
+
+        result = ClassificationResult(cv_preds, cv_probs, cv_truth, best_pars,
+                                      cv, importance, targets, labels, profile)
+
+        n_selected = [int(m.sum()) for m in masks]
+        log.info('{} {} {} {}: accuracy {:.3f}'.format(name, prefs, thr,
+                                                       clfmethod,
+                                                       metrics[:, 0].mean()))
+        return SweepResult(name, prefs, thr, clfmethod, metrics, n_selected,
+                           result)
+
+    def run(self):
+        """Run all the experiments.
+
+        Returns
+        -------
+        results: OrderedDict
+            Dataset name -> list of SweepResult, the results argument of
+            plot.plot_results.
+        """
+        #shared work first, so the experiments only read it
+        for name in self.dataset_names:
+            self.plan(name).prepare()
+            for prefs in self.prefs_methods:
+                for thr in self.prefs_thrs:
+                    self.masks(name, prefs, thr)
+
+        exps = self.experiments()
+        if self.n_jobs == 1:
+            sweep = [self.run_experiment(*exp) for exp in exps]
+        else:
+            from joblib import Parallel, delayed
+            #the experiments are dispatched in priority order
+            sweep = Parallel(n_jobs=self.n_jobs, backend='threading')(
+                delayed(self.run_experiment)(*exp) for exp in exps)
+
+        results = collections.OrderedDict((name, [])
+                                          for name in self.dataset_names)
+        for res in sweep:
+            results[res.subjsf].append(res)
+        return results
+
+
+def write_sweep_table(results, filepath):
+    """Write the mean and standard deviation of the metrics of each
+    experiment of a sweep in a CSV file.
+
+    Parameters
+    ----------
+    results: dict
+        Dataset name -> list of SweepResult, as returned by SweepRunner.run.
+
+    filepath: str
+    """
+    header = ['subjsf', 'prefs', 'prefs_thr', 'cl', 'mean_n_selected']
+    header += ['mean_' + m for m in classif_metrics_varnames]
+    header += ['std_' + m for m in classif_metrics_varnames]
+
+    with open(filepath, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for name in results:
+            for res in results[name]:
+                metrics = np.asarray(res.metrics)
+                writer.writerow([res.subjsf, res.prefs, res.prefs_thr, res.cl,
+                                 np.mean(res.n_selected)] +
+                                list(metrics.mean(axis=0)) +
+                                list(metrics.std(axis=0)))
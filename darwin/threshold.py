@@ -366,10 +366,10 @@ def threshold(data, lower_bound, upper_bound, inclusive=True):
 
     Returns
     -------
-    thresholded data
+    thresholded data, with the same dtype as data
     """
     mask = binarise(data, lower_bound, upper_bound, inclusive)
-    return data * mask
+    return data * mask.astype(data.dtype)
 
 
 def robust_range_threshold(vol, thrP=0.95):
@@ -1,65 +1,396 @@
 # -*- coding: utf-8 -*-
+import os
 import os.path as op
+import json
+import zlib
+import pickle
+import struct
+import logging
+import importlib
+
 import joblib
 from ..version import __version__, VERSION
 
+log = logging.getLogger(__name__)
+
+#Artifact file layout:
+#ARTIFACT_MAGIC, header length (little-endian uint64), JSON header and
+#one compressed pickle blob per attribute, as indexed in the header.
+ARTIFACT_MAGIC = b'DARWINAR'
+ARTIFACT_FORMAT_VERSION = 1
+_HEADER_LEN = struct.Struct('<Q')
+
+
+def _get_codecs():
+    """Return a dict of the available compressors:
+    name -> (compress function, decompress function)"""
+    codecs = {'zlib': (zlib.compress, zlib.decompress)}
+
+    try:
+        import zstandard
+        codecs['zstd'] = (lambda data: zstandard.ZstdCompressor().compress(data),
+                          lambda data: zstandard.ZstdDecompressor().decompress(data))
+    except ImportError:
+        pass
+
+    try:
+        import lz4.frame
+        codecs['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+    except ImportError:
+        pass
+
+    return codecs
+
+
+def _default_codec(codecs):
+    for name in ('zstd', 'lz4', 'zlib'):
+        if name in codecs:
+            return name
+
+
+def is_artifact(file_path):
+    """Return True if file_path is a PersistenceMixin artifact file."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(ARTIFACT_MAGIC)) == ARTIFACT_MAGIC
+    except IOError:
+        return False
+
+
+def read_artifact_header(file_path):
+    """Return the header of the artifact in file_path without reading any
+    attribute.
+
+    The header is a dict with the keys:
+    'format_version', 'version', 'class', 'compression' and 'attributes',
+    a list of dicts with the 'name', 'offset', 'length' and 'crc32' of each
+    attribute blob. The offsets are from the start of the file.
+
+    Raises
+    ------
+    ValueError
+        If file_path is not an artifact.
+    """
+    with open(file_path, 'rb') as f:
+        if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+            raise ValueError('{} is not an artifact file.'.format(file_path))
+
+        header_len, = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+
+    if header['format_version'] > ARTIFACT_FORMAT_VERSION:
+        raise ValueError('Artifact {} has format version {}, newer than the '
+                         'supported {}.'.format(file_path,
+                                                header['format_version'],
+                                                ARTIFACT_FORMAT_VERSION))
+    return header
+
+
+def _read_blob(f, attr):
+    f.seek(attr['offset'])
+    blob = f.read(attr['length'])
+    if len(blob) != attr['length']:
+        raise ValueError('Attribute {} is truncated.'.format(attr['name']))
+    return blob
+
+
+def validate_artifact(file_path):
+    """Check the checksums of all the attributes in the artifact in
+    file_path, without decompressing nor unpickling them.
+
+    Returns
+    -------
+    header: dict
+        See read_artifact_header
+
+    Raises
+    ------
+    ValueError
+        If the file is not an artifact or any attribute is corrupted.
+    """
+    header = read_artifact_header(file_path)
+    with open(file_path, 'rb') as f:
+        for attr in header['attributes']:
+            if zlib.crc32(_read_blob(f, attr)) & 0xffffffff != attr['crc32']:
+                raise ValueError('Attribute {} of {} is corrupted.'.format(attr['name'],
+                                                                           file_path))
+    return header
+
+
+def list_artifacts(dir_path, validate=False):
+    """Return a list of (file path, header) of the artifacts in dir_path.
+
+    Parameters
+    ----------
+    dir_path: str
+
+    validate: bool
+        If True, also check the checksums of the artifacts and log and skip
+        the corrupted ones.
+    """
+    artifacts = []
+    for fname in sorted(os.listdir(dir_path)):
+        file_path = op.join(dir_path, fname)
+        if not op.isfile(file_path) or not is_artifact(file_path):
+            continue
+
+        try:
+            if validate:
+                header = validate_artifact(file_path)
+            else:
+                header = read_artifact_header(file_path)
+        except ValueError:
+            log.exception('Invalid artifact {}.'.format(file_path))
+            continue
+
+        artifacts.append((file_path, header))
+
+    return artifacts
+
+
+def _import_class(class_path):
+    module_name, cls_name = class_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), cls_name)
+
 
 class PersistenceMixin(object):
-    """Mixin that adds joblib persistence: load, save and from_file functions to any class."""
+    """Mixin that adds joblib persistence: load, save and from_file functions to any class.
+
+    Objects saved without compression keep their numpy arrays uncompressed
+    in the dump, so they can be loaded with mmap_mode='r'. In this case the
+    arrays are memory mapped from disk instead of copied into memory, so
+    loading is almost immediate and many processes share the same pages.
+    """
 
     @classmethod
-    def from_file(cls, objdump_path):
+    def from_file(cls, objdump_path, mmap_mode=None):
         '''
         Parameters
         ----------
         objdump_path: str
             Path to the object dump file.
 
+        mmap_mode: {None, 'r', 'r+', 'c'}
+            If not None, the numpy arrays of the object are memory mapped
+            from the dump with this mode, see numpy.load.
+            Use 'r' to share a read-only model between processes.
+            It has no effect on compressed dumps, nor on artifacts saved
+            with save_artifact, whose attributes are always read into
+            memory. A warning is logged in this case.
+
         Returns
         -------
         instance
             New instance of an object from the pickle at the specified path.
         '''
-        obj_version, object = joblib.load(objdump_path)
+        if is_artifact(objdump_path):
+            if mmap_mode is not None:
+                log.warning('mmap_mode is ignored for the artifact {}, its '
+                            'attributes are compressed.'.format(objdump_path))
+            return cls.from_artifact(objdump_path)
+
+        obj_version, object = joblib.load(objdump_path, mmap_mode=mmap_mode)
         # Check that we've actually loaded a PersistenceMixin (or sub-class)
         if not isinstance(object, cls):
             raise ValueError(('The pickle stored at {} does not contain ' +
                               'a {} object.').format(objdump_path, cls))
-            # Check that versions are compatible. (Currently, this just checks
-            # that major versions match)
-        elif obj_version[0] == VERSION[0]:
-            if not hasattr(object, 'sampler'):
-                object.sampler = None
-                return object
-            else:
-                raise ValueError(("{} stored in pickle file {} was created with version {} "
-                                  "of {}, which is incompatible with the current version "
-                                  "{}").format(cls, objdump_path, cls.__name__,
-                                               '.'.join(obj_version), '.'.join(VERSION)))
 
-    def load(self, objdump_path):
+        cls._check_version(obj_version, objdump_path)
+        if not hasattr(object, 'sampler'):
+            object.sampler = None
+        return object
+
+    @classmethod
+    def _check_version(cls, obj_version, objdump_path):
+        # Check that versions are compatible. (Currently, this just checks
+        # that major versions match)
+        if obj_version[0] != VERSION[0]:
+            raise ValueError(("{} stored in pickle file {} was created with version {} "
+                              "of {}, which is incompatible with the current version "
+                              "{}").format(cls, objdump_path,
+                                           '.'.join(map(str, obj_version)),
+                                           cls.__name__,
+                                           '.'.join(map(str, VERSION))))
+
+    @classmethod
+    def from_artifact(cls, artifact_path, lazy=True):
+        """Return the object stored with save_artifact in artifact_path.
+
+        Parameters
+        ----------
+        artifact_path: str
+
+        lazy: bool
+            If True, only the header is read now and each attribute is read
+            and decompressed the first time it is accessed.
+
+        Returns
+        -------
+        instance
+        """
+        header = read_artifact_header(artifact_path)
+
+        obj_cls = _import_class(header['class'])
+        if not issubclass(obj_cls, cls):
+            raise ValueError(('The artifact stored at {} does not contain ' +
+                              'a {} object.').format(artifact_path, cls))
+        cls._check_version(header['version'], artifact_path)
+
+        if header['compression'] not in _get_codecs():
+            raise ImportError('The {} compression library is needed to read '
+                              '{}.'.format(header['compression'], artifact_path))
+
+        object = obj_cls.__new__(obj_cls)
+        object.__dict__['_artifact_path'] = artifact_path
+        object.__dict__['_artifact_header'] = header
+        object.__dict__['_lazy_attributes'] = set(attr['name'] for attr in
+                                                  header['attributes'])
+        if 'sampler' not in object.__dict__['_lazy_attributes']:
+            object.__dict__['sampler'] = None
+        if not lazy:
+            object._load_lazy_attributes()
+
+        return object
+
+    def _load_lazy_attribute(self, name):
+        header = self.__dict__['_artifact_header']
+        attr = [a for a in header['attributes'] if a['name'] == name][0]
+        decompress = _get_codecs()[header['compression']][1]
+
+        with open(self.__dict__['_artifact_path'], 'rb') as f:
+            blob = _read_blob(f, attr)
+
+        if zlib.crc32(blob) & 0xffffffff != attr['crc32']:
+            raise ValueError('Attribute {} of {} is corrupted.'.format(name,
+                                                                       self._artifact_path))
+
+        value = pickle.loads(decompress(blob))
+        self.__dict__[name] = value
+        self.__dict__['_lazy_attributes'].discard(name)
+        return value
+
+    def _load_lazy_attributes(self):
+        """Read all the attributes not yet loaded from the artifact."""
+        for name in list(self.__dict__.get('_lazy_attributes', ())):
+            self._load_lazy_attribute(name)
+
+    def __getattr__(self, name):
+        # only called when the attribute is not found in the usual places
+        if name in self.__dict__.get('_lazy_attributes', ()):
+            return self._load_lazy_attribute(name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__,
+                                                                         name))
+
+    def __getstate__(self):
+        self._load_lazy_attributes()
+        return dict((k, v) for k, v in self.__dict__.items()
+                    if k not in ('_artifact_path', '_artifact_header',
+                                 '_lazy_attributes'))
+
+    def load(self, objdump_path, mmap_mode=None):
         '''Replace the current object instance with a saved object.
 
         Parameters
         ----------
         objdump_path: str
             The path to the file to load.
+
+        mmap_mode: {None, 'r', 'r+', 'c'}
+            See from_file.
         '''
-        del self.__dict__
-        self.__dict__ = type(self).from_file(objdump_path).__dict__
+        obj = type(self).from_file(objdump_path, mmap_mode=mmap_mode)
+        obj._load_lazy_attributes()
+        self.__dict__ = obj.__getstate__()
 
-    def save(self, objdump_path):
+    def save(self, objdump_path, compress=0):
         '''Save the object to a file.
 
         Parameters
         ----------
         objdump_path: str
             The path to where you want to save the object.
+
+        compress: int from 0 to 9
+            joblib compression level. Keep 0 to be able to load the object
+            with memory mapped arrays.
+
+        Returns
+        -------
+        filenames: list of str
+            The list of files in which the object is stored.
         '''
         # create the directory if it doesn't exist
         learner_dir = op.dirname(objdump_path)
-        if not op.exists(learner_dir):
+        if learner_dir and not op.exists(learner_dir):
             os.makedirs(learner_dir)
 
         # write out the files
-        joblib.dump((VERSION, self), objdump_path)
+        return joblib.dump((VERSION, self), objdump_path, compress=compress)
+
+    def save_artifact(self, artifact_path, compression=None):
+        """Save the object to an artifact file, with a header and one
+        independently compressed blob per attribute.
+
+        Parameters
+        ----------
+        artifact_path: str
+            The path to where you want to save the object.
+
+        compression: str, optional
+            'zstd', 'lz4' or 'zlib'. By default, the first one available.
+
+        Returns
+        -------
+        header: dict
+            See read_artifact_header
+        """
+        codecs = _get_codecs()
+        if compression is None:
+            compression = _default_codec(codecs)
+        if compression not in codecs:
+            raise ValueError('Compression {} is not available, choose one of '
+                             '{}.'.format(compression, list(codecs.keys())))
+        compress = codecs[compression][0]
+
+        state = self.__getstate__()
+        blobs = []
+        attributes = []
+        for name in sorted(state.keys()):
+            blob = compress(pickle.dumps(state[name], pickle.HIGHEST_PROTOCOL))
+            blobs.append(blob)
+            attributes.append({'name': name, 'length': len(blob),
+                               'crc32': zlib.crc32(blob) & 0xffffffff})
+
+        cls = type(self)
+        header = {'format_version': ARTIFACT_FORMAT_VERSION,
+                  'version': list(VERSION),
+                  'class': '{}.{}'.format(cls.__module__, cls.__name__),
+                  'compression': compression,
+                  'attributes': attributes}
+
+        # the offsets depend on the header length, which depends on the
+        # offsets: fix them with a fixed width representation
+        for attr in attributes:
+            attr['offset'] = 0
+        header_len = len(json.dumps(header).encode('utf-8')) + 20 * len(attributes)
+
+        offset = len(ARTIFACT_MAGIC) + _HEADER_LEN.size + header_len
+        for attr in attributes:
+            attr['offset'] = offset
+            offset += attr['length']
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_bytes += b' ' * (header_len - len(header_bytes))
+
+        artifact_dir = op.dirname(artifact_path)
+        if artifact_dir and not op.exists(artifact_dir):
+            os.makedirs(artifact_dir)
+
+        with open(artifact_path, 'wb') as f:
+            f.write(ARTIFACT_MAGIC)
+            f.write(_HEADER_LEN.pack(header_len))
+            f.write(header_bytes)
+            for blob in blobs:
+                f.write(blob)
+
+        return header
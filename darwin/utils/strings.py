@@ -11,6 +11,11 @@
 
 import re
 
+try:
+    string_types = (str, unicode)
+except NameError:
+    string_types = (str,)
+
 
 def filter_objlist(olist, fieldname, fieldval):
     """
@@ -7,12 +7,22 @@
 #          Nicolas Tresegnie
 # License: BSD 3 clause
 
+import mmap
+import weakref
 import warnings
 import numbers
 
 import numpy as np
 import scipy.sparse as sp
 
+#Number of values checked at a time by _assert_all_finite
+FINITE_CHECK_CHUNK = 2 ** 20
+
+#Read-only arrays that already passed check_array finiteness test:
+#id(array) -> (weak reference to array, validation token)
+_validated_arrays = {}
+_validation_cache_enabled = True
+
 
 class DataConversionWarning(UserWarning):
     "A warning on implicit data conversions happening in the code"
@@ -31,15 +41,92 @@ class NonBLASDotWarning(UserWarning):
 warnings.simplefilter('ignore', NonBLASDotWarning)
 
 
+def _all_finite_in_chunks(X):
+    """Return np.isfinite(X).all() without allocating a boolean array of
+    the size of X."""
+    if X.ndim == 0:
+        return bool(np.isfinite(X))
+
+    rows = max(1, FINITE_CHECK_CHUNK // max(1, X.size // max(1, X.shape[0])))
+    for start in range(0, X.shape[0], rows):
+        if not np.isfinite(X[start:start + rows]).all():
+            return False
+    return True
+
+
 def _assert_all_finite(X):
     """Like assert_all_finite, but only for ndarray."""
     X = np.asanyarray(X)
     if (X.dtype.char in np.typecodes['AllFloat'] and not np.isfinite(X.sum())
-            and not np.isfinite(X).all()):
+            and not _all_finite_in_chunks(X)):
         raise ValueError("Input contains NaN, infinity"
                          " or a value too large for %r." % X.dtype)
 
 
+def set_validation_cache(enabled):
+    """Enable or disable the cache of read-only arrays already validated
+    by check_array. Disabling it also empties it."""
+    global _validation_cache_enabled
+    _validation_cache_enabled = bool(enabled)
+    if not enabled:
+        _validated_arrays.clear()
+
+
+def forget_validated(array):
+    """Remove array from the cache of validated arrays, e.g., after
+    making it writeable again."""
+    _validated_arrays.pop(id(array), None)
+
+
+def _validation_token(array, dtype):
+    """Return a token that changes if array is reallocated, reshaped or
+    would be converted to a different dtype."""
+    return (array.__array_interface__['data'][0], array.shape, array.strides,
+            array.dtype.str, None if dtype is None else np.dtype(dtype).str)
+
+
+def _is_read_only(array):
+    """Return True if the values of array can not change: neither it nor
+    any array it is a view of is writeable, and the memory belongs to one
+    of them, to bytes or to a memory map, e.g., np.load(..., mmap_mode='r')."""
+    while isinstance(array, np.ndarray):
+        if array.flags.writeable:
+            return False
+        array = array.base
+    return array is None or isinstance(array, (bytes, mmap.mmap))
+
+
+def _is_validated(array, dtype):
+    if (not _validation_cache_enabled or not isinstance(array, np.ndarray) or
+            not _is_read_only(array)):
+        return False
+
+    entry = _validated_arrays.get(id(array))
+    return (entry is not None and entry[0]() is array and
+            entry[1] == _validation_token(array, dtype))
+
+
+def _mark_validated(array, dtype):
+    #writeable arrays may get NaNs in place, so they are always checked
+    if (not _validation_cache_enabled or not isinstance(array, np.ndarray) or
+            not _is_read_only(array)):
+        return
+
+    key = id(array)
+
+    def _remove(ref, key=key):
+        entry = _validated_arrays.get(key)
+        if entry is not None and entry[0] is ref:
+            del _validated_arrays[key]
+
+    try:
+        ref = weakref.ref(array, _remove)
+    except TypeError:
+        return
+
+    _validated_arrays[key] = (ref, _validation_token(array, dtype))
+
+
 def assert_all_finite(X):
     """Throw a ValueError if X contains NaN or infinity.
 
@@ -236,6 +323,13 @@ def check_array(array, accept_sparse=None, dtype=None, order=None, copy=False,
     -------
     X_converted : object
         The converted and validated X.
+
+    Notes
+    -----
+    The read-only numpy arrays that pass the finiteness check, e.g.,
+    memory maps opened with mmap_mode='r', are remembered by identity,
+    memory address, shape, strides and dtype, and not scanned again.
+    Writeable arrays are checked every time.
     """
     if isinstance(accept_sparse, str):
         accept_sparse = [accept_sparse]
@@ -244,14 +338,22 @@ def check_array(array, accept_sparse=None, dtype=None, order=None, copy=False,
         array = _ensure_sparse_format(array, accept_sparse, dtype, order,
                                       copy, force_all_finite)
     else:
+        original = array
         if ensure_2d:
             array = np.atleast_2d(array)
-        array = np.array(array, dtype=dtype, order=order, copy=copy)
+
+        if isinstance(array, np.ndarray) and not copy and order is None and \
+           (dtype is None or array.dtype == dtype):
+            array = np.asarray(array)
+        else:
+            array = np.array(array, dtype=dtype, order=order, copy=copy)
+
         if not allow_nd and array.ndim >= 3:
             raise ValueError("Found array with dim %d. Expected <= 2" %
                              array.ndim)
-        if force_all_finite:
+        if force_all_finite and not _is_validated(original, dtype):
             _assert_all_finite(array)
+            _mark_validated(original, dtype)
 
     return array
 
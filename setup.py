@@ -17,6 +17,7 @@ import io
 import sys
 from setuptools import Command, setup, find_packages
 from setuptools.command.test import test as TestCommand
+from setuptools.command.build_py import build_py
 from pip.req import parse_requirements
 from install_deps import get_requirements
 
@@ -86,6 +87,7 @@ setup_dict = dict(
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.5',
     ],
 
     extras_require={
@@ -120,8 +122,20 @@ class PyTest(TestCommand):
         sys.exit(errno)
 
 
+#modules written with async/await, only installed on Python >= 3.5
+PY35_MODULES = [(module_name, 'server')]
+
+
+class BuildPy(build_py):
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 5):
+            modules = [m for m in modules if tuple(m[:2]) not in PY35_MODULES]
+        return modules
+
+
 setup_dict.update(dict(tests_require=['pytest'],
-                       cmdclass={'test': PyTest}))
+                       cmdclass={'test': PyTest, 'build_py': BuildPy}))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+import sys
+
+#the prediction server and its tests use async/await
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_server.py')
@@ -20,6 +20,11 @@ def test_binary_classification_with_classification_pipeline():
     pipe = ClassificationPipeline(n_feats=n_feats, clfmethod=classifier_name, cvmethod=cvmethod)
     results, metrics = pipe.cross_validation(x, y)
     assert(results is not None)
+    assert(results.profile.n_folds == 10)
+    assert(results.profile.n_grid_points > 0)
+
+    lower, upper = pipe.confidence_intervals
+    assert(lower.accuracy <= metrics[0].accuracy <= upper.accuracy)
 
     return results, metrics
 
@@ -0,0 +1,92 @@
+
+import numpy as np
+from sklearn import datasets
+from sklearn.svm import SVC
+
+from darwin.calibration import (DecisionCalibrator, fit_sigmoid, fit_calibrator,
+                                has_native_proba, can_calibrate, class_scores)
+from darwin.pipeline import ClassificationPipeline
+
+
+def test_fit_sigmoid_recovers_parameters():
+    rng = np.random.RandomState(0)
+    scores = rng.uniform(-4, 4, 5000)
+    a, b = -2., 0.5
+    positives = rng.uniform(size=len(scores)) < 1. / (1. + np.exp(a * scores + b))
+
+    fit_a, fit_b = fit_sigmoid(scores, positives)
+    assert(abs(fit_a - a) < 0.2)
+    assert(abs(fit_b - b) < 0.2)
+
+
+def test_calibrator_probabilities():
+    rng = np.random.RandomState(1)
+    decision = rng.normal(size=(60, 3))
+    targets = np.argmax(decision + rng.normal(scale=0.5, size=decision.shape), axis=1)
+
+    for method in ('sigmoid', 'isotonic'):
+        cal = DecisionCalibrator(method).fit(decision, targets)
+        probs = cal.predict_proba(decision)
+        assert(probs.shape == (60, 3))
+        assert(np.allclose(probs.sum(axis=1), 1))
+        assert(np.all(probs >= 0))
+
+
+def test_isotonic_is_monotonic():
+    rng = np.random.RandomState(2)
+    scores = rng.normal(size=200)
+    targets = (scores + rng.normal(scale=0.5, size=200) > 0).astype(int)
+
+    cal = DecisionCalibrator('isotonic').fit(scores, targets)
+    grid = np.linspace(-3, 3, 50)
+    p1 = cal.predict_proba(grid)[:, 1]
+    assert(np.all(np.diff(p1) >= 0))
+
+
+def test_ovo_decision_values():
+    decision = np.array([[1., 2., -1.]])
+    assert(class_scores(decision, 3).shape == (1, 3))
+    assert(class_scores(decision[:, 0], 2).shape == (1, 1))
+
+
+def test_fit_calibrator_svc():
+    x, y = datasets.make_classification(n_samples=90, n_features=5, random_state=0)
+    svc = SVC(kernel='rbf').fit(x, y)
+    assert(not has_native_proba(svc))
+
+    cal = fit_calibrator(svc, x, y)
+    probs = cal.predict_proba(svc.decision_function(x))
+    assert(np.mean(np.argmax(probs, axis=1) == y) > 0.7)
+
+
+def test_pipeline_calibrates_svc_folds():
+    x, y = datasets.make_classification(n_samples=60, n_features=5, random_state=0)
+
+    pipe = ClassificationPipeline('RBFSVC', x.shape[1], cvmethod='3',
+                                  n_bootstrap=0)
+    results, metrics = pipe.cross_validation(x, y)
+    assert(results.probabilities is not None)
+    assert(len(pipe.calibrators) == 3)
+    assert(all(p.shape[1] == 2 for p in results.probabilities.values()))
+
+    #the calibrators are those of the last run
+    pipe.cross_validation(x, y, cvmethod=pipe._cv)
+    assert(sorted(pipe.calibrators.keys()) == [0, 1, 2])
+
+    pipe.calibration = None
+    results, metrics = pipe.cross_validation(x, y, cvmethod=pipe._cv)
+    assert(results.probabilities is None)
+
+
+def test_small_classes_are_not_calibrated():
+    targets = np.array([0] * 10 + [1] * 2)
+    assert(not can_calibrate(targets, 3))
+    assert(can_calibrate(targets, 2))
+
+    x, y = datasets.make_classification(n_samples=40, n_features=5,
+                                        weights=[0.9], random_state=0)
+    pipe = ClassificationPipeline('LinearSVC', x.shape[1], cvmethod='2',
+                                  calibration_cv=10, n_bootstrap=0)
+    results, metrics = pipe.cross_validation(x, y)
+    assert(results.probabilities is None)
+    assert(not pipe.calibrators)
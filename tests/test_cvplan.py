@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from sklearn import datasets
+from sklearn.preprocessing import StandardScaler
+
+from darwin.cvplan import CVPlan
+from darwin.pipeline import ClassificationPipeline, impute_nan_mean
+
+
+def make_data():
+    x, y = datasets.make_classification(n_samples=40, n_features=8,
+                                        random_state=0)
+    x[3, 2] = np.nan
+    x[30, 5] = np.nan
+    return x, y
+
+
+def test_fold_data_matches_pipeline_preprocessing():
+    x, y = make_data()
+    plan = CVPlan(x, y, cvmethod='4')
+
+    for fold, (train, test) in enumerate(plan.folds):
+        x_train, x_test = impute_nan_mean(x[train], x[test])
+        scaler = StandardScaler().fit(x_train)
+
+        p_train, p_test, y_train, y_test = plan.fold_data(fold)
+        np.testing.assert_allclose(p_train, scaler.transform(x_train))
+        np.testing.assert_allclose(p_test, scaler.transform(x_test))
+        np.testing.assert_array_equal(y_test, y[test])
+
+    #the preprocessing is fitted once per fold
+    plan.fold_data(0)
+    assert(plan.n_fits == 4)
+
+
+def test_uncached_blocks():
+    x, y = make_data()
+    cached = CVPlan(x, y, cvmethod='4').prepare()
+    uncached = CVPlan(x, y, cvmethod='4', cache_blocks=False).prepare()
+
+    for fold in range(cached.n_folds):
+        for a, b in zip(cached.fold_data(fold), uncached.fold_data(fold)):
+            np.testing.assert_allclose(a, b)
+    assert(uncached.n_fits == 4)
+
+
+def test_pipelines_share_plan():
+    x, y = make_data()
+    plan = CVPlan(x, y, cvmethod='4')
+
+    pipe = ClassificationPipeline(n_feats=x.shape[1], clfmethod='LinearSVC',
+                                  cvmethod='4')
+    results, _ = pipe.cross_validation(x, y)
+
+    shared = ClassificationPipeline(n_feats=x.shape[1], clfmethod='LinearSVC',
+                                    cvmethod='4')
+    plan_results, _ = shared.cross_validation(None, None, plan=plan)
+    shared.cross_validation(None, None, plan=plan)
+
+    assert(plan.n_fits == 4)
+    for fold in results.predictions:
+        np.testing.assert_array_equal(plan_results.predictions[fold],
+                                      results.predictions[fold])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import scipy.stats as stats
+
+from darwin.distance import (bhattacharyya_dist, welch_ttest,
+                             pearson_correlation, DistanceMeasure,
+                             BhatacharyyaGaussianDistance)
+from darwin.pipeline import impute_nan_mean
+
+
+def make_data():
+    rng = np.random.RandomState(0)
+    x = rng.normal(size=(40, 30))
+    y = np.repeat([3, 7], 20)
+    x[y == 3, :5] += 2
+    return x, y
+
+
+@pytest.mark.parametrize('dist', [bhattacharyya_dist, welch_ttest])
+def test_distance_float32(dist):
+    x, y = make_data()
+    d64 = dist(x, y)
+    d32 = dist(x.astype(np.float32), y)
+    assert(d64.dtype == np.float64)
+    assert(d32.dtype == np.float32)
+    assert(np.allclose(d32, d64, rtol=1e-4, atol=1e-5))
+    #labels need not be 0 and 1
+    assert(d64[:5].min() > d64[5:].max())
+
+
+def test_impute_nan_mean_keeps_dtype():
+    x_train = np.array([[1, np.nan], [3, 4]], dtype=np.float32)
+    x_test = np.array([[np.nan, 1]], dtype=np.float32)
+    x_train, x_test = impute_nan_mean(x_train, x_test)
+    assert(x_train.dtype == np.float32 and x_test.dtype == np.float32)
+    assert(np.array_equal(x_train, [[1, 4], [3, 4]]))
+    assert(np.array_equal(x_test, [[2, 1]]))
+
+
+def test_pearson_correlation():
+    x, y = make_data()
+    expected = [stats.pearsonr(x[:, i], y)[0] for i in range(x.shape[1])]
+    assert(np.allclose(pearson_correlation(x, y), expected))
+
+
+def test_fit_in_blocks_memmap(tmpdir):
+    x, y = make_data()
+    path = str(tmpdir.join('x.dat'))
+    mm = np.memmap(path, dtype=np.float64, mode='w+', shape=x.shape)
+    mm[:] = x
+    mm.flush()
+    mm = np.memmap(path, dtype=np.float64, mode='r', shape=x.shape)
+
+    expected = BhatacharyyaGaussianDistance().fit(x, y).scores_
+    assert(np.allclose(BhatacharyyaGaussianDistance().fit(mm, y).scores_, expected))
+    assert(np.allclose(DistanceMeasure(bhattacharyya_dist).fit(x, y, block_size=7).scores_,
+                       expected))
+
+
+def test_fit_in_blocks_not_finite():
+    x, y = make_data()
+    x[3, 25] = np.nan
+    pytest.raises(ValueError, DistanceMeasure(welch_ttest).fit, x, y, block_size=10)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import numpy as np
+
+from darwin.distributed import (FileQueueBackend, FileQueueWorker,
+                                start_local_workers, _write_pickle)
+
+
+def test_task_claimed_once(tmpdir):
+    queue_dir = str(tmpdir)
+    FileQueueBackend(queue_dir)
+    _write_pickle({'job_id': 'job', 'fold': 0},
+                  os.path.join(queue_dir, 'tasks', 'job-00000.task'))
+
+    first = FileQueueWorker(queue_dir, worker_id='a')
+    second = FileQueueWorker(queue_dir, worker_id='b')
+
+    assert(first.claim().endswith('job-00000.task.a'))
+    assert(second.claim() is None)
+
+
+def test_result_of_removed_job_is_dropped(tmpdir):
+    queue_dir = str(tmpdir)
+    FileQueueBackend(queue_dir)
+    _write_pickle({'job_id': 'gone', 'fold': 0},
+                  os.path.join(queue_dir, 'tasks', 'gone-00000.task'))
+
+    worker = FileQueueWorker(queue_dir, worker_id='a')
+    worker.run_task(worker.claim())
+    assert(os.listdir(os.path.join(queue_dir, 'results')) == [])
+    assert(os.listdir(os.path.join(queue_dir, 'claimed')) == [])
+
+
+def test_heartbeat_touches_the_claimed_task(tmpdir):
+    import threading
+
+    path = str(tmpdir.join('job-00000.task.a'))
+    open(path, 'w').close()
+    os.utime(path, (0, 0))
+
+    worker = FileQueueWorker(str(tmpdir), worker_id='a', heartbeat_interval=0.01)
+    done = threading.Event()
+    heartbeat = threading.Thread(target=worker._heartbeat, args=(path, done))
+    heartbeat.start()
+    time.sleep(0.1)
+    done.set()
+    heartbeat.join()
+    assert(os.path.getmtime(path) > 0)
+
+
+def test_cross_validation_with_local_workers(tmpdir):
+    from sklearn import datasets
+    from darwin.pipeline import ClassificationPipeline
+
+    x, y = datasets.make_gaussian_quantiles(n_samples=60, n_features=10,
+                                            n_classes=2, random_state=1)
+
+    local = ClassificationPipeline(n_feats=x.shape[1], clfmethod='LinearSVC',
+                                   cvmethod='3')
+    local_results, _ = local.cross_validation(x, y)
+
+    queue_dir = str(tmpdir)
+    workers = start_local_workers(queue_dir, 2, poll_interval=0.05)
+    try:
+        backend = FileQueueBackend(queue_dir, poll_interval=0.05, timeout=300)
+        remote = ClassificationPipeline(n_feats=x.shape[1],
+                                        clfmethod='LinearSVC', cvmethod='3',
+                                        backend=backend)
+        results, _ = remote.cross_validation(x, y)
+    finally:
+        for proc in workers:
+            proc.terminate()
+
+    assert(results.profile.n_folds == 3)
+    for fold in local_results.predictions:
+        np.testing.assert_array_equal(results.predictions[fold],
+                                      local_results.predictions[fold])
+    assert(os.listdir(os.path.join(queue_dir, 'jobs')) == [])
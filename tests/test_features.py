@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import scipy.stats as stats
+
+from darwin.features import calculate_stats, calculate_hist3d
+
+
+def scipy_stats(data):
+    return np.array([data.max(axis=1), data.min(axis=1), data.mean(axis=1),
+                     data.var(axis=1), np.median(data, axis=1),
+                     stats.kurtosis(data, axis=1), stats.skew(data, axis=1)]).T
+
+
+class TestCalculateStats(object):
+
+    def test_stats(self):
+        rng = np.random.RandomState(0)
+        for n_feats in (101, 100):
+            data = rng.gamma(2., size=(13, n_feats))
+            feats = calculate_stats(data, chunk_rows=4)
+            assert(np.allclose(feats, scipy_stats(data)))
+
+    def test_stats_parallel(self):
+        data = np.random.RandomState(0).normal(size=(20, 50))
+        assert(np.allclose(calculate_stats(data, n_jobs=2, chunk_rows=3),
+                           calculate_stats(data)))
+
+    def test_stats_constant_rows(self):
+        data = np.ones((3, 10))
+        feats = calculate_stats(data)
+        assert(np.allclose(feats[:, 5], -3))
+        assert(np.allclose(feats[:, 6], 0))
+
+    def test_stats_memmap(self, tmpdir):
+        data = np.random.RandomState(0).normal(size=(10, 30)).astype(np.float32)
+        path = str(tmpdir.join('data.dat'))
+        mm = np.memmap(path, dtype=np.float32, mode='w+', shape=data.shape)
+        mm[:] = data
+        mm.flush()
+
+        mm = np.memmap(path, dtype=np.float32, mode='r', shape=data.shape)
+        assert(np.allclose(calculate_stats(mm, chunk_rows=3),
+                           scipy_stats(data.astype(np.float64))))
+
+
+class TestCalculateHist3d(object):
+
+    def test_hist3d(self):
+        data = np.random.RandomState(0).normal(size=(7, 3 * 200))
+        feats = calculate_hist3d(data, 4, chunk_rows=3)
+        assert(feats.shape == (7, 4 ** 3))
+        for s in range(data.shape[0]):
+            h, edges = np.histogramdd(data[s].reshape(-1, 3), bins=(4, 4, 4))
+            assert(np.allclose(feats[s], h.flatten()))
+
+    def test_hist3d_sparse_range(self):
+        data = np.random.RandomState(0).uniform(size=(5, 3 * 50))
+        value_range = [(0, 1)] * 3
+        dense = calculate_hist3d(data, 8, value_range=value_range)
+        sparse = calculate_hist3d(data, 8, value_range=value_range,
+                                  sparse=True, n_jobs=2, chunk_rows=2)
+        assert(np.allclose(sparse.toarray(), dense))
+        assert(np.allclose(dense.sum(axis=1), 50))
+
+    def test_hist3d_empty_range(self):
+        data = np.random.RandomState(0).uniform(size=(2, 3 * 3))
+        data[:, 1::3] = .5
+        value_range = [(0, 1), (.5, .5), (0, 1)]
+        feats = calculate_hist3d(data, 4, value_range=value_range)
+        for s in range(data.shape[0]):
+            h, edges = np.histogramdd(data[s].reshape(-1, 3), bins=4,
+                                      range=value_range)
+            assert(np.allclose(feats[s], h.flatten()))
+        assert(np.allclose(feats.sum(axis=1), 3))
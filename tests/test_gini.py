@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn import datasets
+
+from darwin.gini import FeaturesGiniIndex
+
+
+def make_dataset():
+    x, y = datasets.make_classification(n_samples=60, n_features=10,
+                                        n_informative=3, n_redundant=0,
+                                        shuffle=False, random_state=0)
+    return x, y
+
+
+class TestFeaturesGiniIndex(object):
+
+    def test_oob_mode(self):
+        x, y = make_dataset()
+        gini = FeaturesGiniIndex(mode='oob', n_estimators=50, random_state=0)
+        imps = gini.fit_transform(x, y)
+        assert(imps.shape == (x.shape[1], ))
+        assert(np.allclose(imps.sum(), 1.))
+        assert(gini.importances_std_.shape == imps.shape)
+        assert(0 <= gini.oob_score_ <= 1)
+        assert(gini.permutation_importances_ is None)
+
+    def test_oob_mode_permutation(self):
+        x, y = make_dataset()
+        gini = FeaturesGiniIndex(mode='oob', n_estimators=30,
+                                 permutation=True, random_state=0)
+        gini.fit_transform(x, y)
+        perm = gini.permutation_importances_
+        assert(perm.shape == (x.shape[1], ))
+        #the informative features are the first ones
+        assert(perm[:3].mean() > perm[3:].mean())
+
+    def test_unknown_mode(self):
+        x, y = make_dataset()
+        pytest.raises(ValueError, FeaturesGiniIndex(mode='bad').fit_transform, x, y)
+
+    def test_oob_indices_match_the_forest(self):
+        from sklearn.ensemble import ExtraTreesClassifier
+        from darwin.gini import _oob_indices
+
+        x, y = make_dataset()
+        forest = ExtraTreesClassifier(n_estimators=10, bootstrap=True,
+                                      oob_score=True, random_state=0).fit(x, y)
+        #a sample is out-of-bag in the forest if it is for some tree
+        oob = np.zeros(len(y), dtype=bool)
+        for tree in forest.estimators_:
+            oob[_oob_indices(tree, len(y),
+                             getattr(forest, 'max_samples', None))] = True
+        assert(np.array_equal(oob, ~np.isnan(forest.oob_decision_function_[:, 0])))
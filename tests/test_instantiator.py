@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import os
 import os.path as op
 import sys
 import pytest
@@ -70,3 +71,60 @@ class TestSelectorInstantiator(object):
         selin = instance.SelectorInstantiator()
         selin.method_name = 'SelectPercentile'
         assert(hasattr(selin.default_params['score_func'], '__call__'))
+
+
+class TestInstantiatorCache(object):
+
+    def test_yaml_parsed_once(self):
+        instance.clear_cache()
+        inst1 = instance.LearnerInstantiator()
+        inst2 = instance.LearnerInstantiator()
+        assert(inst1.yamldata is inst2.yamldata)
+
+    def test_import_this_cached(self):
+        cls1 = instance.import_this('collections.OrderedDict')
+        cls2 = instance.import_this('collections.OrderedDict')
+        assert(cls1 is cls2)
+
+    def test_method_instances_are_fresh_clones(self):
+        inst = instance.SelectorInstantiator()
+        sel1 = inst.get_method_instance('RFE')
+        sel2 = inst.get_method_instance('RFE')
+        assert(sel1 is not sel2)
+        assert(sel1.estimator is not sel2.estimator)
+        assert(type(sel1) == type(sel2))
+
+    def test_default_params_not_modified(self):
+        inst = instance.SelectorInstantiator()
+        inst.get_default_params('RFE')
+        assert(isinstance(inst.get_yaml_item('RFE')['default']['estimator'], dict))
+
+    def test_yaml_snapshot(self, tmpdir, monkeypatch):
+        ymlpath = str(tmpdir.join('methods.yml'))
+        with open(ymlpath, 'w') as f:
+            f.write('LinearSVC:\n    class: sklearn.svm.LinearSVC\n')
+        snapshot_dir = str(tmpdir.join('cache'))
+
+        #no snapshots by default
+        instance.clear_cache()
+        data = instance.load_yaml_file(ymlpath)
+        assert(not [f for f in os.listdir(str(tmpdir)) if f.endswith('.pkl')])
+
+        instance.clear_cache()
+        assert(instance.load_yaml_file(ymlpath, snapshot_dir) == data)
+        snapshots = [f for f in os.listdir(snapshot_dir) if f.endswith('.pkl')]
+        assert(len(snapshots) == 1)
+
+        #the second load reads the snapshot, the YAML is not parsed again
+        def fail(*args, **kwargs):
+            raise AssertionError('YAML parsed again')
+        monkeypatch.setattr(instance.yaml, 'load', fail)
+        instance.clear_cache()
+        assert(instance.load_yaml_file(ymlpath, snapshot_dir) == data)
+
+    def test_yaml_invalid_spec(self, tmpdir):
+        ymlpath = str(tmpdir.join('methods.yml'))
+        with open(ymlpath, 'w') as f:
+            f.write('LinearSVC:\n    default: 1\n')
+
+        pytest.raises(ValueError, instance.load_yaml_file, ymlpath)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import os.path as op
+import sys
+import json
+import subprocess
+
+import pytest
+
+CWD = op.dirname(op.realpath(__file__))
+REPO_DIR = op.join(CWD, '..')
+
+
+def loaded_modules(module, candidates):
+    code = ('import sys, json\n'
+            'import {}\n'
+            'print(json.dumps([m for m in {!r} if m in sys.modules]))').format(module, candidates)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=REPO_DIR)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('module, not_loaded', [
+    ('darwin.gini', ['matplotlib', 'darwin.pipeline', 'sklearn.ensemble']),
+    ('darwin.data_io', ['nibabel']),
+    ('darwin.plot', ['matplotlib']),
+    ('darwin.pipeline', ['sklearn.grid_search', 'sklearn.svm']),
+])
+def test_lazy_imports(module, not_loaded):
+    assert(loaded_modules(module, not_loaded) == [])
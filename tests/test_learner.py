@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import types
+import numpy as np
+from sklearn import datasets
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from darwin.learner import Learner
+
+
+def make_learner():
+    x, y = datasets.make_classification(n_samples=50, n_features=8,
+                                        random_state=0)
+    scaler = StandardScaler().fit(x)
+    model = LogisticRegression().fit(scaler.transform(x), y)
+    return Learner(model, scaler=scaler), x
+
+
+class TestLearnerPrediction(object):
+
+    def test_predict_stream(self):
+        learner, x = make_learner()
+        expected = learner.model.predict(learner.scaler.transform(x))
+
+        preds = learner.predict_stream(iter(x), batch_size=7)
+        assert(isinstance(preds, types.GeneratorType))
+        assert(np.array_equal(np.array(list(preds)), expected))
+        assert(np.array_equal(learner.predict(x, batch_size=7, n_io_threads=1),
+                              expected))
+
+    def test_predict_proba_stream(self):
+        learner, x = make_learner()
+        expected = learner.model.predict_proba(learner.scaler.transform(x))
+        assert(np.allclose(learner.predict_proba(list(x), batch_size=4), expected))
+
+    def test_calibrated_predict_proba(self):
+        from sklearn.svm import SVC
+        from darwin.calibration import DecisionCalibrator
+
+        x, y = datasets.make_classification(n_samples=50, n_features=8,
+                                            random_state=0)
+        svc = SVC(kernel='rbf').fit(x, y)
+        calibrator = DecisionCalibrator().fit(svc.decision_function(x), y,
+                                              svc.classes_)
+        learner = Learner(svc, calibrator=calibrator)
+
+        probs = learner.predict_proba(x, batch_size=16)
+        assert(probs.shape == (len(x), 2))
+        assert(np.allclose(probs, calibrator.predict_proba(svc.decision_function(x))))
+
+    def test_masked_volumes(self):
+        learner, x = make_learner()
+        mask = np.zeros((2, 2, 3))
+        mask.flat[[0, 2, 3, 5, 6, 8, 9, 11]] = 1
+        learner.mask = mask
+
+        volumes = []
+        for row in x:
+            vol = np.zeros(mask.shape)
+            vol[mask > 0] = row
+            volumes.append(vol)
+
+        assert(np.array_equal(learner.predict(volumes, batch_size=16),
+                              learner.predict(x)))
+
+    def test_old_dumps(self, tmpdir):
+        learner, x = make_learner()
+
+        #Learners saved before the preprocessing steps did not have them
+        for name in ('_mask', 'scaler', 'selector', 'calibrator'):
+            del learner.__dict__[name]
+
+        for path in (str(tmpdir.join('old.dmp')), str(tmpdir.join('old.art'))):
+            if path.endswith('.dmp'):
+                learner.save(path)
+            else:
+                learner.save_artifact(path)
+            old = Learner.from_file(path)
+            assert(old.mask is None and old.scaler is None)
+            assert(np.array_equal(old.predict(x), old.model.predict(x)))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from sklearn.metrics import (precision_recall_fscore_support, roc_auc_score,
+                             confusion_matrix)
+
+from darwin.metrics import (multiclass_metrics, grouped_roc_auc,
+                            bootstrap_metrics, percentile_intervals)
+from darwin.results import classification_metrics
+
+
+def make_multiclass(n_samples=90, n_classes=3, seed=0):
+    rng = np.random.RandomState(seed)
+    truth = rng.randint(0, n_classes, n_samples)
+    probs = rng.dirichlet(np.ones(n_classes), n_samples)
+    probs[np.arange(n_samples), truth] += 0.3
+    probs /= probs.sum(axis=1)[:, np.newaxis]
+    preds = probs.argmax(axis=1)
+    return truth, preds, probs
+
+
+def test_per_class_metrics_match_sklearn():
+    truth, preds, probs = make_multiclass()
+    mets = multiclass_metrics(truth, preds, probs)
+
+    prec, rec, f1, _ = precision_recall_fscore_support(truth, preds)
+    np.testing.assert_allclose(mets.sensitivity[0], rec)
+    np.testing.assert_allclose(mets.precision[0], prec)
+    np.testing.assert_allclose(mets.f1_score[0], f1)
+    np.testing.assert_array_equal(mets.confusion[0],
+                                  confusion_matrix(truth, preds))
+
+    for c in range(3):
+        np.testing.assert_allclose(mets.area_under_curve[0, c],
+                                   roc_auc_score(truth == c, probs[:, c]))
+
+    cm = mets.confusion[0]
+    tn = cm.sum() - cm.sum(axis=0) - cm.sum(axis=1) + np.diag(cm)
+    np.testing.assert_allclose(mets.specificity[0], tn / (tn + cm.sum(axis=0) - np.diag(cm)).astype(float))
+
+
+def test_grouped_metrics_match_each_group():
+    truth, preds, probs = make_multiclass(n_samples=120)
+    groups = np.repeat(np.arange(4), 30)
+    mets = multiclass_metrics(truth, preds, probs, groups=groups)
+
+    for g in range(4):
+        sel = groups == g
+        single = multiclass_metrics(truth[sel], preds[sel], probs[sel],
+                                    labels=[0, 1, 2])
+        np.testing.assert_allclose(mets.macro()[g], single.macro()[0])
+        np.testing.assert_allclose(mets.micro()[g], single.micro()[0])
+
+
+def test_grouped_roc_auc_ties():
+    scores = np.array([0.1, 0.5, 0.5, 0.9, 0.2, 0.2, 0.8, 0.3])
+    positives = np.array([0, 1, 0, 1, 0, 1, 1, 0], dtype=bool)
+    groups = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+    auc = grouped_roc_auc(scores, positives, groups)
+    np.testing.assert_allclose(auc, [roc_auc_score(positives[:4], scores[:4]),
+                                     roc_auc_score(positives[4:], scores[4:])])
+
+    assert(np.isnan(grouped_roc_auc([0.1, 0.2], [True, True])[0]))
+
+
+def test_binary_classification_metrics():
+    rng = np.random.RandomState(0)
+    truth = rng.randint(0, 2, 50)
+    preds = np.where(rng.uniform(size=50) < 0.2, 1 - truth, truth)
+    p1 = rng.uniform(size=50)
+    probs = np.column_stack([1 - p1, p1])
+
+    acc, sens, spec, prec, f1, auc = classification_metrics(truth, preds, probs)
+    prec_c, rec_c, f1_c, _ = precision_recall_fscore_support(truth, preds)
+    np.testing.assert_allclose([sens, spec, prec, f1],
+                               [rec_c[1], rec_c[0], prec_c[1], f1_c[1]])
+    np.testing.assert_allclose(auc, roc_auc_score(truth, p1))
+
+    #without probabilities, the AUC of the hard predictions
+    auc = classification_metrics(truth, preds)[5]
+    np.testing.assert_allclose(auc, roc_auc_score(truth, preds))
+
+
+def test_bootstrap_metrics():
+    truth, preds, probs = make_multiclass(n_samples=60)
+
+    boots = bootstrap_metrics(truth, preds, probs, n_boot=300, random_state=0,
+                              chunk_size=70)
+    assert(boots.shape == (300, 6))
+    np.testing.assert_allclose(boots, bootstrap_metrics(truth, preds, probs,
+                                                        n_boot=300,
+                                                        random_state=0,
+                                                        chunk_size=70,
+                                                        n_jobs=2))
+
+    lower, upper = percentile_intervals(boots, alpha=0.1)
+    point = multiclass_metrics(truth, preds, probs).macro()[0]
+    assert(np.all(lower <= point) and np.all(point <= upper))
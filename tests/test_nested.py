@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from sklearn import datasets
+from sklearn.svm import SVC
+from sklearn.preprocessing import StandardScaler
+
+from darwin.nested import ClassStats, NestedCrossValidation
+from darwin.distance import welch_ttest, bhattacharyya_dist, pearson_correlation
+from darwin.pipeline import impute_nan_mean
+from darwin.sklearn_utils import get_cv_method
+
+
+def make_data(n_samples=60):
+    x, y = datasets.make_classification(n_samples=n_samples, n_features=10,
+                                        n_informative=4, random_state=0)
+    x += 50.
+    x[3, 2] = np.nan
+    x[30, 5] = np.nan
+    return x, y
+
+
+def test_downdate_matches_remaining_rows():
+    x, y = make_data()
+    classes = np.unique(y)
+    held = np.arange(10)
+
+    stats = ClassStats.from_rows(x, y, classes)
+    down = stats.downdate(x[held], y[held])
+    direct = ClassStats.from_rows(x[10:], y[10:], classes, stats.shift)
+
+    for attr in ('n_rows', 'counts', 'sums', 'squares'):
+        np.testing.assert_allclose(getattr(down, attr), getattr(direct, attr),
+                                   atol=1e-8)
+
+
+def test_preprocessing_and_scores_match_direct_computation():
+    x, y = make_data()
+    rest = np.arange(15, len(y))
+    stats = ClassStats.from_rows(x, y, np.unique(y)).downdate(x[:15], y[:15])
+
+    x_rest, _ = impute_nan_mean(x[rest].copy(), x[:1].copy())
+    scaler = StandardScaler().fit(x_rest)
+
+    means, center, scale = stats.preprocessing(StandardScaler())
+    np.testing.assert_allclose(center, scaler.mean_)
+    np.testing.assert_allclose(scale, scaler.std_)
+
+    np.testing.assert_allclose(stats.scores('welcht'),
+                               welch_ttest(x_rest, y[rest]), rtol=1e-6)
+    np.testing.assert_allclose(stats.scores('bhattacharyya'),
+                               bhattacharyya_dist(x_rest, y[rest]), rtol=1e-6)
+    np.testing.assert_allclose(stats.scores('pearson'),
+                               pearson_correlation(x_rest, y[rest]), rtol=1e-6)
+
+
+def test_inner_scores_match_explicit_refits():
+    x, y = make_data()
+    x = x[:, [0, 1, 3, 4]]
+    nested = NestedCrossValidation('RBFSVC', cvmethod='3', inner_cvmethod='3',
+                                   calibration=None, measure_memory=False)
+    res = nested.cross_validation(x, y)
+
+    train = list(res.result.cv)[0][0]
+    tr, te = list(get_cv_method(y[train], '3'))[0]
+    x_tr, x_te = x[train][tr], x[train][te]
+    scaler = StandardScaler().fit(x_tr)
+    for c, params in enumerate(res.grid[:4]):
+        svc = SVC(kernel='rbf', C=params['C'], gamma=params['gamma'],
+                  class_weight='auto').fit(scaler.transform(x_tr), y[train][tr])
+        acc = np.mean(svc.predict(scaler.transform(x_te)) == y[train][te])
+        assert(abs(res.inner_scores[0][0, c] - acc) < 1e-10)
+
+
+def test_nested_cross_validation_with_selection():
+    x, y = make_data()
+    nested = NestedCrossValidation('RBFSVC', prefs='welcht', prefs_thrs=[80, 95],
+                                   cvmethod='4', inner_cvmethod='3',
+                                   measure_memory=False)
+    res = nested.cross_validation(x, y)
+
+    assert(len(res.grid) == 2 * 25)
+    assert(res.result.profile.n_folds == 4)
+    assert(res.inner_profile.n_folds == 4 * 3)
+    assert(res.inner_scores[0].shape == (3, len(res.grid)))
+    assert('inner_loop' in res.result.profile.stage_seconds())
+    assert('downdate' in res.inner_profile.stage_seconds())
+    assert(all('prefs_thr' in p for p in res.result.best_parameters.values()))
+
+    #probabilities from the calibrated inner decision values
+    assert(res.result.probabilities is not None)
+    for probs in res.result.probabilities.values():
+        np.testing.assert_allclose(probs.sum(axis=1), 1)
+    assert(res.metrics[0].accuracy > 0.5)
+
+
+def test_outer_preprocessing_shares_the_gram_matrix():
+    x, y = make_data()
+    nested = NestedCrossValidation('RBFSVC', cvmethod='4', inner_cvmethod='3',
+                                   inner_preprocessing='outer',
+                                   measure_memory=False)
+    nested.cross_validation(x, y)
+    #one Gram matrix per outer fold, shared by its inner folds and refit
+    assert(nested.n_grams == 4)
+
+
+def test_parallel_folds_count_the_gram_matrices():
+    x, y = make_data()
+    nested = NestedCrossValidation('RBFSVC', cvmethod='4', inner_cvmethod='3',
+                                   inner_preprocessing='outer', n_jobs=2,
+                                   measure_memory=False)
+    nested.cross_validation(x, y)
+    assert(nested.n_grams == 4)
+
+
+def test_outer_fold_without_cross_validation():
+    x, y = make_data()
+    nested = NestedCrossValidation('RBFSVC', cvmethod='4', inner_cvmethod='3',
+                                   calibration=None, measure_memory=False)
+    train, test = np.arange(15, len(y)), np.arange(15)
+    result = nested.outer_fold(x, y, train, test, 0)
+    assert(len(result[1]) == len(test))
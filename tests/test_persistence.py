@@ -2,6 +2,8 @@
 import os
 import os.path as op
 import pytest
+import numpy as np
+from darwin.utils import persist
 from darwin.utils.persist import PersistenceMixin
 from darwin.utils.filenames import get_temp_file, file_size
 
@@ -52,3 +54,91 @@ class TestPersistence(object):
         if not op.exists(self.objdump_path):
             self.save_foo()
         pytest.raises(ValueError, Foo2Persist.from_file, self.objdump_path)
+
+
+class ArrayPersist(PersistenceMixin):
+
+    def __init__(self):
+        self.weights = np.arange(10000, dtype=np.float64)
+        self.nested = {'coefs': np.ones((100, 100))}
+
+
+class TestPersistenceMmap(object):
+
+    def test_persist_mmap_load(self, tmpdir):
+        objdump_path = str(tmpdir.join('arrays.dmp'))
+        obj = ArrayPersist()
+        obj.save(objdump_path)
+
+        obj2 = ArrayPersist.from_file(objdump_path, mmap_mode='r')
+        assert(isinstance(obj2.weights, np.memmap))
+        assert(isinstance(obj2.nested['coefs'], np.memmap))
+        assert(np.array_equal(obj2.weights, obj.weights))
+        pytest.raises(ValueError, obj2.weights.__setitem__, 0, 1.)
+
+    def test_persist_load_into(self, tmpdir):
+        objdump_path = str(tmpdir.join('arrays.dmp'))
+        ArrayPersist().save(objdump_path)
+
+        obj = ArrayPersist()
+        obj.weights = None
+        obj.load(objdump_path, mmap_mode='r')
+        assert(np.array_equal(obj.weights, np.arange(10000)))
+
+
+class TestPersistenceArtifact(object):
+
+    def test_artifact_lazy_load(self, tmpdir):
+        artifact_path = str(tmpdir.join('arrays.art'))
+        obj = ArrayPersist()
+        header = obj.save_artifact(artifact_path, compression='zlib')
+        assert(sorted(a['name'] for a in header['attributes']) == ['nested', 'weights'])
+
+        obj2 = ArrayPersist.from_file(artifact_path)
+        assert('weights' not in obj2.__dict__)
+        assert(np.array_equal(obj2.weights, obj.weights))
+        assert('weights' in obj2.__dict__)
+        assert('nested' not in obj2.__dict__)
+        assert(np.array_equal(obj2.nested['coefs'], obj.nested['coefs']))
+
+    def test_artifact_list_and_validate(self, tmpdir):
+        ArrayPersist().save_artifact(str(tmpdir.join('a.art')))
+        FooPersist().save(str(tmpdir.join('b.dmp')))
+        corrupted = str(tmpdir.join('c.art'))
+        ArrayPersist().save_artifact(corrupted, compression='zlib')
+
+        with open(corrupted, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b'0123456789')
+
+        paths = [p for p, h in persist.list_artifacts(str(tmpdir))]
+        assert([op.basename(p) for p in paths] == ['a.art', 'c.art'])
+
+        paths = [p for p, h in persist.list_artifacts(str(tmpdir), validate=True)]
+        assert([op.basename(p) for p in paths] == ['a.art'])
+        pytest.raises(ValueError, persist.validate_artifact, corrupted)
+
+    def test_artifact_different_object(self, tmpdir):
+        artifact_path = str(tmpdir.join('foo.art'))
+        FooPersist().save_artifact(artifact_path)
+        pytest.raises(ValueError, Foo2Persist.from_file, artifact_path)
+
+    def test_artifact_resave_as_joblib(self, tmpdir):
+        artifact_path = str(tmpdir.join('arrays.art'))
+        objdump_path = str(tmpdir.join('arrays.dmp'))
+        ArrayPersist().save_artifact(artifact_path)
+
+        ArrayPersist.from_file(artifact_path).save(objdump_path)
+        obj = ArrayPersist.from_file(objdump_path)
+        assert('_lazy_attributes' not in obj.__dict__)
+        assert(np.array_equal(obj.weights, np.arange(10000)))
+
+    def test_artifact_defaults_and_mmap_mode(self, tmpdir):
+        artifact_path = str(tmpdir.join('foo.art'))
+        FooPersist().save_artifact(artifact_path)
+
+        #mmap_mode is ignored for artifacts, sampler defaults to None as in
+        #old joblib dumps
+        obj = FooPersist.from_file(artifact_path, mmap_mode='r')
+        assert(obj.sampler is None)
+        assert(obj.anint == 100)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from darwin.profiling import (Profiler, ProfileCollector, StageRecord,
+                              current_memory)
+from darwin.pipeline import count_grid_points
+
+
+class RecordingCollector(ProfileCollector):
+
+    def __init__(self):
+        self.stages = []
+        self.folds = []
+        self.ended = False
+
+    def on_stage(self, record):
+        self.stages.append(record)
+
+    def on_fold_end(self, fold, seconds):
+        self.folds.append(fold)
+
+    def on_end(self, profile):
+        self.ended = True
+
+
+def test_profiler():
+    collector = RecordingCollector()
+    profiler = Profiler([collector], n_grid_points=6)
+    profiler.start()
+    for fold in range(3):
+        with profiler.fold(fold):
+            with profiler.stage(fold, 'fit'):
+                pass
+            with profiler.stage(fold, 'predict'):
+                pass
+    profile = profiler.end()
+
+    assert(collector.ended)
+    assert(collector.folds == [0, 1, 2])
+    assert([r.stage for r in collector.stages[:2]] == ['fit', 'predict'])
+    assert(isinstance(collector.stages[0], StageRecord))
+    assert(profile.n_folds == 3)
+    assert(list(profile.stage_seconds().keys()) == ['fit', 'predict'])
+    assert(profile.as_dict()['n_grid_points'] == 6)
+
+
+def test_profiler_collector_errors_ignored():
+    class Failing(ProfileCollector):
+        def on_stage(self, record):
+            raise RuntimeError
+
+    profiler = Profiler([Failing()], measure_memory=False)
+    profiler.start()
+    with profiler.stage(0, 'fit'):
+        pass
+    profile = profiler.end()
+    assert(profile.records[0].memory_delta is None)
+    assert(profile.peak_memory is None)
+
+
+def test_stage_memory_delta():
+    import numpy as np
+
+    profiler = Profiler()
+    profiler.start()
+    with profiler.stage(0, 'alloc'):
+        block = np.ones(2 ** 24)
+    profile = profiler.end()
+    del block
+
+    if current_memory() is not None:
+        #the 128 MB block is still alive at the end of the stage
+        assert(profile.records[0].memory_delta > 2 ** 26)
+        assert(profile.stage_memory_delta()['alloc'] > 2 ** 26)
+
+
+def test_count_grid_points():
+    assert(count_grid_points({'C': [1, 10], 'gamma': [1, 2, 3]}) == 6)
+    assert(count_grid_points([{'C': [1, 10]}, {'kernel': 'rbf'}]) == 3)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+import numpy as np
+
+from darwin.results import (CVResultTable, classification_metrics,
+                            enlist_cv_results_from_dict,
+                            get_cv_classification_metrics)
+
+
+def make_cv_results(n_folds=5, fold_size=12, seed=0):
+    rng = np.random.RandomState(seed)
+    truth, preds, probs = OrderedDict(), OrderedDict(), OrderedDict()
+    for fold in range(n_folds):
+        truth[fold] = rng.randint(0, 2, fold_size)
+        preds[fold] = np.where(rng.uniform(size=fold_size) < 0.3,
+                               1 - truth[fold], truth[fold])
+        p1 = rng.uniform(size=fold_size)
+        probs[fold] = np.column_stack([1 - p1, p1])
+    return truth, preds, probs
+
+
+def test_fold_metrics_match_per_fold_metrics():
+    truth, preds, probs = make_cv_results()
+    metrics = get_cv_classification_metrics(truth, preds, probs)
+
+    labels = np.unique(np.concatenate(list(truth.values())))
+    for fold in truth:
+        expected = classification_metrics(truth[fold], preds[fold],
+                                          probs[fold], labels)
+        np.testing.assert_allclose(metrics[fold], expected)
+
+
+def test_table_columns():
+    truth, preds, probs = make_cv_results(n_folds=3, fold_size=4)
+    tests = [np.arange(4) + 4 * i for i in range(3)]
+    table = CVResultTable.from_folds(truth, preds, probs, tests)
+
+    assert(len(table) == 12)
+    assert(table.n_folds == 3)
+    assert(list(table.fold_offsets) == [0, 4, 8, 12])
+    np.testing.assert_array_equal(table.sample_index, np.arange(12))
+    np.testing.assert_array_equal(table.truth[table.fold_slice(1)], truth[1])
+
+    d_truth, d_preds, d_probs = table.to_dicts()
+    np.testing.assert_array_equal(d_preds[2], preds[2])
+    np.testing.assert_array_equal(d_probs[0], probs[0])
+
+    cms = table.confusion_matrices()
+    assert(cms.shape == (3, 2, 2))
+    assert(cms.sum() == 12)
+
+
+def test_table_save_load(tmpdir):
+    truth, preds, probs = make_cv_results()
+    table = CVResultTable.from_folds(truth, preds, probs)
+
+    filepath = str(tmpdir.join('results.npz'))
+    table.save(filepath, compress=True)
+    loaded = CVResultTable.load(filepath)
+
+    np.testing.assert_array_equal(loaded.fold_offsets, table.fold_offsets)
+    np.testing.assert_array_equal(loaded.probability, table.probability)
+    assert(loaded.sample_index is None)
+    np.testing.assert_allclose(loaded.fold_metrics(), table.fold_metrics())
+
+
+def test_enlist_loo_results():
+    truth, preds, probs = make_cv_results(n_folds=20, fold_size=1)
+    targets, predictions, probabilities, labels = \
+        enlist_cv_results_from_dict(truth, preds, probs)
+
+    assert(isinstance(targets, np.ndarray))
+    assert(targets.shape == (20,))
+    assert(probabilities.shape == (20, 2))
+    np.testing.assert_array_equal(predictions,
+                                  [preds[f][0] for f in preds])
+    np.testing.assert_array_equal(labels, [0, 1])
+
+    table = CVResultTable.from_folds(targets, predictions, probabilities)
+    assert(table.n_folds == 20)
+
+
+def test_enlist_kfold_results():
+    truth, preds, probs = make_cv_results(n_folds=3, fold_size=4)
+    targets, predictions, probabilities, labels = \
+        enlist_cv_results_from_dict(truth, preds, None)
+
+    assert(len(targets) == 3)
+    assert(probabilities is None)
+    np.testing.assert_array_equal(targets[1], truth[1])
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import asyncio
+
+import numpy as np
+from sklearn import datasets
+from sklearn.linear_model import LogisticRegression
+
+from darwin.learner import Learner
+from darwin.server import ModelServer
+
+
+async def post(port, path, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(request).encode('utf-8')
+    writer.write('POST {} HTTP/1.1\r\nContent-Length: {}\r\n'
+                 'Connection: close\r\n\r\n'.format(path, len(body)).encode('latin-1'))
+    writer.write(body)
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload.decode('utf-8'))
+
+
+def test_server_batches_requests():
+    x, y = datasets.make_classification(n_samples=40, n_features=5,
+                                        random_state=0)
+    learner = Learner(LogisticRegression().fit(x, y))
+
+    async def run():
+        server = ModelServer({'logreg': learner}, max_latency=0.05)
+        await server.start()
+        port = server.sockets[0].getsockname()[1]
+        try:
+            #a wrong feature width is rejected before reaching the batches
+            bad = await post(port, '/models/logreg/predict',
+                             {'samples': [[1., 2.]]})
+            responses = await asyncio.gather(*[post(port, '/models/logreg/predict',
+                                                    {'samples': [list(row)]})
+                                               for row in x])
+            status, probs = await post(port, '/models/logreg/predict_proba',
+                                       {'samples': x[:3].tolist()})
+            not_found = await post(port, '/models/other/predict', {})
+        finally:
+            await server.stop()
+        return server, bad, responses, probs, not_found
+
+    loop = asyncio.new_event_loop()
+    try:
+        server, bad, responses, probs, not_found = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert(bad[0] == 400)
+    preds = [resp['predictions'][0] for status, resp in responses]
+    assert(all(status == 200 for status, resp in responses))
+    assert(np.array_equal(preds, learner.model.predict(x)))
+    assert(np.allclose(probs['probabilities'], learner.model.predict_proba(x[:3])))
+    assert(not_found[0] == 404)
+
+    stats = server.stats()['logreg']
+    assert(stats['latency']['count'] == len(x) + 1)
+    assert(stats['n_batches'] < len(x))
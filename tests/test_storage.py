@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from darwin.storage import (save_feature_set, load_feature_set,
+                            load_feature_set_variable,
+                            read_feature_set_manifest)
+
+
+class TestFeatureSetStore(object):
+
+    def test_save_load(self, tmpdir):
+        feats = np.arange(7 * 11, dtype=float).reshape(7, 11)
+        labels = np.array([0, 1, 0, 1, 1, 0, 0])
+        path = str(tmpdir.join('fset'))
+        save_feature_set(path, feats, {'labels': labels}, chunks=(3, 4))
+
+        manifest = read_feature_set_manifest(path)
+        assert(manifest['shape'] == [7, 11])
+        assert(np.array_equal(load_feature_set(path), feats))
+        assert(np.array_equal(load_feature_set_variable(path, 'labels'), labels))
+
+    @pytest.mark.parametrize('compression', [None, 'zlib'])
+    def test_load_subset(self, tmpdir, compression):
+        feats = np.random.RandomState(0).normal(size=(10, 13)).astype(np.float32)
+        path = str(tmpdir.join('fset'))
+        save_feature_set(path, feats, chunks=(4, 5), compression=compression)
+
+        rows = [9, 0, 4]
+        cols = slice(3, 12, 2)
+        sub = load_feature_set(path, rows=rows, cols=cols)
+        assert(sub.dtype == np.float32)
+        assert(np.array_equal(sub, feats[rows][:, cols]))
+
+    def test_not_a_feature_set(self, tmpdir):
+        pytest.raises(ValueError, load_feature_set, str(tmpdir))
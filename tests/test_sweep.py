@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import csv
+
+import numpy as np
+from sklearn import datasets
+
+from darwin.sweep import SweepRunner, write_sweep_table
+
+
+def test_sweep_runner(tmpdir):
+    x, y = datasets.make_classification(n_samples=60, n_features=30,
+                                        n_informative=5, random_state=0)
+
+    runner = SweepRunner({'data': (x, y)}, ['pearson', 'welcht'], [50, 90],
+                         ['LinearSVC'], cvmethod='3',
+                         priorities={'LinearSVC': 1})
+    results = runner.run()
+
+    assert(list(results.keys()) == ['data'])
+    assert(len(results['data']) == 4)
+    #feature scores computed once per fsmethod and shared by the thresholds
+    assert(len(runner._scores) == 2)
+    assert(len(runner._plans) == 1)
+    assert(runner._plans['data'].n_fits == 3)
+
+    res = results['data'][0]
+    assert(np.asarray(res.metrics).shape == (3, 6))
+    assert(len(res.n_selected) == 3)
+    assert(res.result.profile.n_folds == 3)
+
+    table = str(tmpdir.join('sweep.csv'))
+    write_sweep_table(results, table)
+    with open(table) as f:
+        rows = list(csv.reader(f))
+    assert(len(rows) == 5)
+    assert(rows[0][:4] == ['subjsf', 'prefs', 'prefs_thr', 'cl'])
+
+
+def test_sweep_scores_impute_nans():
+    from darwin.distance import welch_ttest
+    from darwin.pipeline import impute_nan_mean
+
+    x, y = datasets.make_classification(n_samples=40, n_features=10,
+                                        random_state=0)
+    x[0, 1] = np.nan
+    x[25, 3] = np.nan
+
+    runner = SweepRunner({'data': (x, y)}, ['welcht'], [90], ['LinearSVC'],
+                         cvmethod='3')
+    for scores, (train, test) in zip(runner.scores('data', 'welcht'),
+                                     runner.folds('data')):
+        x_train, _ = impute_nan_mean(x[train], x[test])
+        np.testing.assert_allclose(scores, welch_ttest(x_train, y[train]))
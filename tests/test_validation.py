@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from darwin import validation
+from darwin.validation import check_array
+
+
+class TestCheckArray(object):
+
+    def test_not_finite(self):
+        x = np.ones((5, 4))
+        x[3, 2] = np.inf
+        pytest.raises(ValueError, check_array, x)
+
+    def test_chunked_finite_check(self, monkeypatch):
+        monkeypatch.setattr(validation, 'FINITE_CHECK_CHUNK', 7)
+        x = np.ones((50, 3))
+        x[41, 1] = np.nan
+        pytest.raises(ValueError, check_array, x)
+
+    def test_no_copy(self):
+        x = np.ones((5, 4))
+        assert(check_array(x) is x)
+
+    def test_validated_cache(self):
+        x = np.ones((5, 4))
+        x.flags.writeable = False
+        check_array(x)
+        assert(validation._is_validated(x, None))
+
+        #a different dtype conversion is checked again
+        assert(not validation._is_validated(x, np.float32))
+
+        #and so is the array once it can be modified
+        x.flags.writeable = True
+        assert(not validation._is_validated(x, None))
+
+    def test_writeable_arrays_are_checked_again(self):
+        x = np.ones((5, 4))
+        check_array(x)
+        assert(not validation._is_validated(x, None))
+
+        x[0, 0] = np.nan
+        pytest.raises(ValueError, check_array, x)
+
+        #a read-only view of a writeable array is not cached either
+        view = x[1:]
+        view.flags.writeable = False
+        check_array(view)
+        assert(not validation._is_validated(view, None))
+
+    def test_validated_cache_released(self):
+        x = np.ones((5, 4))
+        x.flags.writeable = False
+        check_array(x)
+        key = id(x)
+        assert(key in validation._validated_arrays)
+        del x
+        assert(key not in validation._validated_arrays)